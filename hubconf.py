@@ -1,4 +1,9 @@
 from s3prl import hub
 
-for _option in hub.options():
-    globals()[_option] = getattr(hub, _option)
+
+def __getattr__(name: str):
+    return getattr(hub, name)
+
+
+def __dir__():
+    return hub.options()
@@ -1,34 +1,67 @@
+from typing import List
+
 import numpy as np
 import torch
-from torch.nn.utils.rnn import pad_sequence
 
 __all__ = [
     "default_collate_fn",
+    "padded_collate_fn",
 ]
 
 
-def default_collate_fn(samples, padding_value: int = 0):
+def _pad(
+    values: List[torch.Tensor],
+    padding_value: int,
+    dtype: torch.dtype,
+    pin_memory: bool,
+) -> torch.Tensor:
     """
-    Each item in **DynamicItemDataset** is a dict
-    This function pad (or transform into numpy list) a batch of dict
+    Allocate the padded batch once and copy each sample into it, converting the dtype
+    during the copy
+    """
+    max_len = max(len(value) for value in values)
+    padded = torch.empty(
+        (len(values), max_len, *values[0].shape[1:]),
+        dtype=dtype,
+        pin_memory=pin_memory,
+    )
+    for idx, value in enumerate(values):
+        padded[idx, : len(value)].copy_(value)
+        padded[idx, len(value) :].fill_(padding_value)
+    return padded
 
-    Args:
-        samples (List[dict]): Suppose each Container is in
 
-            .. code-block:: yaml
+def padded_collate_fn(
+    samples,
+    padding_value: int = 0,
+    pin_memory: bool = False,
+    half_keys: List[str] = None,
+    return_lens: bool = False,
+):
+    """
+    The same as :obj:`default_collate_fn`, but can also pin the padded batches and
+    return the valid lengths. Use :code:`functools.partial` to set the options for
+    the DataLoader
 
-                wav: a single waveform
-                label: a single string
+    Args:
+        samples (List[dict]): the items from the dataset
+        padding_value (int): the value to pad the sequences
+        pin_memory (bool): allocate the padded batches in the page-locked memory, so
+            :code:`tensor.to(device, non_blocking=True)` is asynchronous. Only takes
+            effect when CUDA is available, and only when collating in the main process
+            (:code:`num_workers=0`), since the batches from the workers are moved
+            through the shared memory. Otherwise use :code:`DataLoader(pin_memory=True)`
+        half_keys (List[str]): the keys of the floating sequences (e.g. the audio) to
+            emit in fp16
+        return_lens (bool): for each padded key, also return :code:`{key}_len` in
+            LongTensor if the samples do not have it already
 
     Return:
         dict
-
-        .. code-block:: yaml
-
-            wav: padded waveforms
-            label: np.array([a list of string labels])
     """
     assert isinstance(samples[0], dict)
+    pin_memory = pin_memory and torch.cuda.is_available()
+    half_keys = half_keys or []
     keys = samples[0].keys()
     padded_samples = dict()
     for key in keys:
@@ -37,12 +70,46 @@ def default_collate_fn(samples, padding_value: int = 0):
             values = torch.LongTensor(values)
         elif isinstance(values[0], float):
             values = torch.FloatTensor(values)
-        elif isinstance(values[0], np.ndarray):
-            values = [torch.from_numpy(value).float() for value in values]
-            values = pad_sequence(values, batch_first=True, padding_value=padding_value)
-        elif isinstance(values[0], torch.Tensor):
-            values = pad_sequence(values, batch_first=True, padding_value=padding_value)
+        elif isinstance(values[0], (np.ndarray, torch.Tensor)):
+            if isinstance(values[0], np.ndarray):
+                values = [torch.from_numpy(value) for value in values]
+                dtype = torch.float
+            else:
+                dtype = values[0].dtype
+
+            if key in half_keys and dtype.is_floating_point:
+                dtype = torch.half
+
+            if return_lens and f"{key}_len" not in keys:
+                padded_samples[f"{key}_len"] = torch.LongTensor(
+                    [len(value) for value in values]
+                )
+            values = _pad(values, padding_value, dtype, pin_memory)
         else:
             values = np.array(values, dtype="object")
         padded_samples[key] = values
     return padded_samples
+
+
+def default_collate_fn(samples, padding_value: int = 0):
+    """
+    Each item in **DynamicItemDataset** is a dict
+    This function pad (or transform into numpy list) a batch of dict
+
+    Args:
+        samples (List[dict]): Suppose each Container is in
+
+            .. code-block:: yaml
+
+                wav: a single waveform
+                label: a single string
+
+    Return:
+        dict
+
+        .. code-block:: yaml
+
+            wav: padded waveforms
+            label: np.array([a list of string labels])
+    """
+    return padded_collate_fn(samples, padding_value)
@@ -13,11 +13,10 @@ from collections import defaultdict
 from pathlib import Path
 from typing import Any, Dict, List
 
-from joblib import Parallel, delayed
-
 from s3prl.util.download import _urls_to_filepaths
 
 from .base import Corpus
+from .librispeech import index_flac_dir
 
 LIBRILIGHT_SPLITS = [
     "10h",
@@ -39,18 +38,6 @@ __all__ = [
 ]
 
 
-def read_text(file: Path) -> str:
-    src_file = "-".join(str(file).split("-")[:-1]) + ".trans.txt"
-    idx = file.stem.replace(".flac", "")
-
-    with open(src_file, "r") as fp:
-        for line in fp:
-            if idx == line.split(" ")[0]:
-                return line[:-1].split(" ", 1)[1]
-
-    logging.warning(f"Transcription of {file} not found!")
-
-
 def check_no_repeat(splits: List[str]) -> bool:
     count = defaultdict(int)
     for split in splits:
@@ -146,19 +133,12 @@ class LibriLight(Corpus):
                 )
                 continue
 
-            wav_list = list(Path(split_dir).rglob("*.flac"))
-            name_list = [file.stem.replace(".flac", "") for file in wav_list]
-            text_list = Parallel(n_jobs=n_jobs)(
-                delayed(read_text)(file) for file in wav_list
-            )
-            spkr_list = [int(name.split("-")[0]) for name in name_list]
-
-            for wav_id in range(len(wav_list)):
-                wav = Path(wav_list[wav_id])
-                data_dict[wav.stem] = {
-                    "wav_path": str(wav.resolve()),
-                    "transcription": text_list[wav_id],
-                    "speaker": spkr_list[wav_id],
-                    "gender": spkr2gender[spkr_list[wav_id]],
+            for name, wav, text in index_flac_dir(Path(split_dir).resolve()):
+                spkr = int(name.split("-")[0])
+                data_dict[name] = {
+                    "wav_path": str(wav),
+                    "transcription": text,
+                    "speaker": spkr,
+                    "gender": spkr2gender[spkr],
                 }
         return data_dict
@@ -10,9 +10,9 @@ import os
 import re
 from collections import OrderedDict, defaultdict
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
-from joblib import Parallel, delayed
+from s3prl.util.corpus_index import cached_index
 
 from .base import Corpus
 
@@ -45,6 +45,56 @@ def read_text(file: Path) -> str:
     logger.warning(f"Transcription of {file} not found!")
 
 
+def _read_transcripts(trans_file: str) -> Dict[str, str]:
+    texts = {}
+    with open(trans_file, "r") as fp:
+        for line in fp:
+            idx, _, text = line.rstrip("\n").partition(" ")
+            texts[idx] = text
+    return texts
+
+
+def _index_flac_dir(root: str) -> List[Tuple[str, str, str]]:
+    """
+    Walk the LibriSpeech-style directory once, and parse each chapter's
+    :code:`.trans.txt` once
+
+    Returns:
+        List[Tuple[str, str, str]]
+
+        (name, flac path relative to the root, transcription), sorted by the name
+    """
+    wavs, texts = {}, {}
+    for dirpath, _, filenames in os.walk(root, followlinks=True):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith(".trans.txt"):
+                texts.update(_read_transcripts(path))
+            elif filename.endswith(".flac"):
+                wavs[filename[: -len(".flac")]] = os.path.relpath(path, root)
+
+    index = []
+    for name in sorted(wavs.keys()):
+        if name not in texts:
+            logger.warning(f"Transcription of {wavs[name]} not found!")
+        index.append((name, wavs[name], texts.get(name)))
+    return index
+
+
+def index_flac_dir(root: str) -> List[Tuple[str, Path, str]]:
+    """
+    The cached (by :obj:`s3prl.util.corpus_index.cached_index`) index of the flac
+    files and their transcriptions under the LibriSpeech-style directory
+
+    Returns:
+        List[Tuple[str, Path, str]]
+
+        (name, flac path, transcription), sorted by the name
+    """
+    index = cached_index("librispeech", root, lambda: _index_flac_dir(root))
+    return [(name, Path(root) / path, text) for name, path, text in index]
+
+
 def check_no_repeat(splits: List[str]) -> bool:
     count = defaultdict(int)
     for split in splits:
@@ -91,7 +141,7 @@ class LibriSpeech(Corpus):
 
     Args:
         dataset_root (str): Path to LibriSpeech corpus directory.
-        n_jobs (int, optional): Number of jobs. Defaults to 4.
+        n_jobs (int, optional): Not used. The splits are indexed by a single directory walk.
         train_split (List[str], optional): Training splits. Defaults to ["train-clean-100"].
         valid_split (List[str], optional): Validation splits. Defaults to ["dev-clean"].
         test_split (List[str], optional): Testing splits. Defaults to ["test-clean"].
@@ -164,22 +214,9 @@ class LibriSpeech(Corpus):
                 logger.info(f"Split {split} is not downloaded. Skip data collection.")
                 continue
 
-            wav_list = list(Path(split_dir).rglob("*.flac"))
-            name_list = [file.stem.replace(".flac", "") for file in wav_list]
-            text_list = Parallel(n_jobs=n_jobs)(
-                delayed(read_text)(file) for file in wav_list
-            )
+            name_list, wav_list, text_list = zip(*index_flac_dir(split_dir))
             spkr_list = [int(name.split("-")[0]) for name in name_list]
 
-            wav_list, name_list, text_list, spkr_list = zip(
-                *[
-                    (wav, name, text, spkr)
-                    for (wav, name, text, spkr) in sorted(
-                        zip(wav_list, name_list, text_list, spkr_list),
-                        key=lambda x: x[1],
-                    )
-                ]
-            )
             data_dict[split] = {
                 "name_list": list(name_list),
                 "wav_list": list(wav_list),
@@ -6,10 +6,12 @@ Authors:
 """
 
 import logging
+import os
 from pathlib import Path
 
 from tqdm import tqdm
 
+from s3prl.util.corpus_index import cached_index
 from s3prl.util.download import _download
 
 from .base import Corpus
@@ -22,6 +24,22 @@ __all__ = [
 ]
 
 
+def _index_wav_dir(root: str) -> set:
+    wavs = set()
+    for dirpath, _, filenames in os.walk(root, followlinks=True):
+        relpath = os.path.relpath(dirpath, root)
+        for filename in filenames:
+            if filename.endswith(".wav"):
+                wavs.add(os.path.normpath(os.path.join(relpath, filename)))
+    return wavs
+
+
+def _find_wav(wav_dir: Path, wavs: set, path: str) -> str:
+    if os.path.normpath(path) not in wavs:
+        raise FileNotFoundError(f"{path} is not found in {wav_dir}")
+    return str(wav_dir / path)
+
+
 class VoxCeleb1SV(Corpus):
     def __init__(
         self, dataset_root: str, download_dir: str, force_download: bool = True
@@ -70,20 +88,23 @@ class VoxCeleb1SV(Corpus):
         usage_list = list(set(usage_list).difference(set(test_list)))
         test_list = [item.split(" ")[1] for item in test_list]
 
-        logging.info("search specified wav name for each split")
-        speakerids = []
+        logging.info("index the wavs of each split")
+        dev_dir, test_dir = dataset_root / "dev" / "wav", dataset_root / "test" / "wav"
+        dev_wavs = cached_index("voxceleb1", dev_dir, lambda: _index_wav_dir(dev_dir))
+        test_wavs = cached_index(
+            "voxceleb1", test_dir, lambda: _index_wav_dir(test_dir)
+        )
+        speakerids = set()
 
         for string in tqdm(usage_list, desc="Search train, dev wavs"):
             pair = string.split()
             index = pair[0]
-            x = list(dataset_root.glob("dev/wav/" + pair[1]))
-            speakerStr = pair[1].split("/")[0]
-            if speakerStr not in speakerids:
-                speakerids.append(speakerStr)
+            x = _find_wav(dev_dir, dev_wavs, pair[1])
+            speakerids.add(pair[1].split("/")[0])
             if int(index) == 1 or int(index) == 3:
-                train.append(str(x[0]))
+                train.append(x)
             elif int(index) == 2:
-                valid.append(str(x[0]))
+                valid.append(x)
             else:
                 raise ValueError
 
@@ -93,8 +114,7 @@ class VoxCeleb1SV(Corpus):
             speakerid2label[spk] = idx
 
         for string in tqdm(test_list, desc="Search test wavs"):
-            x = list(dataset_root.glob("test/wav/" + string.strip()))
-            test.append(str(x[0]))
+            test.append(_find_wav(test_dir, test_wavs, string.strip()))
         logging.info(
             f"finish searching wav: train {len(train)}; valid {len(valid)}; test {len(test)} files found"
         )
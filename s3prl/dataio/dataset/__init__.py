@@ -2,5 +2,6 @@ from .base import Dataset
 from .diarization import DiarizationDataset
 from .encode import EncodeCategories, EncodeCategory, EncodeMultiLabel, EncodeText
 from .frame_label import FrameLabelDataset
-from .load_audio import LoadAudio
+from .load_audio import LoadAudio, PartialLoadAudio
+from .packed_audio import LoadPackedAudio, pack_audio
 from .util import get_info
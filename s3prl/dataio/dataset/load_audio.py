@@ -1,20 +1,33 @@
+import math
+import os
 import random
 from typing import List, Tuple
 
 import librosa
+import numpy as np
 import torch
 import torchaudio
 
+from s3prl.util.audio_cache import SharedAudioCache
+
 from . import Dataset
 
 torchaudio.set_audio_backend("sox_io")
 
+__all__ = [
+    "LoadAudio",
+    "PartialLoadAudio",
+]
+
 
 class LoadAudio(Dataset):
     """
     Args:
         start_secs: use None if load from start
         end_secs: use None if load to end
+        cache: keep the decoded files in the :obj:`SharedAudioCache`, which is
+            shared by all the DataLoader workers. The whole file is decoded once
+            and the segments are sliced from the cached waveform
     """
 
     def __init__(
@@ -27,9 +40,11 @@ class LoadAudio(Dataset):
         max_secs: float = None,
         generator: random.Random = None,
         sample_rate: int = 16000,
+        cache: SharedAudioCache = None,
     ) -> None:
         super().__init__()
         self.filepaths = filepaths
+        self.cache = cache
         self.start_secs = start_secs
         self.end_secs = end_secs
         if generator is None:
@@ -54,18 +69,36 @@ class LoadAudio(Dataset):
     def __len__(self):
         return len(self.filepaths)
 
+    def _load_cached(self, filepath: str, start_sec: float, duration: float):
+        key = f"{os.path.abspath(filepath)}@{self.sample_rate}"
+        cached = self.cache.get(key)
+        if cached is None:
+            y, sr = librosa.load(filepath, sr=self.sample_rate)
+            self.cache.put(key, y, sr)
+        else:
+            y, sr = cached
+
+        # the same truncation as the offset and duration of librosa.load
+        start = int(start_sec * sr)
+        end = None if duration is None else start + int(duration * sr)
+        # copy out the slice from the memory-mapped cache
+        return np.array(y[start:end]), sr
+
     def __getitem__(self, index: int):
         start_sec = None if self.start_secs is None else self.start_secs[index]
         start_sec = start_sec or 0.0
         end_sec = None if self.end_secs is None else self.end_secs[index]
         duration = None if end_sec is None else (self.end_secs[index] - start_sec)
 
-        y, sr = librosa.load(
-            self.filepaths[index],
-            sr=self.sample_rate,
-            offset=start_sec,
-            duration=duration,
-        )
+        if self.cache is None:
+            y, sr = librosa.load(
+                self.filepaths[index],
+                sr=self.sample_rate,
+                offset=start_sec,
+                duration=duration,
+            )
+        else:
+            y, sr = self._load_cached(self.filepaths[index], start_sec, duration)
         assert sr == self.sample_rate
         wav = torch.FloatTensor(y).view(1, -1)
 
@@ -90,3 +123,112 @@ class LoadAudio(Dataset):
             "wav_len": len(wav),
             "wav": wav,
         }
+
+
+class PartialLoadAudio(LoadAudio):
+    """
+    The same as :obj:`LoadAudio`, but only decodes the needed frames with the seekable
+    :code:`torchaudio.load(frame_offset=..., num_frames=...)`. The :code:`max_secs`
+    random crop is chosen from the cached lengths before decoding, so the decoding cost
+    scales with the crop instead of the file. The audio is resampled only when the
+    source sample rate differs, and only the decoded frames are resampled.
+
+    When :code:`sox_effects` are given, the effects (which might change the length)
+    are applied on the whole segment before cropping, as :obj:`LoadAudio`
+
+    Args:
+        num_frames: the number of frames of each file in its own sample rate.
+            If None, retrieved (and cached) by :obj:`s3prl.util.audio_info.get_audio_lengths`
+        source_sample_rates: the sample rate of each file. Must be given with num_frames
+        **kwargs: the same as :obj:`LoadAudio`
+    """
+
+    def __init__(
+        self,
+        filepaths: List[str],
+        start_secs: List[float] = None,
+        end_secs: List[float] = None,
+        sox_effects: Tuple[Tuple[str]] = None,
+        individual_sox_effects: List[Tuple[Tuple[str]]] = None,
+        max_secs: float = None,
+        generator: random.Random = None,
+        sample_rate: int = 16000,
+        num_frames: List[int] = None,
+        source_sample_rates: List[int] = None,
+    ) -> None:
+        super().__init__(
+            filepaths,
+            start_secs,
+            end_secs,
+            sox_effects,
+            individual_sox_effects,
+            max_secs,
+            generator,
+            sample_rate,
+        )
+        assert (num_frames is None) == (source_sample_rates is None)
+        if num_frames is None:
+            from s3prl.util.audio_info import get_audio_lengths
+
+            num_frames, source_sample_rates = get_audio_lengths(filepaths)
+        self.num_frames = [int(n) for n in num_frames]
+        self.source_sample_rates = [int(sr) for sr in source_sample_rates]
+
+    def _frame_range(self, index: int) -> Tuple[int, int]:
+        """
+        Returns:
+            tuple
+
+            the start and end frame to decode, in the source sample rate
+        """
+        source_sr = self.source_sample_rates[index]
+        start = 0
+        end = self.num_frames[index]
+        if self.start_secs is not None:
+            start = round((self.start_secs[index] or 0.0) * source_sr)
+            if self.end_secs[index] is not None:
+                end = min(round(self.end_secs[index] * source_sr), end)
+
+        if self.max_secs is not None and self.individual_sox_effects is None:
+            ratio = self.sample_rate / source_sr
+            num_samples = round((end - start) * ratio)
+            max_samples = round(self.max_secs * self.sample_rate)
+            if num_samples > max_samples:
+                offset = self.generator.randint(0, num_samples - max_samples)
+                start = start + math.floor(offset / ratio)
+                end = min(start + math.ceil(max_samples / ratio), end)
+        return start, end
+
+    def __getitem__(self, index: int):
+        start, end = self._frame_range(index)
+        wav, sr = torchaudio.load(
+            self.filepaths[index], frame_offset=start, num_frames=end - start
+        )
+        if wav.size(0) > 1:
+            # the same as librosa.load(mono=True)
+            wav = wav.mean(dim=0, keepdim=True)
+
+        if self.individual_sox_effects is not None:
+            wav, sr = torchaudio.sox_effects.apply_effects_tensor(
+                wav, sr, effects=self.individual_sox_effects[index]
+            )
+
+        if sr != self.sample_rate:
+            wav = torchaudio.functional.resample(wav, sr, self.sample_rate)
+
+        if self.max_secs is not None:
+            max_samples = round(self.max_secs * self.sample_rate)
+            if self.individual_sox_effects is not None:
+                if wav.size(-1) > max_samples:
+                    crop = self.generator.randint(0, wav.size(-1) - max_samples)
+                    wav = wav[:, crop : crop + max_samples]
+            else:
+                # the resampled crop can be a few samples longer due to rounding
+                wav = wav[:, :max_samples]
+
+        wav = wav.view(-1)
+        return {
+            "wav_path": self.filepaths[index],
+            "wav_len": len(wav),
+            "wav": wav,
+        }
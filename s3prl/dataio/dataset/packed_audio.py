@@ -0,0 +1,288 @@
+"""
+Pack a corpus into a few large shards of raw PCM, and load the utterances back by
+memory-mapped slices without opening or decoding any audio file
+
+Usage:
+    python3 -m s3prl.dataio.dataset.packed_audio corpus.csv packed_dir
+"""
+
+import argparse
+import json
+import logging
+import random
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import torch
+import torchaudio
+from tqdm import tqdm
+
+from .base import Dataset
+from .load_audio import LoadAudio
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.csv"
+META_FILE = "meta.json"
+DTYPES = ["int16", "float32"]
+
+__all__ = [
+    "pack_audio",
+    "LoadPackedAudio",
+]
+
+
+def _csv_secs(csv: pd.DataFrame, column: str) -> List[float]:
+    if column not in csv.columns:
+        return None
+    return [None if pd.isna(sec) else float(sec) for sec in csv[column].tolist()]
+
+
+def pack_audio(
+    corpus: Union[str, pd.DataFrame],
+    output_dir: str,
+    sample_rate: int = 16000,
+    dtype: str = "int16",
+    max_shard_bytes: int = 2**30,
+) -> Path:
+    """
+    Decode every utterance in the corpus once (with :obj:`LoadAudio`) and append the
+    samples into the shard files :code:`shard_{id}.pcm` under :code:`output_dir`
+
+    Args:
+        corpus (str | pd.DataFrame): the corpus csv with the columns :code:`id` and
+            :code:`wav_path`, and optionally :code:`start_sec` and :code:`end_sec`
+            to pack only a segment of the recording
+        output_dir (str): where to save the shards and the index
+        sample_rate (int): the audio is resampled to this rate before packing
+        dtype (str): one of :code:`DTYPES`. :code:`int16` halves the size and is
+            lossless for the usual 16-bit corpora. Samples outside [-1, 1] are clipped
+        max_shard_bytes (int): start a new shard when the current one exceeds this size
+
+    Returns:
+        Path
+
+        The output directory, which can be given to :obj:`LoadPackedAudio`
+    """
+    assert dtype in DTYPES, f"{dtype} is not in {DTYPES}"
+    csv = pd.read_csv(corpus) if isinstance(corpus, (str, Path)) else corpus
+    ids = [str(utt_id) for utt_id in csv["id"].tolist()]
+    assert len(set(ids)) == len(ids), "The ids in the corpus should be unique"
+
+    start_secs = _csv_secs(csv, "start_sec")
+    end_secs = _csv_secs(csv, "end_sec")
+    if (start_secs is None) != (end_secs is None):
+        start_secs = start_secs or [None] * len(ids)
+        end_secs = end_secs or [None] * len(ids)
+    audio_loader = LoadAudio(
+        csv["wav_path"].tolist(), start_secs, end_secs, sample_rate=sample_rate
+    )
+
+    output_dir: Path = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    itemsize = np.dtype(dtype).itemsize
+
+    rows = []
+    shard_id, shard_bytes, shard = 0, 0, None
+    try:
+        for utt_id, item in zip(ids, tqdm(audio_loader, desc="Packing audio")):
+            if shard is None or shard_bytes >= max_shard_bytes:
+                if shard is not None:
+                    shard.close()
+                    shard_id += 1
+                shard = (output_dir / f"shard_{shard_id}.pcm").open("wb")
+                shard_bytes = 0
+
+            wav = item["wav"].numpy()
+            if dtype == "int16":
+                wav = np.clip(np.round(wav * 32768), -32768, 32767)
+            shard.write(wav.astype(dtype).tobytes())
+
+            rows.append(
+                dict(
+                    id=utt_id,
+                    wav_path=item["wav_path"],
+                    shard=shard_id,
+                    offset=shard_bytes // itemsize,
+                    num_samples=len(wav),
+                )
+            )
+            shard_bytes += len(wav) * itemsize
+    finally:
+        if shard is not None:
+            shard.close()
+
+    pd.DataFrame(
+        rows, columns=["id", "wav_path", "shard", "offset", "num_samples"]
+    ).to_csv(output_dir / INDEX_FILE, index=False)
+    with (output_dir / META_FILE).open("w") as f:
+        json.dump(dict(sample_rate=sample_rate, dtype=dtype), f)
+
+    logger.info(f"Packed {len(rows)} utterances into {shard_id + 1} shards")
+    return output_dir
+
+
+class LoadPackedAudio(Dataset):
+    """
+    The drop-in replacement of :obj:`LoadAudio` for the corpus packed by
+    :obj:`pack_audio`. Each item is a slice of the memory-mapped shard, so only the
+    requested samples are read from the disk
+
+    Args:
+        packed_dir: the output directory of :obj:`pack_audio`
+        ids: the utterance ids to load. Default to all the packed utterances
+        start_secs: use None if load from start. Relative to the packed segment
+        end_secs: use None if load to end. Relative to the packed segment
+    """
+
+    def __init__(
+        self,
+        packed_dir: str,
+        ids: List[str] = None,
+        start_secs: List[float] = None,
+        end_secs: List[float] = None,
+        sox_effects: Tuple[Tuple[str]] = None,
+        individual_sox_effects: List[Tuple[Tuple[str]]] = None,
+        max_secs: float = None,
+        generator: random.Random = None,
+    ) -> None:
+        super().__init__()
+        self.packed_dir = Path(packed_dir)
+        with (self.packed_dir / META_FILE).open() as f:
+            meta = json.load(f)
+        self.sample_rate = meta["sample_rate"]
+        self.dtype = meta["dtype"]
+
+        index = pd.read_csv(self.packed_dir / INDEX_FILE, dtype={"id": str})
+        self._index = {
+            utt_id: (wav_path, shard, offset, num_samples)
+            for utt_id, wav_path, shard, offset, num_samples in zip(
+                index["id"].tolist(),
+                index["wav_path"].tolist(),
+                index["shard"].tolist(),
+                index["offset"].tolist(),
+                index["num_samples"].tolist(),
+            )
+        }
+        self.ids = list(self._index.keys()) if ids is None else [str(i) for i in ids]
+        for utt_id in self.ids:
+            assert utt_id in self._index, f"{utt_id} is not packed in {packed_dir}"
+
+        self.start_secs = start_secs
+        self.end_secs = end_secs
+        if generator is None:
+            generator = random.Random(12345678)
+        self.generator = generator
+        self.max_secs = max_secs
+
+        assert int(start_secs is not None) + int(end_secs is not None) in [
+            0,
+            2,
+        ], "start_secs and end_secs must both be given if anyone is given"
+
+        assert (
+            int(sox_effects is not None) + int(individual_sox_effects is not None) <= 1
+        )
+        if sox_effects is not None:
+            individual_sox_effects = [sox_effects for _ in range(len(self.ids))]
+        self.individual_sox_effects = individual_sox_effects
+
+        self._shards = {}
+
+    def __getstate__(self):
+        # the memory maps are re-opened in each DataLoader worker
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def _shard(self, shard: int) -> np.memmap:
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(
+                self.packed_dir / f"shard_{shard}.pcm", dtype=self.dtype, mode="r"
+            )
+        return self._shards[shard]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _segment(self, index: int) -> Tuple[int, int]:
+        num_samples = self._index[self.ids[index]][3]
+        start, end = 0, num_samples
+        if self.start_secs is not None:
+            start_sec = self.start_secs[index] or 0.0
+            end_sec = self.end_secs[index]
+            start = min(round(start_sec * self.sample_rate), num_samples)
+            if end_sec is not None:
+                end = max(min(round(end_sec * self.sample_rate), num_samples), start)
+        return start, end
+
+    def getinfo(self, index: int):
+        start, end = self._segment(index)
+        if self.max_secs is not None and self.individual_sox_effects is None:
+            end = min(end, start + round(self.max_secs * self.sample_rate))
+        return {
+            "wav_path": self._index[self.ids[index]][0],
+            "wav_len": end - start,
+        }
+
+    def __getitem__(self, index: int):
+        wav_path, shard, offset, _ = self._index[self.ids[index]]
+        start, end = self._segment(index)
+
+        if self.max_secs is not None and self.individual_sox_effects is None:
+            # crop before reading, so the rest of the utterance is never touched
+            max_samples = round(self.max_secs * self.sample_rate)
+            if end - start > max_samples:
+                start += self.generator.randint(0, end - start - max_samples)
+                end = start + max_samples
+
+        wav = self._shard(shard)[offset + start : offset + end]
+        wav = torch.from_numpy(wav.astype(np.float32))
+        if self.dtype == "int16":
+            wav = wav / 32768
+
+        if self.individual_sox_effects is not None:
+            wav, sr = torchaudio.sox_effects.apply_effects_tensor(
+                wav.view(1, -1),
+                self.sample_rate,
+                effects=self.individual_sox_effects[index],
+            )
+            if sr != self.sample_rate:
+                wav, sr = torchaudio.transforms.Resample(sr, self.sample_rate)(wav)
+
+            if self.max_secs is not None:
+                secs = wav.size(-1) / self.sample_rate
+                if secs > self.max_secs:
+                    max_samples = round(self.max_secs * self.sample_rate)
+                    start = self.generator.randint(0, wav.size(-1) - max_samples)
+                    wav = wav[:, start : start + max_samples]
+
+        wav = wav.view(-1)
+        return {
+            "wav_path": wav_path,
+            "wav_len": len(wav),
+            "wav": wav,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "corpus", help="The csv with id, wav_path, and optionally start_sec, end_sec"
+    )
+    parser.add_argument("output_dir")
+    parser.add_argument("--sample_rate", type=int, default=16000)
+    parser.add_argument("--dtype", default="int16", choices=DTYPES)
+    parser.add_argument("--max_shard_gb", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pack_audio(
+        args.corpus,
+        args.output_dir,
+        args.sample_rate,
+        args.dtype,
+        round(args.max_shard_gb * 2**30),
+    )
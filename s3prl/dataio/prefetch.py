@@ -0,0 +1,94 @@
+"""
+Overlap the host-to-device copies of the next batch with the computation on the
+current batch
+"""
+
+from typing import Any, Callable, Iterable
+
+import torch
+
+__all__ = [
+    "to_device",
+    "DevicePrefetcher",
+]
+
+
+def to_device(data: Any, device: str, non_blocking: bool = True) -> Any:
+    """
+    Move all the tensors in the (nested) dict, list or tuple to the device. The other
+    values are returned as they are
+    """
+    if isinstance(data, torch.Tensor):
+        return data.to(device, non_blocking=non_blocking)
+    if isinstance(data, dict):
+        return data.__class__(
+            (key, to_device(value, device, non_blocking)) for key, value in data.items()
+        )
+    if isinstance(data, (list, tuple)) and not hasattr(data, "_fields"):
+        return data.__class__(to_device(value, device, non_blocking) for value in data)
+    return data
+
+
+def _record_stream(data: Any, stream: "torch.cuda.Stream"):
+    if isinstance(data, torch.Tensor):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, dict):
+        for value in data.values():
+            _record_stream(value, stream)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            _record_stream(value, stream)
+
+
+class DevicePrefetcher:
+    """
+    Iterate the batches of :code:`loader` already moved to :code:`device`. On CUDA,
+    the next batch is copied on a side stream before the current batch is returned,
+    so the copy runs along with the computation on the current batch. Pin the batches
+    (e.g. :code:`DataLoader(pin_memory=True)`) to make the copies truly asynchronous.
+    On the other devices, the batches are moved synchronously
+
+    Args:
+        loader (Iterable): usually a :code:`torch.utils.data.DataLoader`
+        device (str): the target device
+        move_fn (Callable): called as :code:`move_fn(batch, device)` to move a batch,
+            default to :obj:`to_device`
+    """
+
+    def __init__(self, loader: Iterable, device: str, move_fn: Callable = None) -> None:
+        self.loader = loader
+        self.device = torch.device(device)
+        self.move_fn = move_fn or to_device
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.device.type != "cuda" or not torch.cuda.is_available():
+            for batch in self.loader:
+                yield self.move_fn(batch, self.device)
+            return
+
+        stream = torch.cuda.Stream(device=self.device)
+        current_stream = torch.cuda.current_stream(self.device)
+
+        def _prefetch(iterator):
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return None, False
+            with torch.cuda.stream(stream):
+                return self.move_fn(batch, self.device), True
+
+        iterator = iter(self.loader)
+        batch, has_batch = _prefetch(iterator)
+        while has_batch:
+            current_stream.wait_stream(stream)
+            # the tensors are allocated on the side stream but used on the current
+            # stream, so their memory should not be reused until the current stream
+            # finishes with them
+            _record_stream(batch, current_stream)
+            next_batch, has_next = _prefetch(iterator)
+            yield batch
+            batch, has_batch = next_batch, has_next
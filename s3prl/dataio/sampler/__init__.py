@@ -6,11 +6,15 @@ from .balanced_weighted_sampler import BalancedWeightedSampler
 from .distributed_sampler import DistributedBatchSamplerWrapper
 from .fixed_batch_size_batch_sampler import FixedBatchSizeBatchSampler
 from .group_same_item_sampler import GroupSameItemSampler
-from .max_timestamp_batch_sampler import MaxTimestampBatchSampler
+from .max_timestamp_batch_sampler import (
+    BucketedMaxTimestampBatchSampler,
+    MaxTimestampBatchSampler,
+)
 from .sorted_sampler import SortedBucketingSampler, SortedSliceSampler
 
 __all__ = [
     "BalancedWeightedSampler",
+    "BucketedMaxTimestampBatchSampler",
     "DistributedBatchSamplerWrapper",
     "FixedBatchSizeBatchSampler",
     "GroupSameItemSampler",
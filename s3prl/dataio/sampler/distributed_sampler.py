@@ -47,13 +47,27 @@ class DistributedBatchSamplerWrapper:
         self.rank = rank
         self.allow_duplicates = allow_duplicates
         self.allow_uneven = allow_uneven
+        self._cached_plan = None
+        self._cached_batch_indices = None
 
     def __iter__(self) -> Iterator[T_co]:
+        # The samplers with a cached per-epoch plan (e.g. SortedBucketingSampler) return
+        # the same plan object until the epoch changes, so the distribution is reused
+        plan = getattr(self.batch_sampler, "plan", None)
+        if callable(plan):
+            plan = plan()
+            if plan is not self._cached_plan:
+                self._cached_batch_indices = self._distribute(plan)
+                self._cached_plan = plan
+            return iter(self._cached_batch_indices)
+
+        return iter(self._distribute(list(iter(self.batch_sampler))))
+
+    def _distribute(self, all_rank_batch_indices):
         logger.info(
             f"Building distributed batch sampler for rank={self.rank}, world_size={self.num_replicas}"
         )
 
-        all_rank_batch_indices = list(iter(self.batch_sampler))
         if len(all_rank_batch_indices) % self.num_replicas == 0:
             target_batch_indices = all_rank_batch_indices
         else:
@@ -94,6 +108,7 @@ class DistributedBatchSamplerWrapper:
                             "different processes. This must not happen during the training stage and "
                             "can lead to hanging, while might be okay during the evaluation stage."
                         )
+                        break
                     else:
                         raise ValueError(
                             "The provided batch sampler cannot be safely wrapped for distributed training. "
@@ -106,13 +121,12 @@ class DistributedBatchSamplerWrapper:
             assert len(target_batch_indices) % self.num_replicas == 0
 
         batch_indices = target_batch_indices[self.rank :: self.num_replicas]
-        return iter(batch_indices)
+        return batch_indices
 
     def __len__(self) -> int:
         # Since the total number of batches dynamically depends on the current epoch,
         # instead of pre-compute it which will duplicate the batch number computation logic,
-        # it makes no harm to simply re-compute it with __iter__ for every call, since
-        # __len__ is usually not frequently called and won't be the performance bottleneck
+        # simply re-compute it with __iter__, which is cached for the planned samplers
         return len(list(iter(self)))
 
     def set_epoch(self, epoch: int) -> None:
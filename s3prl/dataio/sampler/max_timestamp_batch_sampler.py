@@ -11,13 +11,18 @@ import torch
 
 __all__ = [
     "MaxTimestampBatchSampler",
+    "BucketedMaxTimestampBatchSampler",
 ]
 
 
 class MaxTimestampBatchSampler:
     """
     The reduced timestamps for a batch should not exceed the max_timestamp.
-    If shuffled, each indices are first shuffled before aggregated into batches
+    If shuffled, each indices are first shuffled before aggregated into batches.
+
+    With the default reduce_func (the padded timestamps, max * len) the reduction is
+    updated incrementally. The batches of an epoch are planned once and cached, so
+    :code:`len()` does not iterate again
     """
 
     def __init__(
@@ -33,7 +38,9 @@ class MaxTimestampBatchSampler:
         self.shuffle = shuffle
         self.seed = seed
         self.epoch = 0
-        self.reduce_func = reduce_func or self._default_reduce_func
+        self.reduce_func = reduce_func
+        self._plan_key = None
+        self._plan = None
 
     @staticmethod
     def _default_reduce_func(timestamps):
@@ -43,33 +50,127 @@ class MaxTimestampBatchSampler:
         self.epoch = epoch
 
     def _evaluate_reduced_timestamps(self, batch_indices):
-        return self.reduce_func([self.lengths[indice] for indice in batch_indices])
+        reduce_func = self.reduce_func or self._default_reduce_func
+        return reduce_func([self.lengths[indice] for indice in batch_indices])
 
-    def __iter__(self):
-        if self.shuffle:
-            generator = torch.Generator()
-            generator.manual_seed(self.epoch + self.seed)
-            indices = torch.randperm(len(self.lengths), generator=generator).tolist()
-        else:
-            indices = list(range(len(self.lengths)))
+    def _generator(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.epoch + self.seed)
+        return generator
 
-        batch = []
+    def _fits(self, batch_lengths: List[int], max_len: int, length: int) -> bool:
+        if self.reduce_func is None:
+            return max(max_len, length) * (len(batch_lengths) + 1) <= self.max_length
+
+        batch_lengths.append(length)
+        fits = self.reduce_func(batch_lengths) <= self.max_length
+        batch_lengths.pop()
+        return fits
+
+    def _batches(self, indices: List[int]) -> List[List[int]]:
+        """
+        Greedily aggregate the ordered indices into batches
+        """
+        batches = []
+        batch, batch_lengths, max_len = [], [], 0
         for indice in indices:
-            try_new_batch = batch + [indice]
-            if self._evaluate_reduced_timestamps(try_new_batch) <= self.max_length:
-                batch = try_new_batch
-            elif len(batch) == 0:
+            length = self.lengths[indice]
+            if not self._fits(batch_lengths, max_len, length) and len(batch) > 0:
+                batches.append(batch)
+                batch, batch_lengths, max_len = [], [], 0
+
+            if len(batch) == 0 and not self._fits(batch_lengths, max_len, length):
                 raise ValueError(
-                    f"There is a single length {self.lengths[indice]} larger than "
+                    f"There is a single length {length} larger than "
                     f"max_length {self.max_length}. Please increase "
                     "the max_length."
                 )
-            else:
-                yield batch
-                batch = [indice]
+            batch.append(indice)
+            batch_lengths.append(length)
+            max_len = max(max_len, length)
 
         if len(batch) > 0:
-            yield batch
+            batches.append(batch)
+        return batches
+
+    def _plan_batches(self) -> List[List[int]]:
+        if self.shuffle:
+            indices = torch.randperm(
+                len(self.lengths), generator=self._generator()
+            ).tolist()
+        else:
+            indices = list(range(len(self.lengths)))
+        return self._batches(indices)
+
+    def _plan_identity(self) -> tuple:
+        return (self.epoch, self.seed, self.shuffle, self.max_length, self.reduce_func)
+
+    def plan(self) -> List[List[int]]:
+        """
+        Returns:
+            List[List[int]]
+
+            The batches of the current epoch, computed once per epoch
+        """
+        key = self._plan_identity()
+        if self._plan is None or self._plan_key != key:
+            self._plan = self._plan_batches()
+            self._plan_key = key
+        return self._plan
+
+    def __iter__(self):
+        for batch in self.plan():
+            yield list(batch)
 
     def __len__(self):
-        return len(list(iter(self)))
+        return len(self.plan())
+
+
+class BucketedMaxTimestampBatchSampler(MaxTimestampBatchSampler):
+    """
+    The padding-aware variant of :obj:`MaxTimestampBatchSampler`. The (shuffled)
+    indices are split into mega-buckets of :code:`bucket_size`, and the indices in each
+    bucket are sorted by length before aggregated into batches, so each batch holds
+    similar lengths and wastes less of the :code:`max_length` budget on padding.
+    If shuffled, the batches are shuffled again across the buckets
+
+    Args:
+        bucket_size (int): the number of indices sorted together.
+            Larger buckets give more homogeneous batches but less randomness
+    """
+
+    def __init__(
+        self,
+        lengths: List[int],
+        max_length: int,
+        shuffle: bool = False,
+        seed: int = 12345678,
+        reduce_func: callable = None,
+        bucket_size: int = 1000,
+    ) -> None:
+        super().__init__(lengths, max_length, shuffle, seed, reduce_func)
+        self.bucket_size = bucket_size
+
+    def _plan_identity(self) -> tuple:
+        return (*super()._plan_identity(), self.bucket_size)
+
+    def _plan_batches(self) -> List[List[int]]:
+        generator = self._generator()
+        if self.shuffle:
+            indices = torch.randperm(len(self.lengths), generator=generator).tolist()
+        else:
+            indices = list(range(len(self.lengths)))
+
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = sorted(
+                indices[start : start + self.bucket_size],
+                key=lambda indice: self.lengths[indice],
+                reverse=True,
+            )
+            batches.extend(self._batches(bucket))
+
+        if self.shuffle:
+            order = torch.randperm(len(batches), generator=generator).tolist()
+            batches = [batches[idx] for idx in order]
+        return batches
@@ -9,6 +9,7 @@ Authors:
 
 from typing import List
 
+import numpy as np
 import torch
 
 __all__ = [
@@ -17,6 +18,21 @@ __all__ = [
 ]
 
 
+def _sort_by_length(lengths: List[int]):
+    """
+    Returns:
+        tuple
+
+        1. sorted_ids (np.ndarray): the indices sorted by length from long to short
+        2. positions (np.ndarray): the position of each index in :code:`sorted_ids`
+    """
+    lengths = np.asarray(lengths)
+    sorted_ids = np.argsort(-lengths, kind="stable")
+    positions = np.empty_like(sorted_ids)
+    positions[sorted_ids] = np.arange(len(sorted_ids))
+    return sorted_ids, positions
+
+
 class SortedSliceSampler:
     """
     This sampler should only be used for training hence is always in random shuffle mode
@@ -44,27 +60,36 @@ class SortedSliceSampler:
         self.max_length = max_length
         self.in_batch_shuffle = in_batch_shuffle
 
-        sorted_ids = [(idx, length) for idx, length in enumerate(lengths)]
-        sorted_ids = sorted(sorted_ids, key=lambda x: x[1], reverse=True)
-        self.sorted_ids = [data_id for data_id, length in sorted_ids]
+        self._sorted_ids, self._positions = _sort_by_length(lengths)
+        self._plan_key = None
+        self._plan = None
+
+    @property
+    def sorted_ids(self) -> List[int]:
+        return self._sorted_ids.tolist()
 
     def set_epoch(self, epoch: int):
         self.epoch = epoch
 
-    def __iter__(self):
+    def _plan_batches(self) -> List[List[int]]:
         generator = torch.Generator()
         generator.manual_seed(self.epoch + self.seed)
 
-        indices = torch.randperm(len(self.lengths), generator=generator).tolist()
+        indices = torch.randperm(len(self.lengths), generator=generator).numpy()
+        batch_sizes = np.where(
+            np.asarray(self.lengths)[indices] > self.max_length,
+            max(self.batch_size // 2, 1),
+            self.batch_size,
+        )
+        start_positions = self._positions[indices]
 
-        for indice in indices:
-            length = self.lengths[indice]
-            if length > self.max_length:
-                batch_size = self.batch_size // 2
-            else:
-                batch_size = self.batch_size
-            start_position = self.sorted_ids.index(indice)
-            batch = self.sorted_ids[start_position : start_position + batch_size]
+        batches = []
+        for start_position, batch_size in zip(
+            start_positions.tolist(), batch_sizes.tolist()
+        ):
+            batch = self._sorted_ids[
+                start_position : start_position + batch_size
+            ].tolist()
 
             if self.in_batch_shuffle:
                 inbatch_indices = torch.randperm(
@@ -72,10 +97,34 @@ class SortedSliceSampler:
                 ).tolist()
                 batch = [batch[idx] for idx in inbatch_indices]
 
-            yield batch
+            batches.append(batch)
+        return batches
+
+    def plan(self) -> List[List[int]]:
+        """
+        Returns:
+            List[List[int]]
+
+            The batches of the current epoch, computed once per epoch
+        """
+        key = (
+            self.epoch,
+            self.seed,
+            self.batch_size,
+            self.max_length,
+            self.in_batch_shuffle,
+        )
+        if self._plan is None or self._plan_key != key:
+            self._plan = self._plan_batches()
+            self._plan_key = key
+        return self._plan
+
+    def __iter__(self):
+        for batch in self.plan():
+            yield list(batch)
 
     def __len__(self):
-        return len(list(iter(self)))
+        return len(self.lengths)
 
 
 class SortedBucketingSampler:
@@ -106,30 +155,39 @@ class SortedBucketingSampler:
         self.in_batch_shuffle = in_batch_shuffle
         self.lengths = lengths
 
-        sorted_ids = [(idx, length) for idx, length in enumerate(self.lengths)]
-        sorted_ids = sorted(sorted_ids, key=lambda x: x[1], reverse=True)
-        self.sorted_ids = [data_id for data_id, length in sorted_ids]
+        self._sorted_ids, _ = _sort_by_length(lengths)
+        self._plan_key = None
+        self._plan = None
+
+    @property
+    def sorted_ids(self) -> List[int]:
+        return self._sorted_ids.tolist()
 
     def set_epoch(self, epoch: int):
         self.epoch = epoch
 
-    def __iter__(self):
+    def _batch_boundaries(self) -> np.ndarray:
+        """
+        The utterances longer than max_length form a prefix of the sorted ids, which
+        is sliced by half the batch size, and the rest by the full batch size
+        """
+        num_ids = len(self._sorted_ids)
+        half_batch_size = max(self.batch_size // 2, 1)
+        num_long = int((np.asarray(self.lengths) > self.max_length).sum())
+        long_starts = np.arange(0, num_long, half_batch_size)
+        short_start = len(long_starts) * half_batch_size
+        short_starts = np.arange(short_start, num_ids, self.batch_size)
+        starts = np.concatenate([long_starts, short_starts])
+        ends = np.minimum(np.append(starts[1:], num_ids), num_ids)
+        return np.stack([starts, ends], axis=-1)
+
+    def _plan_batches(self) -> List[List[int]]:
         generator = torch.Generator()
         generator.manual_seed(self.epoch + self.seed)
 
         batches = []
-        position = 0
-        while position < len(self.sorted_ids):
-            indice = self.sorted_ids[position]
-            length = self.lengths[indice]
-            if length > self.max_length:
-                batch_size = self.batch_size // 2
-            else:
-                batch_size = self.batch_size
-            batch = self.sorted_ids[
-                position : min(position + batch_size, len(self.sorted_ids))
-            ]
-            position += batch_size
+        for start, end in self._batch_boundaries().tolist():
+            batch = self._sorted_ids[start:end].tolist()
             if self.in_batch_shuffle:
                 shuffled_batch_indices = torch.randperm(len(batch), generator=generator)
                 batch = [batch[idx] for idx in shuffled_batch_indices]
@@ -139,7 +197,31 @@ class SortedBucketingSampler:
             shuffled_indices = torch.randperm(len(batches), generator=generator)
             batches = [batches[idx] for idx in shuffled_indices]
 
-        return iter(batches)
+        return batches
+
+    def plan(self) -> List[List[int]]:
+        """
+        Returns:
+            List[List[int]]
+
+            The batches of the current epoch, computed once per epoch
+        """
+        key = (
+            self.epoch,
+            self.seed,
+            self.batch_size,
+            self.max_length,
+            self.shuffle,
+            self.in_batch_shuffle,
+        )
+        if self._plan is None or self._plan_key != key:
+            self._plan = self._plan_batches()
+            self._plan_key = key
+        return self._plan
+
+    def __iter__(self):
+        for batch in self.plan():
+            yield list(batch)
 
     def __len__(self):
-        return len(list(iter(self)))
+        return len(self.plan())
@@ -11,11 +11,14 @@
 ###############
 # IMPORTATION #
 ###############
+import hashlib
 import io
+import logging
 import os
 import random
 import subprocess
 import sys
+import tempfile
 
 # -------------#
 import numpy as np
@@ -30,6 +33,8 @@ from torch.utils.data.dataset import Dataset
 # -------------#
 import torchaudio
 
+logger = logging.getLogger(__name__)
+
 
 def _count_frames(data_len, size, step):
     # no padding at edges, last remaining samples are ignored
@@ -78,6 +83,7 @@ class DiarizationDataset(Dataset):
         use_last_samples=True,
         label_delay=0,
         num_speakers=None,
+        piped_wav_dir=None,
     ):
         super(DiarizationDataset, self).__init__()
 
@@ -91,7 +97,7 @@ class DiarizationDataset(Dataset):
         self.chunk_indices = [] if mode != "test" else {}
         self.label_delay = label_delay
 
-        self.data = KaldiData(self.data_dir)
+        self.data = KaldiData(self.data_dir, piped_wav_dir=piped_wav_dir)
 
         # make chunk indices: filepath, start_frame, end_frame
         for rec in self.data.wavs:
@@ -236,9 +242,15 @@ class DiarizationDataset(Dataset):
 class KaldiData:
     """This class holds data in kaldi-style directory."""
 
-    def __init__(self, data_dir):
-        """Load kaldi data directory."""
+    def __init__(self, data_dir, piped_wav_dir=None):
+        """Load kaldi data directory.
+
+        The piped commands in wav.scp are decoded once into piped_wav_dir,
+        default to "{data_dir}/.piped_wav".
+        """
         self.data_dir = data_dir
+        self.piped_wav_dir = piped_wav_dir or os.path.join(data_dir, ".piped_wav")
+        self._save_piped = True
         self.segments = self._load_segments_rechash(
             os.path.join(self.data_dir, "segments")
         )
@@ -296,26 +308,60 @@ class KaldiData:
                 for filename in sorted(os.listdir(wav_dir))
             }
 
+    def _piped_wav_path(self, wav_rxfilename):
+        name = hashlib.sha1(wav_rxfilename.encode()).hexdigest()
+        return os.path.join(self.piped_wav_dir, f"{name}.wav")
+
+    def _save_piped_wav(self, wav_path, data, samplerate):
+        """Write the decoded piped command into a seekable wav file, so the
+        following chunks of the recording only read the chunk."""
+        try:
+            os.makedirs(self.piped_wav_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                dir=self.piped_wav_dir, suffix=".tmp", delete=False
+            ) as f:
+                sf.write(f, data, samplerate, format="WAV", subtype="FLOAT")
+            os.replace(f.name, wav_path)
+        except OSError as e:
+            # e.g. read-only data_dir, do not retry (and warn) for every chunk
+            self._save_piped = False
+            logger.warning(
+                f"Fail to save the piped recording into {wav_path}: {e}. "
+                "Saving the piped recordings is disabled"
+            )
+
     def _load_wav(self, wav_rxfilename, start=0, end=None):
         """This function reads audio file and return data in numpy.float32 array.
-        "lru_cache" holds recently loaded audio so that can be called
-        many times on the same audio file.
-        OPTIMIZE: controls lru_cache size for random access,
-        considering memory size
+        The piped commands are decoded once and saved as wav files in
+        piped_wav_dir, so that can be called many times on the same audio file
+        by seeking.
         """
         if wav_rxfilename.endswith("|"):
-            # input piped command
-            p = subprocess.Popen(
-                wav_rxfilename[:-1],
-                shell=True,
-                stdout=subprocess.PIPE,
-            )
-            data, samplerate = sf.read(
-                io.BytesIO(p.stdout.read()),
-                dtype="float32",
-            )
-            # cannot seek
-            data = data[start:end]
+            # input piped command, which is decoded only once
+            wav_path = self._piped_wav_path(wav_rxfilename)
+            if os.path.exists(wav_path):
+                data, samplerate = sf.read(
+                    wav_path, start=start, stop=end, dtype="float32"
+                )
+            else:
+                p = subprocess.Popen(
+                    wav_rxfilename[:-1],
+                    shell=True,
+                    stdout=subprocess.PIPE,
+                )
+                data, samplerate = sf.read(
+                    io.BytesIO(p.stdout.read()),
+                    dtype="float32",
+                )
+                if p.wait() != 0:
+                    logger.warning(
+                        f"The piped command exits with code {p.returncode}, "
+                        f"not saving its output: {wav_rxfilename}"
+                    )
+                elif self._save_piped:
+                    self._save_piped_wav(wav_path, data, samplerate)
+                # cannot seek
+                data = data[start:end]
         elif wav_rxfilename == "-":
             # stdin
             data, samplerate = sf.read(sys.stdin, dtype="float32")
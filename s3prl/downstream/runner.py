@@ -14,20 +14,30 @@ import torchaudio
 import numpy as np
 from tqdm import tqdm
 from tensorboardX import SummaryWriter
-from torch.utils.data import DistributedSampler
+from torch.utils.data import DataLoader, DistributedSampler, RandomSampler, SequentialSampler
 from torch.nn.parallel import DistributedDataParallel as DDP
-from torch.distributed import is_initialized, get_rank, get_world_size
+from torch.distributed import is_initialized, get_rank, get_world_size, gather_object
 
 from s3prl import hub
+from s3prl.dataio.prefetch import DevicePrefetcher
 from s3prl.optimizers import get_optimizer
 from s3prl.schedulers import get_scheduler
 from s3prl.upstream.interfaces import Featurizer
+from s3prl.util.benchmark import StepTimer
+from s3prl.util.checkpoint import AsyncCheckpointWriter
+from s3prl.util.upstream_metadata import get_metadata_key
 from s3prl.utility.helper import is_leader_process, get_model_state, show, defaultdict
 
 from huggingface_hub import HfApi, HfFolder, Repository
 
 SAMPLE_RATE = 16000
 
+
+def _move_wavs(batch, device):
+    wavs, *others = batch
+    wavs = [torch.as_tensor(wav, dtype=torch.float32).to(device, non_blocking=True) for wav in wavs]
+    return (wavs, *others)
+
 MODEL_CARD_MARKDOWN = """---
 datasets:
 - superb
@@ -155,6 +165,12 @@ class Runner():
         if is_initialized() and get_rank() == 0:
             torch.distributed.barrier()
 
+        precision = getattr(self.args, 'upstream_precision', 'fp32')
+        if precision != 'fp32':
+            assert hasattr(model, 'set_precision'), f'{self.args.upstream} does not support {precision}'
+            print(f'[Runner] - Run the upstream in {precision}')
+            model.set_precision(precision)
+
         return self._init_model(
             model = model,
             name = 'Upstream',
@@ -164,12 +180,33 @@ class Runner():
 
 
     def _get_featurizer(self):
+        layer_selection = self.args.upstream_layer_selection
+        upstream = getattr(self.upstream.model, 'module', self.upstream.model)
+        if (
+            self.args.upstream_feature_selection == 'hidden_states'
+            and isinstance(layer_selection, int) and layer_selection >= 0
+            and hasattr(upstream, 'set_max_layer')
+        ):
+            # the layers after the selected one are never consumed, skip their computation
+            upstream.set_max_layer(layer_selection)
+
+        metadata_key = None
+        from_hf_hub = "from_hf_hub" in self.args and self.args.from_hf_hub == True
+        if not from_hf_hub and not self.args.upstream_refresh:
+            # the probing forward of Featurizer only runs once for each upstream
+            metadata_key = get_metadata_key(
+                upstream = self.args.upstream,
+                ckpt = self.args.upstream_ckpt,
+                model_config = self.args.upstream_model_config,
+            )
+
         model = Featurizer(
             upstream = self.upstream.model,
             feature_selection = self.args.upstream_feature_selection,
             layer_selection = self.args.upstream_layer_selection,
             upstream_device = self.args.device,
             normalize = self.args.upstream_feature_normalize,
+            metadata_key = metadata_key,
         ).to(self.args.device)
 
         return self._init_model(
@@ -267,55 +304,71 @@ class Runner():
         if is_leader_process():
             logger = SummaryWriter(self.args.expdir)
 
+        # checkpoints are serialized in the background
+        ckpt_writer = AsyncCheckpointWriter()
+
+        # break down the step time, see s3prl.util.benchmark.StepTimer
+        timer = StepTimer(sync=self.config['runner'].get('timing_sync', False))
+
+        def move_wavs(batch, device):
+            timer.count(len(batch[0]), sum(len(wav) for wav in batch[0]) / SAMPLE_RATE)
+            return _move_wavs(batch, device)
+
         batch_ids = []
         backward_steps = 0
         records = defaultdict(list)
         epoch = self.init_ckpt.get('Epoch', 0)
         train_split = self.config['runner'].get("train_dataloader", "train")
+        dataloader = None
         while pbar.n < pbar.total:
             try:
-                dataloader = self.downstream.model.get_dataloader(train_split, epoch=epoch)
+                new_dataloader = self.downstream.model.get_dataloader(train_split, epoch=epoch)
             except TypeError as e:
                 if "unexpected keyword argument 'epoch'" in str(e):
-                    dataloader = self.downstream.model.get_dataloader(train_split)
-                    if hasattr(dataloader, "sampler") and isinstance(dataloader.sampler, DistributedSampler):
-                        dataloader.sampler.set_epoch(epoch)
+                    new_dataloader = self.downstream.model.get_dataloader(train_split)
+                    if hasattr(new_dataloader, "sampler") and isinstance(new_dataloader.sampler, DistributedSampler):
+                        new_dataloader.sampler.set_epoch(epoch)
                 else:
                     raise
+            dataloader = self._reuse_dataloader(dataloader, new_dataloader)
 
-            for batch_id, (wavs, *others) in enumerate(tqdm(dataloader, dynamic_ncols=True, desc='train', file=tqdm_file)):
+            # the wavs of the next batch are copied to the device during this batch
+            prefetcher = DevicePrefetcher(dataloader, self.args.device, timer.wrap(move_wavs, 'h2d'))
+            for batch_id, (wavs, *others) in enumerate(tqdm(timer.iterate(prefetcher, 'data'), total=len(prefetcher), dynamic_ncols=True, desc='train', file=tqdm_file)):
                 # try/except block for forward/backward
                 try:
                     if pbar.n >= pbar.total:
                         break
                     global_step = pbar.n + 1
 
-                    wavs = [torch.FloatTensor(wav).to(self.args.device) for wav in wavs]
-
                     with torch.cuda.amp.autocast(enabled=amp):
-                        if self.upstream.trainable:
-                            features = self.upstream.model(wavs)
-                        else:
-                            with torch.no_grad():
+                        with timer.phase('upstream'):
+                            if self.upstream.trainable:
                                 features = self.upstream.model(wavs)
-                        features = self.featurizer.model(wavs, features)
-
-                        if specaug:
-                            features, _ = specaug(features)
-
-                        loss = self.downstream.model(
-                            train_split,
-                            features, *others,
-                            records = records,
-                        )
+                            else:
+                                with torch.no_grad():
+                                    features = self.upstream.model(wavs)
+                        with timer.phase('featurizer'):
+                            features = self.featurizer.model(wavs, features)
+
+                        with timer.phase('downstream'):
+                            if specaug:
+                                features, _ = specaug(features)
+
+                            loss = self.downstream.model(
+                                train_split,
+                                features, *others,
+                                records = records,
+                            )
                     batch_ids.append(batch_id)
 
                     gradient_accumulate_steps = self.config['runner'].get('gradient_accumulate_steps')
                     loss = (loss / gradient_accumulate_steps)
-                    if amp:
-                        scaler.scale(loss).backward()
-                    else:
-                        loss.backward()
+                    with timer.phase('backward'):
+                        if amp:
+                            scaler.scale(loss).backward()
+                        else:
+                            loss.backward()
                     del loss
 
                 except RuntimeError as e:
@@ -335,6 +388,8 @@ class Runner():
                 if backward_steps % gradient_accumulate_steps > 0:
                     continue
 
+                timer.start('optimizer')
+
                 # unscale
                 if amp:
                     scaler.unscale_(optimizer)
@@ -357,9 +412,15 @@ class Runner():
                 if scheduler:
                     scheduler.step()
 
+                timer.stop('optimizer')
+                timer.step()
+
                 if not is_leader_process():
                     batch_ids = []
                     records = defaultdict(list)
+                    if self._distributed_evaluate() and global_step % self.config['runner']['eval_step'] == 0:
+                        for split in self.config['runner']['eval_dataloaders']:
+                            self.evaluate(split, None, global_step)
                     continue
 
                 # logging
@@ -374,26 +435,21 @@ class Runner():
                     )
                     batch_ids = []
                     records = defaultdict(list)
+                    timer.log(logger, global_step)
 
                 # evaluation and save checkpoint
                 save_names = []
 
                 if global_step % self.config['runner']['eval_step'] == 0:
-                    for split in self.config['runner']['eval_dataloaders']:
-                        save_names += self.evaluate(split, logger, global_step)
+                    with timer.phase('eval'):
+                        for split in self.config['runner']['eval_dataloaders']:
+                            save_names += self.evaluate(split, logger, global_step)
 
                 if global_step % self.config['runner']['save_step'] == 0:
-                    def check_ckpt_num(directory):
-                        max_keep = self.config['runner']['max_keep']
-                        ckpt_pths = glob.glob(f'{directory}/states-*.ckpt')
-                        if len(ckpt_pths) >= max_keep:
-                            ckpt_pths = sorted(ckpt_pths, key=lambda pth: int(pth.split('-')[-1].split('.')[0]))
-                            for ckpt_pth in ckpt_pths[:len(ckpt_pths) - max_keep + 1]:
-                                os.remove(ckpt_pth)
-                    check_ckpt_num(self.args.expdir)
                     save_names.append(f'states-{global_step}.ckpt')
 
                 if len(save_names) > 0:
+                    timer.start('checkpoint')
                     all_states = {
                         'Optimizer': optimizer.state_dict(),
                         'Step': global_step,
@@ -416,12 +472,30 @@ class Runner():
                     tqdm.write(f'[Runner] - Save the checkpoint to:')
                     for i, path in enumerate(save_paths):
                         tqdm.write(f'{i + 1}. {path}')
-                        torch.save(all_states, path)
+                    ckpt_writer.save_copies(all_states, save_paths)
+                    timer.stop('checkpoint')
+
+                if global_step % self.config['runner']['save_step'] == 0:
+                    def check_ckpt_num(directory):
+                        max_keep = self.config['runner']['max_keep']
+                        ckpt_pths = glob.glob(f'{directory}/states-*.ckpt')
+                        if len(ckpt_pths) > max_keep:
+                            ckpt_pths = sorted(ckpt_pths, key=lambda pth: int(pth.split('-')[-1].split('.')[0]))
+                            for ckpt_pth in ckpt_pths[:len(ckpt_pths) - max_keep]:
+                                os.remove(ckpt_pth)
+                    # runs after the checkpoint above is written
+                    ckpt_writer.submit(check_ckpt_num, self.args.expdir)
 
                 pbar.update(1)
             epoch += 1
 
         pbar.close()
+        if tqdm_file is not sys.stderr:
+            tqdm_file.close()
+        ckpt_writer.close()
+        if is_leader_process():
+            timing = timer.dump(os.path.join(self.args.expdir, 'timing.json'))
+            tqdm.write(f"[Runner] - Seconds per step: {timing['seconds_per_step']}, {timing['phase_seconds_per_step']}")
 
         if self.args.push_to_hf_hub:
             self.push_to_huggingface_hub()
@@ -429,8 +503,87 @@ class Runner():
             logger.close()
 
 
+    @staticmethod
+    def _reuse_dataloader(previous, dataloader):
+        """
+        get_dataloader returns a new DataLoader every epoch, which re-spawns the workers. When the new one
+        only differs from the previous one by the epoch of its sampler, keep iterating the previous one
+        with persistent workers instead. The DataLoaders with custom samplers are used as they are
+        """
+        samplers = (SequentialSampler, RandomSampler, DistributedSampler)
+        if not isinstance(dataloader, DataLoader) or dataloader.num_workers == 0 or dataloader.batch_size is None \
+            or type(dataloader.sampler) not in samplers:
+            return dataloader
+
+        def signature(loader):
+            sampler = loader.sampler
+            sampler_args = [getattr(sampler, key, None) for key in ['num_replicas', 'rank', 'shuffle', 'seed', 'drop_last']]
+            return (id(loader.dataset), loader.batch_size, loader.drop_last, loader.collate_fn, loader.num_workers,
+                    loader.pin_memory, type(sampler), sampler_args)
+
+        if previous is not None and signature(previous) == signature(dataloader):
+            if isinstance(dataloader.sampler, DistributedSampler):
+                previous.sampler.set_epoch(dataloader.sampler.epoch)
+            return previous
+
+        return DataLoader(
+            dataloader.dataset,
+            batch_size=dataloader.batch_size,
+            sampler=dataloader.sampler,
+            num_workers=dataloader.num_workers,
+            collate_fn=dataloader.collate_fn,
+            pin_memory=dataloader.pin_memory,
+            drop_last=dataloader.drop_last,
+            timeout=dataloader.timeout,
+            worker_init_fn=dataloader.worker_init_fn,
+            multiprocessing_context=dataloader.multiprocessing_context,
+            generator=dataloader.generator,
+            prefetch_factor=dataloader.prefetch_factor,
+            persistent_workers=True,
+        )
+
+    def _distributed_evaluate(self):
+        return is_initialized() and get_world_size() > 1 and self.config['runner'].get('distributed_evaluate', False)
+
+    def _shard_dataloader(self, dataloader):
+        """Take every world_size-th batch of the dataloader, and return the global batch ids of them"""
+        batches = list(dataloader.batch_sampler)
+        global_batch_ids = list(range(get_rank(), len(batches), get_world_size()))
+        sharded = DataLoader(
+            dataloader.dataset,
+            batch_sampler=[batches[batch_id] for batch_id in global_batch_ids],
+            num_workers=dataloader.num_workers,
+            collate_fn=dataloader.collate_fn,
+            pin_memory=dataloader.pin_memory,
+        )
+        return sharded, global_batch_ids
+
+    @staticmethod
+    def _gather_records(batch_records):
+        """Gather the (batch_id, records) of all the ranks to the leader, and merge them in the batch order"""
+        batch_records = [
+            (batch_id, {key: [value.cpu() if torch.is_tensor(value) else value for value in values] for key, values in records.items()})
+            for batch_id, records in batch_records
+        ]
+        gathered = [None] * get_world_size() if is_leader_process() else None
+        gather_object(batch_records, gathered, dst=0)
+
+        batch_ids = []
+        records = defaultdict(list)
+        if is_leader_process():
+            for batch_id, batch_record in sorted(sum(gathered, []), key=lambda item: item[0]):
+                batch_ids.append(batch_id)
+                for key, values in batch_record.items():
+                    records[key] += values
+        return batch_ids, records
+
     def evaluate(self, split=None, logger=None, global_step=0):
-        """evaluate function will always be called on a single process even during distributed training"""
+        """
+        evaluate function is called on a single process during distributed training, unless
+        runner.distributed_evaluate is set. In that case, all the processes evaluate their own
+        shards of the batches together, and the records are gathered to the leader process for
+        log_records. The downstream experts should only append (or extend) the lists in records
+        """
 
         # When this member function is called directly by command line
         not_during_training = split is None and logger is None and global_step == 0
@@ -459,13 +612,27 @@ class Runner():
         evaluate_ratio = float(self.config["runner"].get("evaluate_ratio", 1))
         evaluate_steps = round(len(dataloader) * evaluate_ratio)
 
+        total_batch_num = len(dataloader)
+        distributed = self._distributed_evaluate()
+        if distributed:
+            dataloader, global_batch_ids = self._shard_dataloader(dataloader)
+            batch_records = []
+        else:
+            global_batch_ids = range(total_batch_num)
+
         batch_ids = []
         records = defaultdict(list)
-        for batch_id, (wavs, *others) in enumerate(tqdm(dataloader, dynamic_ncols=True, desc=split, total=evaluate_steps)):
+        prefetcher = DevicePrefetcher(dataloader, self.args.device, _move_wavs)
+        disable = distributed and not is_leader_process()
+        for batch_id, (wavs, *others) in zip(global_batch_ids, tqdm(prefetcher, dynamic_ncols=True, desc=split, total=evaluate_steps, disable=disable)):
             if batch_id > evaluate_steps:
                 break
 
-            wavs = [torch.FloatTensor(wav).to(self.args.device) for wav in wavs]
+            if distributed:
+                # keep the records of each batch, so they can be merged in the batch order
+                records = defaultdict(list)
+                batch_records.append((batch_id, records))
+
             with torch.no_grad():
                 features = self.upstream.model(wavs)
                 features = self.featurizer.model(wavs, features)
@@ -477,14 +644,19 @@ class Runner():
                 )
                 batch_ids.append(batch_id)
 
-        save_names = self.downstream.model.log_records(
-            split,
-            records = records,
-            logger = logger,
-            global_step = global_step,
-            batch_ids = batch_ids,
-            total_batch_num = len(dataloader),
-        )
+        save_names = []
+        if distributed:
+            batch_ids, records = self._gather_records(batch_records)
+
+        if is_leader_process() or not distributed:
+            save_names = self.downstream.model.log_records(
+                split,
+                records = records,
+                logger = logger,
+                global_step = global_step,
+                batch_ids = batch_ids,
+                total_batch_num = total_batch_num,
+            )
         batch_ids = []
         records = defaultdict(list)
 
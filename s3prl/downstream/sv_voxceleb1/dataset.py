@@ -17,6 +17,7 @@ from librosa.util import find_files
 from joblib.parallel import Parallel, delayed
 from torch.utils.data import DataLoader, Dataset
 from torchaudio.sox_effects import apply_effects_file
+from s3prl.util.audio_cache import SharedAudioCache
 
 
 EFFECTS = [
@@ -28,8 +29,9 @@ EFFECTS = [
 
 # Voxceleb 2 Speaker verification
 class SpeakerVerifi_train(Dataset):
-    def __init__(self, vad_config, key_list, file_path, meta_data, max_timestep=None, n_jobs=12):
+    def __init__(self, vad_config, key_list, file_path, meta_data, max_timestep=None, n_jobs=12, cache: SharedAudioCache = None):
         self.roots = file_path
+        self.cache = cache
         self.root_key = key_list
         self.max_timestep = max_timestep
         self.vad_c = vad_config 
@@ -70,8 +72,16 @@ class SpeakerVerifi_train(Dataset):
     
     def __getitem__(self, idx):
         path = self.dataset[idx]
-        wav, _ = apply_effects_file(str(path), EFFECTS)
-        wav = wav.squeeze(0)
+        # EFFECTS are deterministic, so the processed waveform can be cached
+        cached = None if self.cache is None else self.cache.get(str(path))
+        if cached is None:
+            wav, sr = apply_effects_file(str(path), EFFECTS)
+            wav = wav.squeeze(0)
+            if self.cache is not None:
+                self.cache.put(str(path), wav.numpy(), sr)
+        else:
+            # memory-mapped, only the cropped part is read below
+            wav = cached[0]
         length = wav.shape[0]
         
         if self.max_timestep != None:
@@ -79,6 +89,9 @@ class SpeakerVerifi_train(Dataset):
                 start = random.randint(0, int(length - self.max_timestep))
                 wav = wav[start : start + self.max_timestep]
 
+        if not torch.is_tensor(wav):
+            wav = torch.from_numpy(np.array(wav))
+
         tags = Path(path).parts[-3:]
         utterance_id = "-".join(tags).replace(".wav", "")
         label = self.all_speakers.index(tags[0])
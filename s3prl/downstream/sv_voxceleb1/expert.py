@@ -27,6 +27,7 @@ from torch.distributed import is_initialized, get_rank, get_world_size
 #-------------#
 from s3prl.utility.helper import is_leader_process
 from .model import Model, AMSoftmaxLoss, AAMSoftmaxLoss, SoftmaxLoss, UtteranceExtractor
+from s3prl.util.audio_cache import SharedAudioCache
 from .dataset import SpeakerVerifi_train, SpeakerVerifi_test
 from .utils import EER
 
@@ -65,6 +66,8 @@ class DownstreamExpert(nn.Module):
             "meta_data": self.datarc['train_meta_data'],
             "max_timestep": self.datarc["max_timestep"],
         }
+        if self.datarc.get("audio_cache_gb") is not None:
+            train_config["cache"] = SharedAudioCache(round(self.datarc["audio_cache_gb"] * 2**30))
         self.train_dataset = SpeakerVerifi_train(**train_config)
 
         dev_config = {
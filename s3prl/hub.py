@@ -1,54 +1,322 @@
-from s3prl.downstream.timit_phone.hubconf import timit_posteriorgram
-from s3prl.upstream.apc.hubconf import *
-from s3prl.upstream.ast.hubconf import *
-from s3prl.upstream.audio_albert.hubconf import *
-from s3prl.upstream.baseline.hubconf import *
-from s3prl.upstream.byol_a.hubconf import *
-from s3prl.upstream.byol_s.hubconf import *
-from s3prl.upstream.cpc.hubconf import *
-from s3prl.upstream.data2vec.hubconf import *
-from s3prl.upstream.decoar2.hubconf import *
-from s3prl.upstream.decoar.hubconf import *
-from s3prl.upstream.decoar_layers.hubconf import *
-from s3prl.upstream.distiller.hubconf import *
-from s3prl.upstream.espnet_hubert.hubconf import *
-from s3prl.upstream.example.hubconf import *
-from s3prl.upstream.hf_hubert.hubconf import *
-from s3prl.upstream.hf_wav2vec2.hubconf import *
-from s3prl.upstream.hubert.hubconf import *
-from s3prl.upstream.lighthubert.hubconf import *
-from s3prl.upstream.log_stft.hubconf import *
-from s3prl.upstream.mae_ast.hubconf import *
-from s3prl.upstream.mockingjay.hubconf import *
-from s3prl.upstream.mos_prediction.hubconf import *
-from s3prl.upstream.multires_hubert.hubconf import *
-from s3prl.upstream.npc.hubconf import *
-from s3prl.upstream.pase.hubconf import *
-from s3prl.upstream.passt.hubconf import *
-from s3prl.upstream.roberta.hubconf import *
-from s3prl.upstream.ssast.hubconf import *
-from s3prl.upstream.tera.hubconf import *
-from s3prl.upstream.unispeech_sat.hubconf import *
-from s3prl.upstream.vggish.hubconf import *
-from s3prl.upstream.vq_apc.hubconf import *
-from s3prl.upstream.vq_wav2vec.hubconf import *
-from s3prl.upstream.wav2vec2.hubconf import *
-from s3prl.upstream.wav2vec.hubconf import *
-from s3prl.upstream.wavlm.hubconf import *
-
-
-def options(only_registered_ckpt: bool = False):
+"""
+The registry of all the upstream entries
+
+Each hubconf is only imported when one of its entries is first requested,
+so importing this module (and listing the entries with :obj:`options`)
+does not import any model code or optional dependency.
+
+Authors:
+  * Leo 2022
+"""
+
+import importlib
+from typing import List
+
+__all__ = [
+    "options",
+]
+
+# NOTE: To register a new upstream, add its hubconf module and entry names here.
+# The entries are the callable variables without the underscore prefix in the hubconf.
+# When the same entry name is registered by multiple hubconfs, the latter one is used.
+_HUBCONF_ENTRIES = {
+    "s3prl.downstream.timit_phone.hubconf": [
+        "timit_posteriorgram",
+    ],
+    "s3prl.upstream.apc.hubconf": [
+        "apc_local",
+        "apc_url",
+        "apc",
+        "apc_360hr",
+        "apc_960hr",
+    ],
+    "s3prl.upstream.ast.hubconf": [
+        "ast",
+    ],
+    "s3prl.upstream.audio_albert.hubconf": [
+        "audio_albert_local",
+        "audio_albert_url",
+        "audio_albert",
+        "audio_albert_960hr",
+        "audio_albert_logMelBase_T_share_AdamW_b32_1m_960hr_drop1",
+    ],
+    "s3prl.upstream.baseline.hubconf": [
+        "baseline_local",
+        "baseline",
+        "spectrogram",
+        "fbank",
+        "fbank_no_cmvn",
+        "mfcc",
+        "mel",
+        "linear",
+    ],
+    "s3prl.upstream.byol_a.hubconf": [
+        "byol_a_2048",
+        "byol_a_1024",
+        "byol_a_512",
+    ],
+    "s3prl.upstream.byol_s.hubconf": [
+        "byol_s_default",
+        "byol_s_cvt",
+        "byol_s_resnetish34",
+    ],
+    "s3prl.upstream.cpc.hubconf": [
+        "cpc_local",
+        "cpc_url",
+        "modified_cpc",
+    ],
+    "s3prl.upstream.data2vec.hubconf": [
+        "data2vec_custom",
+        "data2vec_local",
+        "data2vec_url",
+        "data2vec",
+        "data2vec_base_960",
+        "data2vec_large_ll60k",
+    ],
+    "s3prl.upstream.decoar2.hubconf": [
+        "decoar2_custom",
+        "decoar2_local",
+        "decoar2_url",
+        "decoar2",
+    ],
+    "s3prl.upstream.decoar.hubconf": [
+        "decoar_custom",
+        "decoar_local",
+        "decoar_url",
+        "decoar",
+    ],
+    "s3prl.upstream.decoar_layers.hubconf": [
+        "decoar_layers_custom",
+        "decoar_layers_local",
+        "decoar_layers_url",
+        "decoar_layers",
+    ],
+    "s3prl.upstream.distiller.hubconf": [
+        "distiller_local",
+        "distiller_url",
+        "distilhubert",
+        "distilhubert_base",
+    ],
+    "s3prl.upstream.espnet_hubert.hubconf": [
+        "espnet_hubert_custom",
+        "espnet_hubert_local",
+        "cvhubert",
+        "wavlablm_ek_40k",
+        "wavlablm_ms_40k",
+        "wavlablm_mk_40k",
+        "espnet_hubert_base_iter1",
+        "espnet_hubert_base_iter0",
+        "espnet_hubert_large_gs_ll60k",
+    ],
+    "s3prl.upstream.example.hubconf": [
+        "customized_upstream",
+    ],
+    "s3prl.upstream.hf_hubert.hubconf": [
+        "hf_hubert_custom",
+    ],
+    "s3prl.upstream.hf_wav2vec2.hubconf": [
+        "hf_wav2vec2_custom",
+    ],
+    "s3prl.upstream.hubert.hubconf": [
+        "hubert_custom",
+        "hubert_local",
+        "hubert_url",
+        "hubert",
+        "hubert_base",
+        "hubert_large_ll60k",
+        "hubert_base_robust_mgr",
+        "mhubert_base_vp_en_es_fr_it3",
+        "contentvec",
+        "contentvec_km100",
+        "contentvec_km500",
+        "ms_hubert",
+    ],
+    "s3prl.upstream.lighthubert.hubconf": [
+        "lighthubert_local",
+        "lighthubert_url",
+        "lighthubert",
+        "lighthubert_small",
+        "lighthubert_base",
+        "lighthubert_stage1",
+    ],
+    "s3prl.upstream.log_stft.hubconf": [
+        "stft_mag",
+    ],
+    "s3prl.upstream.mae_ast.hubconf": [
+        "mae_ast_local",
+        "mae_ast_url",
+        "mae_ast_frame",
+        "mae_ast_patch",
+    ],
+    "s3prl.upstream.mockingjay.hubconf": [
+        "mockingjay_local",
+        "mockingjay_url",
+        "mockingjay",
+        "mockingjay_origin",
+        "mockingjay_100hr",
+        "mockingjay_960hr",
+        "mockingjay_logMelBase_T_AdamW_b32_200k_100hr",
+        "mockingjay_logMelLinearLarge_T_AdamW_b32_500k_360hr_drop1",
+        "mockingjay_logMelBase_T_AdamW_b32_1m_960hr",
+        "mockingjay_logMelBase_T_AdamW_b32_1m_960hr_drop1",
+        "mockingjay_logMelBase_T_AdamW_b32_1m_960hr_seq3k",
+    ],
+    "s3prl.upstream.mos_prediction.hubconf": [
+        "mos_wav2vec2_local",
+        "mos_wav2vec2_url",
+        "mos_wav2vec2",
+        "mos_tera_local",
+        "mos_tera_url",
+        "mos_tera",
+        "mos_apc_local",
+        "mos_apc_url",
+        "mos_apc",
+    ],
+    "s3prl.upstream.multires_hubert.hubconf": [
+        "multires_hubert_custom",
+        "multires_hubert_local",
+        "multires_hubert_base",
+        "multires_hubert_large",
+        "multires_hubert_multilingual_base",
+        "multires_hubert_multilingual_large400k",
+        "multires_hubert_multilingual_large600k",
+    ],
+    "s3prl.upstream.npc.hubconf": [
+        "npc_local",
+        "npc_url",
+        "npc",
+        "npc_360hr",
+        "npc_960hr",
+    ],
+    "s3prl.upstream.pase.hubconf": [
+        "pase_local",
+        "pase_url",
+        "pase_plus",
+    ],
+    "s3prl.upstream.passt.hubconf": [
+        "passt_base",
+        "passt_base2level",
+        "passt_base2levelmel",
+        "passt_base20sec",
+        "passt_base30sec",
+        "passt_hop100base",
+        "passt_hop100base2lvl",
+        "passt_hop100base2lvlmel",
+        "passt_hop160base",
+        "passt_hop160base2lvl",
+        "passt_hop160base2lvlmel",
+    ],
+    "s3prl.upstream.roberta.hubconf": [
+        "vq_wav2vec_kmeans_roberta",
+        "discretebert",
+    ],
+    "s3prl.upstream.ssast.hubconf": [
+        "ssast_frame_base",
+        "ssast_patch_base",
+    ],
+    "s3prl.upstream.tera.hubconf": [
+        "tera_local",
+        "tera_url",
+        "tera",
+        "tera_100hr",
+        "tera_960hr",
+        "tera_logMelBase_T_F_AdamW_b32_200k_100hr",
+        "tera_logMelBase_T_F_M_AdamW_b32_200k_100hr",
+        "tera_logMelBase_T_F_AdamW_b32_1m_960hr",
+        "tera_logMelBase_T_F_AdamW_b32_1m_960hr_drop1",
+        "tera_logMelBase_T_F_AdamW_b32_1m_960hr_seq3k",
+        "tera_logMelBase_T_F_M_AdamW_b32_1m_960hr_drop1",
+        "tera_fbankBase_T_F_AdamW_b32_200k_100hr",
+    ],
+    "s3prl.upstream.unispeech_sat.hubconf": [
+        "unispeech_sat_local",
+        "unispeech_sat_url",
+        "unispeech_sat",
+        "unispeech_sat_base",
+        "unispeech_sat_base_plus",
+        "unispeech_sat_large",
+    ],
+    "s3prl.upstream.vggish.hubconf": [
+        "vggish",
+    ],
+    "s3prl.upstream.vq_apc.hubconf": [
+        "vq_apc_url",
+        "vq_apc",
+        "vq_apc_360hr",
+        "vq_apc_960hr",
+    ],
+    "s3prl.upstream.vq_wav2vec.hubconf": [
+        "vq_wav2vec_custom",
+        "vq_wav2vec",
+        "vq_wav2vec_gumbel",
+        "vq_wav2vec_kmeans",
+    ],
+    "s3prl.upstream.wav2vec2.hubconf": [
+        "wav2vec2_local",
+        "wav2vec2_url",
+        "wav2vec2_custom",
+        "wav2vec2",
+        "wav2vec2_base_960",
+        "wav2vec2_large_960",
+        "wav2vec2_large_ll60k",
+        "wav2vec2_large_lv60_cv_swbd_fsh",
+        "xlsr_53",
+        "xls_r_300m",
+        "xls_r_1b",
+        "xls_r_2b",
+        "wav2vec2_conformer_relpos",
+        "wav2vec2_conformer_rope",
+        "wav2vec2_large_voxpopuli_100k",
+        "wav2vec2_base_s2st_es_voxpopuli",
+        "wav2vec2_conformer_large_s2st_es_voxpopuli",
+        "wav2vec2_base_s2st_en_librilight",
+        "wav2vec2_conformer_large_s2st_en_librilight",
+    ],
+    "s3prl.upstream.wav2vec.hubconf": [
+        "wav2vec_custom",
+        "wav2vec_local",
+        "wav2vec_url",
+        "wav2vec",
+        "wav2vec_large",
+    ],
+    "s3prl.upstream.wavlm.hubconf": [
+        "wavlm_local",
+        "wavlm_url",
+        "wavlm",
+        "wavlm_base",
+        "wavlm_base_plus",
+        "wavlm_large",
+    ],
+}
+
+_ENTRY_TO_MODULE = {
+    name: module for module, names in _HUBCONF_ENTRIES.items() for name in names
+}
+
+
+def options(only_registered_ckpt: bool = False) -> List[str]:
     all_options = []
-    for name, value in globals().items():
-        torch_hubconf_policy = not name.startswith("_") and callable(value)
-        if torch_hubconf_policy and name != "options":
-            if only_registered_ckpt and (
-                name.endswith("_local")
-                or name.endswith("_url")
-                or name.endswith("_gdriveid")
-                or name.endswith("_custom")
-            ):
-                continue
-            all_options.append(name)
+    for name in _ENTRY_TO_MODULE:
+        if only_registered_ckpt and (
+            name.endswith("_local")
+            or name.endswith("_url")
+            or name.endswith("_gdriveid")
+            or name.endswith("_custom")
+        ):
+            continue
+        all_options.append(name)
 
     return all_options
+
+
+def __getattr__(name: str):
+    if name not in _ENTRY_TO_MODULE:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    entry = getattr(importlib.import_module(_ENTRY_TO_MODULE[name]), name)
+    globals()[name] = entry
+    return entry
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_ENTRY_TO_MODULE.keys()))
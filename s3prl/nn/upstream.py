@@ -5,6 +5,9 @@ Authors:
   * Leo 2022
 """
 
+import functools
+import math
+from contextlib import nullcontext
 from typing import List
 
 import torch
@@ -13,15 +16,23 @@ import torch.nn.functional as F
 
 from s3prl import hub
 from s3prl.util.pseudo_data import get_pseudo_wavs
+from s3prl.util.quantization import quantize_upstream
+from s3prl.util.upstream_metadata import get_metadata_key, load_metadata, save_metadata
 
 __all__ = [
     "S3PRLUpstream",
     "Featurizer",
     "UpstreamDownstreamModel",
+    "weighted_sum",
 ]
 
 MIN_SECOND = 0.05
 SAMPLE_RATE = 16000
+PRECISIONS = {
+    "fp32": None,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
 
 
 def randomize_upstream(upstream: nn.Module):
@@ -49,7 +60,7 @@ class S3PRLUpstream(nn.Module):
 
         refresh (bool): (default, False)
             If false, only downlaod checkpoint if not yet downloaded before.
-            If true, force to re-download the checkpoint.
+            If true, force to re-download the checkpoint and re-compute the cached metadata.
 
         extra_conf (dict): (default, None)
             The extra arguments for each specific upstream, the available options are
@@ -58,6 +69,45 @@ class S3PRLUpstream(nn.Module):
         randomize (bool): (default, False)
             If True, randomize the upstream model
 
+        max_batch_samples (int): (default, None)
+            If given, :code:`forward` sorts the batch by :code:`wavs_len` and runs it as
+            several length-homogeneous micro-batches, each has at most this number of
+            (padded) samples. The results are returned in the original order and padded
+            layout, so this is transparent to the callers except that the padded frames
+            are zeros. Reduces the computation on the padding when the lengths in a
+            batch vary a lot
+
+        chunk_sec (float): (default, None)
+            If given, the utterances longer than this are split into overlapping windows
+            of (at most) this length. The windows are forwarded in micro-batches under
+            :code:`max_batch_samples`, or by default, under the samples of the batch with
+            every utterance cut to :code:`chunk_sec`. The per-layer hidden states of the
+            windows are stitched by the downsample rates, so the number of frames is the
+            same as forwarding the whole utterances, while the memory and the attention
+            cost only depend on the window length. See :code:`chunk_overlap_sec`
+
+        chunk_overlap_sec (float): (default, 1.0)
+            The context on each side of the kept part of a window. Should at least cover the
+            receptive field of the convolutional layers (e.g. 400 samples for wav2vec2),
+            and more context makes the results closer to the non-chunked ones. Must be
+            less than half of :code:`chunk_sec`, so each window keeps some frames
+
+        precision (str): (default, "fp32")
+            "fp32", "bf16" or "fp16". See :obj:`set_precision`
+
+        quantize (str): (default, None)
+            "dynamic_int8" to quantize the Linear layers in the transformer stack for
+            the CPU inference. The quantized upstream only runs on CPU and is not
+            trainable. The quantized weights are cached on disk like the metadata.
+            See :obj:`s3prl.util.quantization`
+
+    .. note::
+
+        The number of layers and the hidden sizes are found by a forward pass with pseudo
+        waveforms at the first construction of an upstream, and are then cached on disk
+        (see :obj:`s3prl.util.upstream_metadata`) keyed by the upstream name, the checkpoint
+        and :code:`extra_conf`. The later constructions do not run any forward pass.
+
     .. note::
 
         When using **S3PRLUpstream** with :code:`refresh=True` and multiprocessing (e.g. DDP),
@@ -108,6 +158,11 @@ class S3PRLUpstream(nn.Module):
         normalize: bool = False,
         extra_conf: dict = None,
         randomize: bool = False,
+        max_batch_samples: int = None,
+        chunk_sec: float = None,
+        chunk_overlap_sec: float = 1.0,
+        precision: str = "fp32",
+        quantize: str = None,
     ):
         super().__init__()
         upstream_conf = {"refresh": refresh, **(extra_conf or {})}
@@ -119,17 +174,44 @@ class S3PRLUpstream(nn.Module):
         if randomize:
             randomize_upstream(self.upstream)
 
-        self.normalize = normalize
+        if chunk_sec is not None and chunk_sec <= 2 * chunk_overlap_sec:
+            raise ValueError(
+                f"chunk_sec ({chunk_sec}) should be larger than 2 * chunk_overlap_sec "
+                f"({chunk_overlap_sec}), otherwise each window only keeps a single frame"
+            )
 
-        self.upstream.eval()
-        with torch.no_grad():
-            hs = self.upstream(get_pseudo_wavs())["hidden_states"]
+        self.normalize = normalize
+        self.max_batch_samples = max_batch_samples
+        self.chunk_sec = chunk_sec
+        self.chunk_overlap_sec = chunk_overlap_sec
+        self._max_layer = None
+        self._layer_selections = None
+
+        metadata_key = get_metadata_key(
+            name=name, path_or_url=path_or_url, extra_conf=extra_conf
+        )
+        metadata = None if refresh else load_metadata(metadata_key)
+        if metadata is None:
+            metadata = self._probe_metadata()
+            save_metadata(metadata_key, metadata)
         self.upstream.train()
-        self._num_layers = len(hs)
 
-        self._hidden_sizes = []
-        for h in hs:
-            self._hidden_sizes.append(h.size(-1))
+        self.set_precision(precision)
+        self.quantize = quantize
+        if quantize is not None:
+            quantized_key = None
+            if not randomize:
+                quantized_key = get_metadata_key(
+                    name=name,
+                    path_or_url=path_or_url,
+                    extra_conf=extra_conf,
+                    quantize=quantize,
+                    torch_version=torch.__version__,
+                )
+            quantize_upstream(self.upstream, quantize, cache_key=quantized_key)
+
+        self._num_layers = metadata["num_layers"]
+        self._hidden_sizes = metadata["hidden_sizes"]
 
         downsample_rates = self.upstream.get_downsample_rates("hidden_states")
         if isinstance(downsample_rates, int):
@@ -139,6 +221,16 @@ class S3PRLUpstream(nn.Module):
         else:
             raise ValueError
 
+    def _probe_metadata(self) -> dict:
+        self.upstream.eval()
+        with torch.no_grad():
+            hs = self.upstream(get_pseudo_wavs())["hidden_states"]
+
+        return {
+            "num_layers": len(hs),
+            "hidden_sizes": [h.size(-1) for h in hs],
+        }
+
     @property
     def num_layers(self) -> int:
         """
@@ -163,6 +255,89 @@ class S3PRLUpstream(nn.Module):
         """
         return self._hidden_sizes
 
+    @property
+    def max_layer(self) -> int:
+        """
+        The largest layer id (0-index) to forward. None means all the layers are forwarded.
+        """
+        return self._max_layer
+
+    def set_max_layer(self, max_layer: int = None):
+        """
+        Only forward the hidden states up to :code:`max_layer` (0-index), so
+        :code:`forward` returns :code:`max_layer + 1` layers of hidden states.
+        The upstreams supporting early exit (e.g. wav2vec2, HuBERT and WavLM)
+        skip the computation of the transformer blocks after it.
+
+        Args:
+            max_layer (int):
+                If None (default), forward all the layers
+        """
+        if max_layer is not None:
+            assert 0 <= max_layer < self.num_layers, f"{max_layer}, {self.num_layers}"
+            if max_layer == self.num_layers - 1:
+                max_layer = None
+
+        self._max_layer = max_layer
+        if hasattr(self.upstream, "set_max_layer"):
+            self.upstream.set_max_layer(max_layer)
+
+    @property
+    def layer_selections(self) -> List[int]:
+        """
+        The layer ids (0-index) returned by :code:`forward`. None means all the layers
+        """
+        return self._layer_selections
+
+    def set_layer_selections(self, layer_selections: List[int] = None):
+        """
+        Only return the hidden states of the given layers (0-index, in ascending order).
+        The upstream does not retain the other layers during its forward
+
+        Args:
+            layer_selections (List[int]):
+                If None (default), return all the layers
+        """
+        if layer_selections is not None:
+            layer_selections = sorted(set(layer_selections))
+            assert 0 <= layer_selections[0] and layer_selections[-1] < self.num_layers
+            if len(layer_selections) == self.num_layers:
+                layer_selections = None
+
+        self._layer_selections = layer_selections
+        if hasattr(self.upstream, "set_layer_selections"):
+            self.upstream.set_layer_selections(layer_selections)
+
+    def set_hidden_states_buffer(self, enable: bool = True):
+        """
+        Capture all the layers of hidden states into a single contiguous buffer
+        instead of retaining each layer's own (transposed) tensor.
+        See :obj:`s3prl.upstream.interfaces.UpstreamBase.set_hidden_states_buffer`
+        """
+        if hasattr(self.upstream, "set_hidden_states_buffer"):
+            self.upstream.set_hidden_states_buffer(enable)
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    def set_precision(self, precision: str = "fp32"):
+        """
+        Run the upstream under :code:`torch.autocast` with the reduced precision
+        ("bf16" or "fp16"), which keeps the numerically sensitive ops (e.g. the
+        normalizations, softmax and reductions) in fp32. The returned hidden states
+        are always in fp32. "bf16" works on both CPU and CUDA, while "fp16" is only
+        supported on CUDA. Use :code:`python3 -m s3prl.utility.allclose` to check the
+        per-layer deviation against fp32
+
+        Args:
+            precision (str): "fp32" (default), "bf16" or "fp16"
+        """
+        assert precision in PRECISIONS, f"{precision} is not in {list(PRECISIONS)}"
+        self._precision = precision
+        if hasattr(self.upstream, "set_precision"):
+            self.upstream.set_precision(precision)
+
     def _match_length(self, xs, target_max_len: int):
         xs_max_len = xs.size(1)
 
@@ -187,12 +362,168 @@ class S3PRLUpstream(nn.Module):
         Return:
             List[torch.FloatTensor], List[torch.LongTensor]
 
-            1. all the layers of hidden states: List[ (batch_size, max_seq_len, hidden_size) ]
+            1. all the layers (or the :obj:`layer_selections`) of hidden states:
+               List[ (batch_size, max_seq_len, hidden_size) ]
             2. the valid length for each hidden states: List[ (batch_size, ) ]
         """
         if wavs.dim() == 3:
             wavs = wavs.squeeze(-1)
 
+        if self.chunk_sec is not None and max(wavs_len) > self.chunk_sec * SAMPLE_RATE:
+            return self._forward_chunked(wavs, wavs_len)
+
+        if self.max_batch_samples is None or len(wavs) == 1:
+            return self._forward_batch(wavs, wavs_len)
+
+        micro_batches = self._micro_batches(wavs_len.tolist())
+        if len(micro_batches) == 1:
+            return self._forward_batch(wavs, wavs_len)
+
+        all_hs, all_lens = None, None
+        for indices in micro_batches:
+            indices = torch.LongTensor(indices).to(wavs_len.device)
+            max_wav_len = int(wavs_len[indices].max())
+            hs, hs_len = self._forward_batch(
+                wavs[indices.to(wavs.device), :max_wav_len], wavs_len[indices]
+            )
+
+            if all_hs is None:
+                all_hs = [[] for _ in hs]
+                all_lens = [h_len.new_zeros(len(wavs)) for h_len in hs_len]
+
+            for layer_id, (h, h_len) in enumerate(zip(hs, hs_len)):
+                all_hs[layer_id].append((indices, h))
+                all_lens[layer_id][indices] = h_len
+
+        for layer_id, micro_hs in enumerate(all_hs):
+            max_h_len = max(h.size(1) for _, h in micro_hs)
+            _, first_h = micro_hs[0]
+            h = first_h.new_zeros(len(wavs), max_h_len, first_h.size(-1))
+            for indices, micro_h in micro_hs:
+                h[indices.to(h.device), : micro_h.size(1)] = micro_h
+            all_hs[layer_id] = h
+
+        return all_hs, all_lens
+
+    def _micro_batches(
+        self, wavs_len: List[int], max_batch_samples: int = None
+    ) -> List[List[int]]:
+        """
+        Greedily group the longest utterances together under :code:`max_batch_samples`,
+        default to :code:`self.max_batch_samples`. Each micro-batch has at least one
+        utterance
+        """
+        max_batch_samples = max_batch_samples or self.max_batch_samples
+        indices = sorted(range(len(wavs_len)), key=lambda idx: -wavs_len[idx])
+        micro_batches = []
+        for idx in indices:
+            if len(micro_batches) > 0:
+                last = micro_batches[-1]
+                # the first utterance is the longest one in a micro-batch
+                padded_samples = (len(last) + 1) * wavs_len[last[0]]
+                if padded_samples <= max_batch_samples:
+                    last.append(idx)
+                    continue
+            micro_batches.append([idx])
+        return micro_batches
+
+    def _chunk_windows(self, wavs_len: List[int], unit: int):
+        """
+        Returns:
+            List[Tuple[int, int, int, int, int]]
+
+            (utterance id, window start, window end, kept start, kept end) in samples.
+            All the starts are multiples of :code:`unit`, so are the frame boundaries
+        """
+        chunk = int(self.chunk_sec * SAMPLE_RATE)
+        overlap = math.ceil(self.chunk_overlap_sec * SAMPLE_RATE / unit) * unit
+        hop = max((chunk - 2 * overlap) // unit * unit, unit)
+
+        windows = []
+        for utt_id, wav_len in enumerate(wavs_len):
+            if wav_len <= chunk:
+                windows.append((utt_id, 0, wav_len, 0, wav_len))
+                continue
+
+            for start in range(0, wav_len, hop):
+                end = min(start + hop, wav_len)
+                windows.append(
+                    (
+                        utt_id,
+                        max(start - overlap, 0),
+                        min(end + overlap, wav_len),
+                        start,
+                        end,
+                    )
+                )
+        return windows
+
+    def _forward_chunked(self, wavs: torch.FloatTensor, wavs_len: torch.LongTensor):
+        strides = [self.downsample_rates[idx] for idx in self._layer_ids()]
+        unit = functools.reduce(lambda x, y: x * y // math.gcd(x, y), strides)
+        windows = self._chunk_windows(wavs_len.tolist(), unit)
+
+        window_lens = [
+            window_end - window_start for _, window_start, window_end, *_ in windows
+        ]
+        max_batch_samples = self.max_batch_samples
+        if max_batch_samples is None:
+            # as much memory as forwarding the batch with every utterance cut to
+            # chunk_sec, no matter how long the utterances are
+            max_batch_samples = len(wavs) * int(self.chunk_sec * SAMPLE_RATE)
+        micro_batches = self._micro_batches(window_lens, max_batch_samples)
+
+        all_hs = None
+        for indices in micro_batches:
+            window_wavs = wavs.new_zeros(
+                len(indices), max(window_lens[idx] for idx in indices)
+            )
+            for batch_id, idx in enumerate(indices):
+                utt_id, window_start, window_end, _, _ = windows[idx]
+                window_wavs[batch_id, : window_end - window_start] = wavs[
+                    utt_id, window_start:window_end
+                ]
+            hs, _ = self._forward_batch(
+                window_wavs, torch.LongTensor([window_lens[idx] for idx in indices])
+            )
+
+            if all_hs is None:
+                all_hs = [
+                    h.new_zeros(
+                        len(wavs), math.ceil(int(max(wavs_len)) / stride), h.size(-1)
+                    )
+                    for h, stride in zip(hs, strides)
+                ]
+
+            # only the kept part of each window is retained
+            for h, all_h, stride in zip(hs, all_hs, strides):
+                for batch_id, idx in enumerate(indices):
+                    utt_id, window_start, _, kept_start, kept_end = windows[idx]
+                    start = kept_start // stride
+                    end = math.ceil(kept_end / stride)
+                    offset = window_start // stride
+                    all_h[utt_id, start:end] = h[
+                        batch_id, start - offset : end - offset
+                    ]
+
+        all_lens = [
+            torch.div(wavs_len - 1, stride, rounding_mode="floor") + 1
+            for stride in strides
+        ]
+        return all_hs, all_lens
+
+    def _layer_ids(self) -> List[int]:
+        if self.max_layer is None:
+            num_layers = self.num_layers
+        else:
+            num_layers = self.max_layer + 1
+
+        layer_ids = list(range(num_layers))
+        if self.layer_selections is not None:
+            layer_ids = [idx for idx in layer_ids if idx in self.layer_selections]
+        return layer_ids
+
+    def _forward_batch(self, wavs: torch.FloatTensor, wavs_len: torch.LongTensor):
         original_wavs_len = wavs_len
         if max(original_wavs_len) < MIN_SECOND * SAMPLE_RATE:
             padded_samples = int(MIN_SECOND * SAMPLE_RATE) - max(original_wavs_len)
@@ -206,22 +537,36 @@ class S3PRLUpstream(nn.Module):
         for wav, wav_len in zip(wavs, wavs_len):
             wavs_list.append(wav[:wav_len])
 
-        hidden_states = self.upstream(wavs_list)["hidden_states"]
+        layer_ids = self._layer_ids()
+        autocast_dtype = PRECISIONS[self.precision]
+        if autocast_dtype is None or hasattr(self.upstream, "set_precision"):
+            autocast = nullcontext()
+        else:
+            autocast = torch.autocast(wavs.device.type, dtype=autocast_dtype)
+
+        with autocast:
+            hidden_states = self.upstream(wavs_list)["hidden_states"]
         assert isinstance(hidden_states, (list, tuple))
-        assert (
-            len(hidden_states) == self.num_layers
-        ), f"{len(hidden_states)}, {self.num_layers}"
+        if not hasattr(self.upstream, "set_layer_selections"):
+            hidden_states = [hidden_states[idx] for idx in layer_ids]
+        hidden_states = hidden_states[: len(layer_ids)]
+        assert len(hidden_states) == len(
+            layer_ids
+        ), f"{len(hidden_states)}, {layer_ids}"
 
         max_wav_len = int(max(wavs_len))
         all_hs = []
         all_lens = []
-        for h, stride in zip(hidden_states, self.downsample_rates):
+        strides = [self.downsample_rates[idx] for idx in layer_ids]
+        for h, stride in zip(hidden_states, strides):
             expected_max_h_len = len(range(0, max_wav_len, stride))
             h = self._match_length(h, expected_max_h_len)
             assert h.size(1) == expected_max_h_len
 
             h_len = torch.div(original_wavs_len - 1, stride, rounding_mode="floor") + 1
             h = h[:, : max(h_len), :]
+            if autocast_dtype is not None:
+                h = h.float()
             if self.normalize:
                 h = F.layer_norm(h, h.shape[-1:])
 
@@ -231,6 +576,77 @@ class S3PRLUpstream(nn.Module):
         return all_hs, all_lens
 
 
+class _WeightedSum(torch.autograd.Function):
+    """
+    sum_i(weights[i] * f(hs[i])), where f is the layer norm or the identity.
+    The layers are accumulated one by one and only the inputs are saved for the
+    backward (the normalized layers are recomputed), so no tensor of the shape
+    (num_layers, batch_size, seq_len, hidden_size) is ever materialized
+    """
+
+    @staticmethod
+    def forward(ctx, weights, normalize, *hs):
+        ctx.normalize = normalize
+        ctx.save_for_backward(weights, *hs)
+
+        dtype = torch.promote_types(weights.dtype, hs[0].dtype)
+        weighted_hs = torch.zeros(hs[0].shape, dtype=dtype, device=hs[0].device)
+        for weight, h in zip(weights, hs):
+            if normalize:
+                h = F.layer_norm(h, h.shape[-1:])
+            weighted_hs.addcmul_(h, weight)
+        return weighted_hs
+
+    @staticmethod
+    def backward(ctx, grad):
+        weights, *hs = ctx.saved_tensors
+        grad_weights = torch.zeros_like(weights) if ctx.needs_input_grad[0] else None
+        grad_hs = []
+        for idx, (weight, h) in enumerate(zip(weights, hs)):
+            need_grad_h = ctx.needs_input_grad[2 + idx]
+            if ctx.normalize:
+                with torch.enable_grad():
+                    h = h.detach().requires_grad_(need_grad_h)
+                    normed_h = F.layer_norm(h, h.shape[-1:])
+            else:
+                normed_h = h
+
+            if grad_weights is not None:
+                grad_weights[idx] = (normed_h.detach() * grad).sum()
+
+            if not need_grad_h:
+                grad_hs.append(None)
+            elif ctx.normalize:
+                (grad_h,) = torch.autograd.grad(normed_h, h, (grad * weight).to(h))
+                grad_hs.append(grad_h)
+            else:
+                grad_hs.append((grad * weight).to(h))
+
+        return (grad_weights, None, *grad_hs)
+
+
+def weighted_sum(
+    hs: List[torch.FloatTensor], weights: torch.FloatTensor, normalize: bool = False
+):
+    """
+    The memory-lean equivalent of
+    :code:`(weights.view(-1, 1, 1, 1) * torch.stack(hs)).sum(dim=0)`,
+    which never stacks the hidden states
+
+    Args:
+        hs (List[torch.FloatTensor]): List[ (batch_size, seq_len, hidden_size) ]
+        weights (torch.FloatTensor): (len(hs), ), usually softmax-normalized
+        normalize (bool): whether to apply layer norm on each hidden state before the sum
+
+    Return:
+        torch.FloatTensor
+
+        (batch_size, seq_len, hidden_size)
+    """
+    assert len(hs) == len(weights) > 0
+    return _WeightedSum.apply(weights, normalize, *hs)
+
+
 class Featurizer(nn.Module):
     """
     Featurizer take the :obj:`S3PRLUpstream`'s multiple layer of hidden_states and
@@ -294,6 +710,9 @@ class Featurizer(nn.Module):
             else:
                 self.layer_selections = list(range(upstream.num_layers))
             self.weights = nn.Parameter(torch.zeros(len(self.layer_selections)))
+            self._max_layer = max(self.layer_selections)
+        else:
+            self._max_layer = 0
 
     @property
     def output_size(self) -> int:
@@ -309,21 +728,21 @@ class Featurizer(nn.Module):
         """
         return self._downsample_rate
 
+    @property
+    def max_layer(self) -> int:
+        """
+        The largest layer id (0-index) consumed by this Featurizer. The hidden states
+        after it are not used, so the upstream does not need to compute them.
+        See :obj:`S3PRLUpstream.set_max_layer`
+        """
+        return self._max_layer
+
     def _weighted_sum(self, all_hs, all_lens):
         assert len(all_hs) == len(all_lens) > 1
         for l in all_lens[1:]:
             torch.allclose(all_lens[0], l)
-        stacked_hs = torch.stack(all_hs, dim=0)
-
-        if self.normalize:
-            stacked_hs = F.layer_norm(stacked_hs, (stacked_hs.shape[-1],))
-
-        _, *origin_shape = stacked_hs.shape
-        stacked_hs = stacked_hs.view(len(self.layer_selections), -1)
         norm_weights = F.softmax(self.weights, dim=-1)
-        weighted_hs = (norm_weights.unsqueeze(-1) * stacked_hs).sum(dim=0)
-        weighted_hs = weighted_hs.view(*origin_shape)
-
+        weighted_hs = weighted_sum(all_hs, norm_weights, self.normalize)
         return weighted_hs, all_lens[0]
 
     def forward(
@@ -343,13 +762,25 @@ class Featurizer(nn.Module):
         if len(all_hs) == 1:
             return all_hs[0], all_lens[0]
 
-        all_hs = [h for idx, h in enumerate(all_hs) if idx in self.layer_selections]
-        all_lens = [l for idx, l in enumerate(all_lens) if idx in self.layer_selections]
+        # the upstream might only return the selected layers already
+        # (see :obj:`S3PRLUpstream.set_layer_selections`)
+        if len(all_hs) != len(self.layer_selections):
+            all_hs = [h for idx, h in enumerate(all_hs) if idx in self.layer_selections]
+            all_lens = [
+                l for idx, l in enumerate(all_lens) if idx in self.layer_selections
+            ]
         hs, hs_len = self._weighted_sum(all_hs, all_lens)
         return hs, hs_len
 
 
 class UpstreamDownstreamModel(nn.Module):
+    """
+    Chain the upstream, featurizer and downstream together. The upstream only
+    forwards and returns the layers consumed by the featurizer (see :obj:`Featurizer.max_layer`
+    and :obj:`S3PRLUpstream.set_layer_selections`). When the upstream is frozen, its
+    hidden states are captured into a single contiguous buffer
+    """
+
     def __init__(
         self,
         upstream: S3PRLUpstream,
@@ -363,6 +794,15 @@ class UpstreamDownstreamModel(nn.Module):
         self.downstream = downstream
         self.upstream_trainable = upstream_trainable
 
+        if hasattr(upstream, "set_max_layer") and hasattr(featurizer, "max_layer"):
+            upstream.set_max_layer(featurizer.max_layer)
+        if hasattr(upstream, "set_layer_selections") and hasattr(
+            featurizer, "layer_selections"
+        ):
+            upstream.set_layer_selections(featurizer.layer_selections)
+        if hasattr(upstream, "set_hidden_states_buffer") and not upstream_trainable:
+            upstream.set_hidden_states_buffer(True)
+
     @property
     def input_size(self):
         return 1
@@ -22,6 +22,7 @@ from s3prl.dataio.dataset import EncodeCategory, LoadAudio, get_info
 from s3prl.dataio.encoder.category import CategoryEncoder
 from s3prl.dataio.sampler import FixedBatchSizeBatchSampler
 from s3prl.nn.speaker_model import SuperbXvector
+from s3prl.util.audio_cache import SharedAudioCache
 
 from .run import ASV
 
@@ -270,6 +271,9 @@ class SuperbASV(ASV):
                 max_secs              (float) - If a waveform is longer than :code:`max_secs` seconds, \
                                         randomly crop the waveform into :code:`max_secs` seconds. \
                                         Default: None, no cropping
+                audio_cache_gb        (float) - Keep up to this size of the decoded waveforms \
+                                        in the shared memory across the epochs and the \
+                                        DataLoader workers. Default: None, no caching
                 ====================  ====================
 
                 for :code:`test` dictionary, no argument supported yet
@@ -318,14 +322,19 @@ class SuperbASV(ASV):
             class Config:
                 min_secs: float = None
                 max_secs: float = None
+                audio_cache_gb: float = None
 
             conf = build_dataset.get("train", {})
             conf = Config(**conf)
 
+            cache = None
+            if conf.audio_cache_gb is not None:
+                cache = SharedAudioCache(round(conf.audio_cache_gb * 2**30))
+
             csv = pd.read_csv(data_csv)
             wav_paths = csv["wav_path"].tolist()
             audio_loader = LoadAudio(
-                wav_paths, sox_effects=EFFECTS, max_secs=conf.max_secs
+                wav_paths, sox_effects=EFFECTS, max_secs=conf.max_secs, cache=cache
             )
 
             labels = csv["spk"].tolist()
@@ -15,24 +15,36 @@ import os
 import pickle
 import shutil
 import sys
+from contextlib import nullcontext
 from copy import deepcopy
 from dataclasses import dataclass
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 from time import time
 from typing import Dict, List, Union
 
 import omegaconf
 import torch
+import torch.distributed as dist
 import yaml
 from torch.utils.data import DataLoader
 from torch.utils.tensorboard.writer import SummaryWriter
 from tqdm import tqdm
 
 from s3prl.dataio.collate_fn import default_collate_fn
+from s3prl.dataio.prefetch import DevicePrefetcher
 from s3prl.dataio.sampler import DistributedBatchSamplerWrapper
-from s3prl.nn.upstream import Featurizer, S3PRLUpstream, UpstreamDownstreamModel
+from s3prl.nn.upstream import (
+    PRECISIONS,
+    SAMPLE_RATE,
+    Featurizer,
+    S3PRLUpstream,
+    UpstreamDownstreamModel,
+)
 from s3prl.task import Task
+from s3prl.util.benchmark import StepTimer
+from s3prl.util.checkpoint import AsyncCheckpointWriter
 from s3prl.util.override import parse_overrides
 from s3prl.util.seed import fix_random_seeds
 
@@ -81,15 +93,57 @@ def _force_cacheable(data: dict):
     return output
 
 
-def _to_device(data, device: str):
+def _to_device(data, device: str, non_blocking: bool = False):
     output = dict()
     for key, value in data.items():
         if isinstance(value, torch.Tensor):
-            value = value.to(device)
+            value = value.to(device, non_blocking=non_blocking)
         output[key] = value
     return output
 
 
+def _count_audio(batch: dict):
+    """
+    Return the number of the utterances and the total seconds of the input audio
+    """
+    if "x" not in batch:
+        return 0, 0.0
+    if "x_len" not in batch:
+        return len(batch["x"]), 0.0
+    return len(batch["x"]), float(torch.as_tensor(batch["x_len"]).sum()) / SAMPLE_RATE
+
+
+def _gather_batch_results(batch_results: list, world_size: int, rank: int):
+    """
+    Gather the cacheable results of all the ranks to rank 0, interleaved back into the
+    batch order before they were sharded with :code:`batches[rank::world_size]`.
+    Return None for the other ranks
+    """
+    gathered = [None] * world_size if rank == 0 else None
+    dist.gather_object(batch_results, gathered, dst=0)
+    if rank > 0:
+        return None
+
+    merged = []
+    for step in range(max(len(results) for results in gathered)):
+        for results in gathered:
+            if step < len(results):
+                merged.append(results[step])
+    return merged
+
+
+def _remove_outdated_ckpts(train_dir: Path, keep_num_ckpts: int):
+    ckpt_dirs = [key for key in os.listdir(train_dir) if key.startswith("step_")]
+    ckpt_dirs.sort(key=lambda stem: int(stem.split("_")[-1]))
+    for ckpt_dir in ckpt_dirs[: max(len(ckpt_dirs) - keep_num_ckpts, 0)]:
+        shutil.rmtree(train_dir / ckpt_dir)
+
+
+def _use_pin_memory(device: str) -> bool:
+    # the pinned batches make the non-blocking host-to-device copies asynchronous
+    return torch.device(device).type == "cuda" and torch.cuda.is_available()
+
+
 def _doc_default_config(cls: Problem):
     """
     This is used to layout the :code:`default_config` dictionary into yaml format
@@ -336,6 +390,14 @@ class Problem:
                 keep_num_ckpts              (int) - to prevent saving too many checkpoints, only save the :code:`keep_num_ckpts` \
                                                 latest checkpoints and delete the old ones.
                 use_scheduler               (bool) - whether to use the scheduler
+                timing_sync                 (bool) - the step time is broken down into the phases (data waiting, \
+                                                host-to-device copy, upstream, featurizer, downstream, backward, optimizer, \
+                                                evaluation and checkpoint) in TensorBoard and :code:`timing.json`. \
+                                                Set this to synchronize CUDA at the phase boundaries for the accurate \
+                                                GPU time, which slows down the training. See :obj:`s3prl.util.benchmark.StepTimer`
+                precision                   (str) - "fp32", "bf16" or "fp16". Run the forward under :code:`torch.autocast` \
+                                                with the reduced precision. "fp16" also scales the loss with \
+                                                :code:`torch.cuda.amp.GradScaler` and is only supported on CUDA
                 ==========================  ====================
 
             **others:
@@ -358,8 +420,13 @@ class Problem:
             seed: int = 0
             keep_num_ckpts: int = 2
             use_scheduler: bool = False
+            precision: str = "fp32"
+            timing_sync: bool = False
 
         conf = TrainConfig(**train)
+        assert (
+            conf.precision in PRECISIONS
+        ), f"{conf.precision} is not in {list(PRECISIONS)}"
 
         fix_random_seeds(conf.seed)
 
@@ -404,6 +471,12 @@ class Problem:
             else:
                 scheduler_state = None
 
+            scaler_state = None
+            if (resume_ckpt_dir / "scaler.pt").is_file():
+                scaler_state = torch.load(
+                    resume_ckpt_dir / "scaler.pt", map_location="cpu"
+                )
+
             with open(resume_ckpt_dir / "training_stats.yaml", "r") as f:
                 training_stats = yaml.load(f, Loader=yaml.FullLoader)
 
@@ -416,6 +489,7 @@ class Problem:
             task = self.build_task(model=model, **build_task_all_args_except_model)
             optimizer_state = None
             scheduler_state = None
+            scaler_state = None
             global_step = 0
             epoch = 0
             valid_best_metrics = dict()
@@ -442,6 +516,20 @@ class Problem:
             if scheduler_state:
                 scheduler.load_state_dict(scheduler_state)
 
+        autocast_dtype = PRECISIONS[conf.precision]
+        if autocast_dtype is None:
+            autocast = nullcontext()
+        else:
+            assert (
+                conf.precision != "fp16" or device.type == "cuda"
+            ), "fp16 training is only supported on CUDA, use bf16 instead"
+            autocast = torch.autocast(device.type, dtype=autocast_dtype)
+
+        # bf16 has the same exponent range as fp32, so only fp16 needs the loss scaling
+        scaler = torch.cuda.amp.GradScaler(enabled=conf.precision == "fp16")
+        if scaler_state and scaler.is_enabled():
+            scaler.load_state_dict(scaler_state)
+
         train_batch_sampler = DistributedBatchSamplerWrapper(
             train_batch_sampler,
             num_replicas=world_size,
@@ -452,6 +540,9 @@ class Problem:
             batch_sampler=train_batch_sampler,
             num_workers=num_workers,
             collate_fn=train_collate_fn,
+            pin_memory=_use_pin_memory(device),
+            # do not re-spawn the workers at every epoch
+            persistent_workers=num_workers > 0,
         )
 
         tqdm_file = sys.stderr if rank == 0 else open(os.devnull, "w")
@@ -472,6 +563,7 @@ class Problem:
             task,
             optimizer,
             scheduler,
+            scaler,
             build_model_all_args: dict,
             build_task_all_args_except_model: dict,
             save_model: dict,
@@ -492,9 +584,11 @@ class Problem:
                 save_task, task_ckpt_dir, build_task_all_args_except_model, task
             )
 
-            torch.save(optimizer.state_dict(), ckpts_dir / "optimizer.pt")
+            self._torch_save(optimizer.state_dict(), ckpts_dir / "optimizer.pt")
             if scheduler is not None:
-                torch.save(scheduler.state_dict(), ckpts_dir / "scheduler.pt")
+                self._torch_save(scheduler.state_dict(), ckpts_dir / "scheduler.pt")
+            if scaler.is_enabled():
+                self._torch_save(scaler.state_dict(), ckpts_dir / "scaler.pt")
 
             with (ckpts_dir / "training_stats.yaml").open("w") as f:
                 yaml.safe_dump(training_stats, f)
@@ -502,12 +596,29 @@ class Problem:
             with (ckpts_dir / "config.yaml").open("w") as f:
                 yaml.safe_dump(global_config, f)
 
+        timer = StepTimer(sync=conf.timing_sync)
+        timer_hooks = []
+        for name in ["upstream", "featurizer", "downstream"]:
+            module = getattr(task.model, name, None)
+            if isinstance(module, torch.nn.Module):
+                timer_hooks += timer.hook(module, name, parent="forward")
+
+        def _move_batch(batch, device):
+            timer.count(*_count_audio(batch))
+            return _to_device(batch, device, non_blocking=True)
+
+        ckpt_writer = AsyncCheckpointWriter()
         backward_steps = 0
         while pbar.n < pbar.total:
             train_batch_sampler.set_epoch(epoch),
             batch_results = []
             logger.info(f"Start epoch {epoch}")
-            for batch in train_dataloader:
+            for batch in timer.iterate(
+                DevicePrefetcher(
+                    train_dataloader, device, timer.wrap(_move_batch, "h2d")
+                ),
+                "data",
+            ):
                 # try/except block for forward/backward
                 try:
                     if pbar.n >= pbar.total:
@@ -515,9 +626,21 @@ class Problem:
                     global_step = pbar.n + 1
 
                     wrapped_task.train()
-                    batch = _to_device(batch, device)
-                    loss, cacheable = wrapped_task("train", **batch)
-                    (loss / conf.gradient_accumulate).backward()
+
+                    # only all-reduce the gradients on the last accumulated step
+                    if (
+                        world_size > 1
+                        and (backward_steps + 1) % conf.gradient_accumulate > 0
+                    ):
+                        sync_context = wrapped_task.no_sync()
+                    else:
+                        sync_context = nullcontext()
+
+                    with sync_context:
+                        with autocast, timer.phase("forward"):
+                            loss, cacheable = wrapped_task("train", **batch)
+                        with timer.phase("backward"):
+                            scaler.scale(loss / conf.gradient_accumulate).backward()
                     batch_results.append(_force_cacheable(cacheable))
 
                 except RuntimeError as e:
@@ -542,18 +665,48 @@ class Problem:
                 if backward_steps % conf.gradient_accumulate > 0:
                     continue
 
-                grad_norm = torch.nn.utils.clip_grad_norm_(
-                    wrapped_task.parameters(), conf.gradient_clipping
-                )
+                with timer.phase("optimizer"):
+                    scaler.unscale_(optimizer)
+                    grad_norm = torch.nn.utils.clip_grad_norm_(
+                        wrapped_task.parameters(), conf.gradient_clipping
+                    )
 
-                if math.isnan(grad_norm):
-                    logger.warning(f"[Runner] - grad norm is NaN at step {global_step}")
-                else:
-                    optimizer.step()
-                optimizer.zero_grad()
+                    if scaler.is_enabled():
+                        # skips the step and reduces the scale when the gradients overflow
+                        scaler.step(optimizer)
+                        scaler.update()
+                    elif math.isnan(grad_norm):
+                        logger.warning(
+                            f"[Runner] - grad norm is NaN at step {global_step}"
+                        )
+                    else:
+                        optimizer.step()
+                    optimizer.zero_grad()
+
+                    if conf.use_scheduler:
+                        scheduler.step()
+                timer.step()
 
-                if conf.use_scheduler:
-                    scheduler.step()
+                if global_step % conf.eval_step == 0:
+                    assert (
+                        valid_dataset is not None and valid_batch_sampler is not None
+                    ), f"valid dataset is not supported, please set train.eval_step to infinite"
+                    # all the ranks evaluate their shards, and only rank 0 gets the logs
+                    with timer.phase("eval"):
+                        valid_logs: dict = self.evaluate(
+                            evaluate,
+                            "valid",
+                            task,
+                            valid_dataset,
+                            valid_batch_sampler,
+                            valid_collate_fn,
+                            eval_batch,
+                            train_dir,
+                            device,
+                            num_workers,
+                            world_size=world_size,
+                            rank=rank,
+                        )
 
                 if rank > 0:
                     batch_results = []
@@ -578,27 +731,13 @@ class Problem:
                     logs = wrapped_task.reduction("train", batch_results)
                     _log_results("train", logs, tf_logger, global_step)
                     batch_results = []
+                    timer.log(tf_logger, global_step)
 
                 save_names = []
 
                 if global_step % conf.eval_step == 0:
-                    assert (
-                        valid_dataset is not None and valid_batch_sampler is not None
-                    ), f"valid dataset is not supported, please set train.eval_step to infinite"
-                    logs: dict = self.evaluate(
-                        evaluate,
-                        "valid",
-                        task,
-                        valid_dataset,
-                        valid_batch_sampler,
-                        valid_collate_fn,
-                        eval_batch,
-                        train_dir,
-                        device,
-                        num_workers,
-                    )
-                    _log_results("valid", logs, tf_logger, global_step)
-                    valid_metrics = {k: float(v) for k, v in logs.items()}
+                    _log_results("valid", valid_logs, tf_logger, global_step)
+                    valid_metrics = {k: float(v) for k, v in valid_logs.items()}
                     new_metric = valid_metrics[conf.valid_metric]
                     best_metric = valid_best_metrics.get(conf.valid_metric)
                     if best_metric is None:
@@ -612,50 +751,65 @@ class Problem:
                         save_names.append("valid_best")
 
                 if global_step % conf.save_step == 0:
-                    ckpt_dirs = [
-                        key for key in os.listdir(train_dir) if key.startswith("step_")
-                    ]
-                    ckpt_dirs.sort(key=lambda stem: int(stem.split("_")[-1]))
-                    if (
-                        conf.keep_num_ckpts is not None
-                        and len(ckpt_dirs) >= conf.keep_num_ckpts
-                    ):
-                        for ckpt_dir in ckpt_dirs[
-                            : len(ckpt_dirs) - conf.keep_num_ckpts + 1
-                        ]:
-                            shutil.rmtree(train_dir / ckpt_dir)
-
                     save_names.append(f"step_{global_step}")
 
-                for name in save_names:
+                if len(save_names) > 0:
                     training_stats = dict(
                         global_step=global_step,
                         epoch=epoch,
                         valid_best_metrics=valid_best_metrics,
                     )
-                    _save_ckpts_to_dir(
-                        train_dir / name,
-                        (
-                            task.module
-                            if isinstance(task, _DistributedDataParallel)
-                            else task
-                        ),
-                        optimizer,
-                        scheduler,
-                        build_model_all_args,
-                        build_task_all_args_except_model,
-                        save_model,
-                        save_task,
-                        training_stats,
-                        global_config,
-                    )
+                    # the checkpoint is written once in the background, and then
+                    # published to all the save_names
+                    with timer.phase("checkpoint"), ckpt_writer.checkpoint(
+                        [train_dir / name for name in save_names]
+                    ) as ckpts_dir:
+                        self._ckpt_writer = ckpt_writer
+                        try:
+                            _save_ckpts_to_dir(
+                                ckpts_dir,
+                                (
+                                    task.module
+                                    if isinstance(task, _DistributedDataParallel)
+                                    else task
+                                ),
+                                optimizer,
+                                scheduler,
+                                scaler,
+                                build_model_all_args,
+                                build_task_all_args_except_model,
+                                save_model,
+                                save_task,
+                                training_stats,
+                                global_config,
+                            )
+                        finally:
+                            self._ckpt_writer = None
+
+                    if (
+                        global_step % conf.save_step == 0
+                        and conf.keep_num_ckpts is not None
+                    ):
+                        ckpt_writer.submit(
+                            _remove_outdated_ckpts, train_dir, conf.keep_num_ckpts
+                        )
 
                 pbar.update(1)
             epoch += 1
 
         pbar.close()
+        if tqdm_file is not sys.stderr:
+            tqdm_file.close()
+        ckpt_writer.close()
+        for handle in timer_hooks:
+            handle.remove()
         if rank == 0:
             tf_logger.close()
+            timing = timer.dump(train_dir / "timing.json")
+            logger.info(
+                f"Seconds per step: {timing['seconds_per_step']}, "
+                f"{timing['phase_seconds_per_step']}"
+            )
 
     def evaluate(
         self,
@@ -669,43 +823,85 @@ class Problem:
         dump_dir: str,
         device: str,
         num_workers: int,
+        world_size: int = 1,
+        rank: int = 0,
     ):
         """
         The evaluate routine used by :obj:`train` (during validation phase) and :obj:`run`
         (during testing phase).
 
+        When :code:`world_size > 1`, each rank evaluates its own shard of the batches
+        (without duplicated samples) and the cacheable results are gathered to rank 0
+        for :code:`task.reduction`. All the ranks should call this method together
+
         Args:
             evaluate (dict): same in :obj:`default_config`, no argument supported for now
+            world_size (int): the number of the evaluating processes
+            rank (int): the rank of the current process
             **others:
                 only meaningful when you want to override this train method, which is not the
                 common case. Hence we skip the documentation for now.
 
+        Returns:
+            dict
+
+            The logs from :code:`task.reduction`. None for the ranks other than 0
         """
         assert mode in ["valid", "test"]
 
+        if world_size > 1:
+            # take every world_size-th batch, so the batches are not halved or
+            # duplicated, and the gathered results are in the original order
+            batch_sampler = list(batch_sampler)[rank::world_size]
+
         dataloader = DataLoader(
             dataset,
             batch_sampler=batch_sampler,
             num_workers=num_workers,
             collate_fn=collate_fn,
+            pin_memory=_use_pin_memory(device),
         )
 
         task = task.to(device)
         with torch.no_grad():
             batch_results = []
             for batch_idx, batch in enumerate(
-                tqdm(dataloader, desc=mode, total=len(dataloader))
+                tqdm(
+                    DevicePrefetcher(
+                        dataloader, device, partial(_to_device, non_blocking=True)
+                    ),
+                    desc=mode,
+                    total=len(dataloader),
+                    disable=rank > 0,
+                )
             ):
-                if batch_idx == eval_batch:
+                # eval_batch counts the batches of all the ranks
+                if 0 <= eval_batch <= batch_idx * world_size + rank:
                     break
-                batch = _to_device(batch, device)
                 task.eval()
                 loss, cacheable = task(mode, _dump_dir=dump_dir, **batch)
                 batch_results.append(_force_cacheable(cacheable))
 
+        if world_size > 1:
+            batch_results = _gather_batch_results(batch_results, world_size, rank)
+            if rank > 0:
+                return None
+
         logs = task.reduction(mode, batch_results, _dump_dir=dump_dir)
         return logs
 
+    def _torch_save(self, obj, path: str):
+        """
+        :code:`torch.save` for :obj:`save_model` and :obj:`save_task`. When saving the
+        checkpoints in :obj:`train`, the object is snapshotted to CPU and serialized by
+        the background :obj:`s3prl.util.checkpoint.AsyncCheckpointWriter`
+        """
+        writer = getattr(self, "_ckpt_writer", None)
+        if writer is None:
+            torch.save(obj, path)
+        else:
+            writer.save(obj, path)
+
     def save_model(
         self,
         save_model: dict,
@@ -739,7 +935,7 @@ class Problem:
         with (model_ckpt_dir / "problem_name").open("w") as f:
             f.write(f"{self.__class__.__name__}")
 
-        torch.save(model.state_dict(), model_ckpt_dir / "state_dict.pt")
+        self._torch_save(model.state_dict(), model_ckpt_dir / "state_dict.pt")
 
         # NOTE: all arguments for building model should be in simple types (yaml serializable)
         with (model_ckpt_dir / f"arguments.yaml").open("w") as f:
@@ -806,7 +1002,7 @@ class Problem:
         with (task_ckpt_dir / "problem_name").open("w") as f:
             f.write(f"{self.__class__.__name__}")
 
-        torch.save(task.get_state(), task_ckpt_dir / "state.pt")
+        self._torch_save(task.get_state(), task_ckpt_dir / "state.pt")
 
         # NOTE: each argument is saved independently to prevent SPOF
         # i.e. a single argument which cannot be loaded will lead to missing
@@ -17,7 +17,7 @@ import pandas as pd
 from omegaconf import MISSING
 
 from s3prl.dataio.corpus.voxceleb1sid import VoxCeleb1SID
-from s3prl.dataio.dataset import EncodeCategory, LoadAudio
+from s3prl.dataio.dataset import EncodeCategory, LoadAudio, PartialLoadAudio
 from s3prl.dataio.encoder.category import CategoryEncoder
 from s3prl.dataio.sampler import FixedBatchSizeBatchSampler
 from s3prl.nn.linear import MeanPoolingLinear
@@ -325,7 +325,9 @@ class SuperbSID(Common):
             end_secs = csv["end_sec"].tolist()
             end_secs = [None if math.isnan(sec) else sec for sec in end_secs]
 
-        audio_loader = LoadAudio(
+        # with max_secs, only decode the randomly cropped frames
+        audio_loader_cls = PartialLoadAudio if conf.max_secs is not None else LoadAudio
+        audio_loader = audio_loader_cls(
             csv["wav_path"].tolist(),
             start_secs,
             end_secs,
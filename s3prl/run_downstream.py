@@ -66,6 +66,7 @@ def get_downstream_args():
     parser.add_argument('-s', '--upstream_feature_selection', default='hidden_states', help='Specify the layer to be extracted as the representation')
     parser.add_argument('-l', '--upstream_layer_selection', type=int, help='Select a specific layer for the features selected by -s')
     parser.add_argument('--upstream_feature_normalize', action='store_true', help='Specify whether to normalize hidden features before weighted sum')
+    parser.add_argument('--upstream_precision', default='fp32', choices=['fp32', 'bf16', 'fp16'], help='Run the upstream forward under autocast with this precision. bf16 also works on CPU')
     parser.add_argument('--upstream_model_name', default="model.pt", help='The name of the model file in the HuggingFace Hub repo.')
     parser.add_argument('--upstream_revision', help="The commit hash of the specified HuggingFace Repository")
 
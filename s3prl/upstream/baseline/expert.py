@@ -11,7 +11,7 @@ import yaml
 from torch.nn.utils.rnn import pad_sequence
 
 from ..interfaces import UpstreamBase
-from .extracter import get_extracter
+from .extracter import batch_extract, get_extracter
 from .preprocessor import get_preprocessor
 
 SAMPLE_RATE = 16000
@@ -44,10 +44,8 @@ class UpstreamExpert(UpstreamBase):
             )
 
     def _extractor_forward(self, wavs):
-        feats = []
-        for wav in wavs:
-            feats.append(self.extracter(wav))
-        return feats
+        padded_feats, _ = batch_extract(self.extracter, wavs)
+        return padded_feats
 
     def get_downsample_rates(self, key: str) -> int:
         return self.downsample_rate
@@ -68,11 +66,11 @@ class UpstreamExpert(UpstreamBase):
 
     def forward(self, wavs):
         if "kaldi" in self.config:
-            feats = self._extractor_forward(wavs)
+            padded_feats = self._extractor_forward(wavs)
         else:
             feats = self._preprocessor_forward(wavs)
+            padded_feats = pad_sequence(feats, batch_first=True)
 
-        padded_feats = pad_sequence(feats, batch_first=True)
         return {
             "last_hidden_state": padded_feats,
             "hidden_states": [padded_feats],
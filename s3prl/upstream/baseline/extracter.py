@@ -11,7 +11,9 @@
 # IMPORTATION #
 ###############
 import copy
+import math
 from collections import namedtuple
+from typing import List, Tuple
 
 # -------------#
 import torch
@@ -20,6 +22,8 @@ import torch.nn.functional as F
 
 # -------------#
 import torchaudio
+import torchaudio.compliance.kaldi as kaldi
+from torch.nn.utils.rnn import pad_sequence
 from torchaudio import transforms
 
 ############
@@ -27,6 +31,7 @@ from torchaudio import transforms
 ############
 SAMPLE_RATE = 16000
 EXAMPLE_SEC = 5
+CPU_GROUP_SAMPLES = 4 * SAMPLE_RATE
 
 
 def get_extracter(config):
@@ -41,6 +46,78 @@ def get_extracter(config):
     return extracter, output_dim, extracter[0].frame_shift
 
 
+def batch_extract(extracter: nn.Sequential, wavs: List[torch.Tensor]):
+    """
+    Run the extracter from :obj:`get_extracter` on a batch at once, with the same
+    results as running it on each wav. On CPU the feature extraction is memory-bound,
+    so the utterances are processed in groups of about :code:`CPU_GROUP_SAMPLES` to
+    stay in the cache, while the short utterances still share one pass
+
+    Args:
+        wavs (List[torch.FloatTensor]): List[ (time, ) ]
+
+    Returns:
+        tuple
+
+        1. feats (torch.FloatTensor): (batch_size, feat_seqlen, feat_dim), zero padded
+        2. feat_lens (torch.LongTensor): (batch_size, )
+    """
+    wav_lens = [len(wav) for wav in wavs]
+    max_samples = None if wavs[0].is_cuda else CPU_GROUP_SAMPLES
+
+    group_feats, group_lens = [], []
+    for start, end in _groups(wav_lens, max_samples):
+        x = pad_sequence(wavs[start:end], batch_first=True)
+        x_lens = torch.LongTensor(wav_lens[start:end]).to(x.device)
+        for transform in extracter:
+            x, x_lens = transform.batch_forward(x, x_lens)
+        group_feats.append(x)
+        group_lens.append(x_lens)
+
+    if len(group_feats) == 1:
+        return group_feats[0], group_lens[0]
+
+    feat_lens = torch.cat(group_lens)
+    feats = group_feats[0].new_zeros(
+        len(wavs), int(feat_lens.max()), group_feats[0].size(-1)
+    )
+    position = 0
+    for x in group_feats:
+        feats[position : position + len(x), : x.size(1)] = x
+        position += len(x)
+    return feats, feat_lens
+
+
+def _groups(lengths: List[int], max_total: int = None):
+    """
+    Group the consecutive utterances so each padded group has at most
+    :code:`max_total` samples, or a single utterance
+    """
+    if max_total is None:
+        yield 0, len(lengths)
+        return
+
+    start, group_len = 0, 0
+    for end, length in enumerate(lengths):
+        group_len = max(group_len, length)
+        if end > start and group_len * (end - start + 1) > max_total:
+            yield start, end
+            start, group_len = end, length
+    yield start, len(lengths)
+
+
+def _valid_mask(x_lens: torch.LongTensor, max_len: int) -> torch.BoolTensor:
+    return torch.arange(max_len, device=x_lens.device) < x_lens.unsqueeze(-1)
+
+
+def _replicate_pad(x: torch.Tensor, x_lens: torch.LongTensor, n: int) -> torch.Tensor:
+    # x: (batch_size, feat_seqlen, feat_dim) -> (batch_size, n + feat_seqlen + n, feat_dim)
+    # each utterance is padded by replicating its own first and last valid frames
+    positions = torch.arange(-n, x.size(1) + n, device=x.device).unsqueeze(0)
+    positions = torch.minimum(positions.clamp(min=0), (x_lens - 1).unsqueeze(-1))
+    return x.gather(1, positions.unsqueeze(-1).expand(-1, -1, x.size(-1)))
+
+
 class ExtractAudioFeature(nn.Module):
     def __init__(self, feat_type="fbank", **kwargs):
         super(ExtractAudioFeature, self).__init__()
@@ -56,6 +133,214 @@ class ExtractAudioFeature(nn.Module):
         # x: (feat_seqlen, feat_dim)
         return x
 
+    def _supports_batch(self):
+        return (
+            self.extract_fn in [kaldi.fbank, kaldi.mfcc, kaldi.spectrogram]
+            and self.kwargs.get("snip_edges", True)
+            and self.kwargs.get("min_duration", 0.0) == 0.0
+        )
+
+    def batch_forward(self, waveforms, wav_lens):
+        # waveforms: (batch_size, time)
+        if not self._supports_batch():
+            feats = [self(wav[:wav_len]) for wav, wav_len in zip(waveforms, wav_lens)]
+            feat_lens = torch.LongTensor([len(feat) for feat in feats])
+            return pad_sequence(feats, batch_first=True), feat_lens.to(wav_lens.device)
+
+        conf = dict(self.kwargs)
+        subtract_mean = conf.pop("subtract_mean", False)
+        for key in ["snip_edges", "min_duration", "channel", "sample_frequency"]:
+            conf.pop(key, None)
+        frame_fn = _FRAME_FEATURES[self.extract_fn.__name__]
+
+        frame_length = conf.pop("frame_length", 25.0)
+        window_size = int(SAMPLE_RATE * frame_length * kaldi.MILLISECONDS_TO_SECONDS)
+        window_shift = int(
+            SAMPLE_RATE * self.frame_shift * kaldi.MILLISECONDS_TO_SECONDS
+        )
+        conf.pop("frame_shift", None)
+        assert (
+            2 <= window_size <= wav_lens.min()
+        ), f"choose a window size {window_size} that is [2, {wav_lens.min()}]"
+
+        # snip_edges: only the frames completely inside each utterance are kept
+        feat_lens = 1 + (wav_lens - window_size) // window_shift
+        max_len = int(feat_lens.max())
+        frames = waveforms.unfold(-1, window_size, window_shift)[:, :max_len]
+
+        # every step after framing is frame-wise
+        feats = frame_fn(frames.reshape(-1, window_size), **conf)
+        feats = feats.view(len(waveforms), max_len, -1)
+
+        mask = _valid_mask(feat_lens, max_len).unsqueeze(-1)
+        feats = feats.masked_fill(~mask, 0)
+        if subtract_mean:
+            mean = feats.sum(dim=1, keepdim=True) / feat_lens.view(-1, 1, 1)
+            feats = (feats - mean).masked_fill_(~mask, 0)
+        return feats, feat_lens
+
+
+def _window_frames(
+    frames: torch.Tensor,
+    blackman_coeff: float = 0.42,
+    dither: float = 0.0,
+    energy_floor: float = 1.0,
+    preemphasis_coefficient: float = 0.97,
+    raw_energy: bool = True,
+    remove_dc_offset: bool = True,
+    round_to_power_of_two: bool = True,
+    window_type: str = kaldi.POVEY,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    :code:`torchaudio.compliance.kaldi._get_window` after the framing
+
+    Args:
+        frames: (num_frames, window_size)
+
+    Returns:
+        tuple
+
+        1. strided_input: (num_frames, padded_window_size)
+        2. signal_log_energy: (num_frames, )
+    """
+    device, dtype = frames.device, frames.dtype
+    window_size = frames.size(-1)
+    padded_window_size = (
+        kaldi._next_power_of_2(window_size) if round_to_power_of_two else window_size
+    )
+    epsilon = kaldi._get_epsilon(device, dtype)
+
+    if dither != 0.0:
+        frames = frames + torch.randn(frames.shape, device=device, dtype=dtype) * dither
+
+    if remove_dc_offset:
+        frames = frames - frames.mean(dim=1, keepdim=True)
+
+    if raw_energy:
+        signal_log_energy = kaldi._get_log_energy(frames, epsilon, energy_floor)
+
+    if preemphasis_coefficient != 0.0:
+        offset_frames = torch.cat([frames[:, :1], frames[:, :-1]], dim=1)
+        frames = frames - preemphasis_coefficient * offset_frames
+
+    window = kaldi._feature_window_function(
+        window_type, window_size, blackman_coeff, device, dtype
+    )
+    frames = frames * window.unsqueeze(0)
+    if padded_window_size != window_size:
+        frames = F.pad(frames, (0, padded_window_size - window_size))
+
+    if not raw_energy:
+        signal_log_energy = kaldi._get_log_energy(frames, epsilon, energy_floor)
+
+    return frames, signal_log_energy
+
+
+def _spectrogram_frames(frames, **kwargs):
+    strided_input, signal_log_energy = _window_frames(frames, **kwargs)
+    epsilon = kaldi._get_epsilon(frames.device, frames.dtype)
+    power_spectrum = torch.max(torch.fft.rfft(strided_input).abs().pow(2.0), epsilon)
+    power_spectrum = power_spectrum.log()
+    power_spectrum[:, 0] = signal_log_energy
+    return power_spectrum
+
+
+def _fbank_frames(
+    frames,
+    high_freq: float = 0.0,
+    htk_compat: bool = False,
+    low_freq: float = 20.0,
+    num_mel_bins: int = 23,
+    use_energy: bool = False,
+    use_log_fbank: bool = True,
+    use_power: bool = True,
+    vtln_high: float = -500.0,
+    vtln_low: float = 100.0,
+    vtln_warp: float = 1.0,
+    **kwargs,
+):
+    device, dtype = frames.device, frames.dtype
+    strided_input, signal_log_energy = _window_frames(frames, **kwargs)
+
+    spectrum = torch.fft.rfft(strided_input).abs()
+    if use_power:
+        spectrum = spectrum.pow(2.0)
+
+    mel_energies, _ = kaldi.get_mel_banks(
+        num_mel_bins,
+        strided_input.size(-1),
+        SAMPLE_RATE,
+        low_freq,
+        high_freq,
+        vtln_low,
+        vtln_high,
+        vtln_warp,
+    )
+    mel_energies = F.pad(mel_energies.to(device=device, dtype=dtype), (0, 1))
+    mel_energies = torch.mm(spectrum, mel_energies.T)
+    if use_log_fbank:
+        mel_energies = torch.max(mel_energies, kaldi._get_epsilon(device, dtype)).log()
+
+    if use_energy:
+        signal_log_energy = signal_log_energy.unsqueeze(1)
+        if htk_compat:
+            mel_energies = torch.cat((mel_energies, signal_log_energy), dim=1)
+        else:
+            mel_energies = torch.cat((signal_log_energy, mel_energies), dim=1)
+    return mel_energies
+
+
+def _mfcc_frames(
+    frames,
+    cepstral_lifter: float = 22.0,
+    htk_compat: bool = False,
+    num_ceps: int = 13,
+    num_mel_bins: int = 23,
+    use_energy: bool = False,
+    **kwargs,
+):
+    assert num_ceps <= num_mel_bins
+    device, dtype = frames.device, frames.dtype
+    feature = _fbank_frames(
+        frames,
+        htk_compat=htk_compat,
+        num_mel_bins=num_mel_bins,
+        use_energy=use_energy,
+        use_log_fbank=True,
+        use_power=True,
+        **kwargs,
+    )
+
+    if use_energy:
+        signal_log_energy = feature[:, num_mel_bins if htk_compat else 0]
+        mel_offset = int(not htk_compat)
+        feature = feature[:, mel_offset : (num_mel_bins + mel_offset)]
+
+    dct_matrix = kaldi._get_dct_matrix(num_ceps, num_mel_bins)
+    feature = feature.matmul(dct_matrix.to(dtype=dtype, device=device))
+
+    if cepstral_lifter != 0.0:
+        lifter_coeffs = kaldi._get_lifter_coeffs(num_ceps, cepstral_lifter)
+        feature = feature * lifter_coeffs.unsqueeze(0).to(device=device, dtype=dtype)
+
+    if use_energy:
+        feature[:, 0] = signal_log_energy
+
+    if htk_compat:
+        energy = feature[:, :1]
+        feature = feature[:, 1:]
+        if not use_energy:
+            energy = energy * math.sqrt(2)
+        feature = torch.cat((feature, energy), dim=1)
+    return feature
+
+
+_FRAME_FEATURES = {
+    "spectrogram": _spectrogram_frames,
+    "fbank": _fbank_frames,
+    "mfcc": _mfcc_frames,
+}
+
 
 class Delta(nn.Module):
     def __init__(self, order=2, **kwargs):
@@ -74,6 +359,32 @@ class Delta(nn.Module):
         # x: (feat_seqlen, feat_dim)
         return x
 
+    def batch_forward(self, x, x_lens):
+        # x: (batch_size, feat_seqlen, feat_dim), zero padded
+        if self.order == 0:
+            return x, x_lens
+        assert self.compute_delta.mode == "replicate"
+
+        # the same regression as torchaudio.functional.compute_deltas, computed along
+        # the time axis of the whole batch
+        n = (self.compute_delta.win_length - 1) // 2
+        denom = n * (n + 1) * (2 * n + 1) / 3
+        seq_len = x.size(1)
+        feats = [x]
+        for o in range(self.order):
+            padded = _replicate_pad(feats[-1], x_lens, n)
+            delta = torch.zeros_like(x)
+            for shift in range(1, n + 1):
+                delta.add_(
+                    padded[:, n + shift : n + shift + seq_len]
+                    - padded[:, n - shift : n - shift + seq_len],
+                    alpha=shift,
+                )
+            feats.append(delta.div_(denom))
+        x = torch.cat(feats, dim=-1)
+        x.masked_fill_(~_valid_mask(x_lens, seq_len).unsqueeze(-1), 0)
+        return x, x_lens
+
 
 class CMVN(nn.Module):
     def __init__(self, use_cmvn, eps=1e-10):
@@ -88,3 +399,14 @@ class CMVN(nn.Module):
                 self.eps + x.std(dim=0, keepdim=True)
             )
         return x
+
+    def batch_forward(self, x, x_lens):
+        # x: (batch_size, feat_seqlen, feat_dim), zero padded
+        if self.use_cmvn:
+            num_frames = x_lens.view(-1, 1, 1).to(x.dtype)
+            x = x - x.sum(dim=1, keepdim=True) / num_frames
+            x.masked_fill_(~_valid_mask(x_lens, x.size(1)).unsqueeze(-1), 0)
+            std = torch.linalg.vector_norm(x, dim=1, keepdim=True)
+            std = std / (num_frames - 1).sqrt()
+            x.div_(self.eps + std)
+        return x, x_lens
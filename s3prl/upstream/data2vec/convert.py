@@ -7,7 +7,12 @@ from s3prl.upstream.data2vec.data2vec_model import (
     Data2VecAudioConfig,
     Data2VecAudioModel,
 )
-from s3prl.upstream.utils import load_fairseq_ckpt, merge_with_parent
+from s3prl.upstream.utils import (
+    build_and_load_model,
+    load_converted_state,
+    load_fairseq_ckpt,
+    merge_with_parent,
+)
 from s3prl.upstream.wav2vec2.wav2vec2_model import AudioPretrainingConfig
 
 
@@ -27,7 +32,7 @@ def load_and_convert_fairseq_ckpt(fairseq_source: str, output_path: str):
 
 
 def load_converted_model(ckpt: str):
-    ckpt_state = torch.load(ckpt, map_location="cpu")
+    ckpt_state = load_converted_state(ckpt)
 
     for required_key in ["task_cfg", "model_cfg", "model_weight"]:
         if required_key not in ckpt_state:
@@ -37,12 +42,14 @@ def load_converted_model(ckpt: str):
 
     task_cfg = merge_with_parent(AudioPretrainingConfig, ckpt_state["task_cfg"])
     model_cfg = merge_with_parent(Data2VecAudioConfig, ckpt_state["model_cfg"])
-    model = Data2VecAudioModel(model_cfg)
 
-    model.remove_pretraining_modules()
-    del ckpt_state["model_weight"]["_ema"]
+    def build_model():
+        model = Data2VecAudioModel(model_cfg)
+        model.remove_pretraining_modules()
+        return model
 
-    model.load_state_dict(ckpt_state["model_weight"])
+    del ckpt_state["model_weight"]["_ema"]
+    model = build_and_load_model(build_model, ckpt_state["model_weight"])
     return model, task_cfg
 
 
@@ -2,7 +2,7 @@ import torch
 import torch.nn.functional as F
 from torch.nn.utils.rnn import pad_sequence
 
-from ..interfaces import UpstreamBase
+from ..interfaces import UpstreamBase, unpad_hook_hiddens
 from .convert import load_converted_model
 
 
@@ -25,13 +25,7 @@ class UpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
         self._init_layerdrop = self.model.encoder.layerdrop
 
@@ -9,8 +9,9 @@ def customized_upstream(*args, **kwargs):
     The following is a brief introduction of the registration mechanism.
 
     The s3prl/hub.py will collect all the entries registered in this file
-    (callable variables without the underscore prefix) as a centralized
-    upstream factory. One can pick up this upstream from the factory via
+    (callable variables without the underscore prefix, listed in the
+    _HUBCONF_ENTRIES of s3prl/hub.py) as a centralized upstream factory.
+    One can pick up this upstream from the factory via
 
     1.
     from s3prl.hub import customized_upstream
@@ -14,7 +14,7 @@ import torch
 import torch.nn.functional as F
 from torch.nn.utils.rnn import pad_sequence
 
-from ..interfaces import UpstreamBase
+from ..interfaces import UpstreamBase, unpad_hook_hiddens
 from .convert import load_converted_model
 
 SAMPLE_RATE = 16000
@@ -42,13 +42,7 @@ class UpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
     def get_downsample_rates(self, key: str) -> int:
         return 320
@@ -69,6 +63,7 @@ class UpstreamExpert(UpstreamBase):
             padded_wav,
             padding_mask=wav_padding_mask,
             mask=None,
+            output_layer=self._early_exit_layer(len(self.model.encoder.layers)),
         )
 
         # This forward function only does the model forward
@@ -97,13 +92,7 @@ class LegacyUpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
     def get_downsample_rates(self, key: str) -> int:
         return 320
@@ -150,13 +139,7 @@ class LegacyUpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
         self._init_layerdrop = self.model.encoder.layerdrop
 
@@ -1,4 +1,5 @@
 import sys
+from contextlib import nullcontext
 from typing import Callable, Dict, List, Tuple, Union
 
 import numpy as np
@@ -7,6 +8,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch import Tensor
 
+from s3prl.nn.upstream import PRECISIONS, weighted_sum
+from s3prl.util.upstream_metadata import get_metadata_key, load_metadata, save_metadata
 from s3prl.utility.helper import show
 
 SAMPLE_RATE = 16000
@@ -25,6 +28,25 @@ class Hook:
         assert isinstance(self.unique_identifier, str)
 
 
+def unpad_hook_hiddens(xs: List[Tuple[str, Tensor]]) -> List[Tuple[str, Tensor]]:
+    """
+    The common :code:`hook_postprocess` which truncates all the hidden states
+    to the shortest one, e.g. when the transformer layers' inputs are padded
+    """
+    names, hiddens = zip(*xs)
+    unpad_len = min([hidden.size(1) for hidden in hiddens])
+    hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
+    return list(zip(names, hiddens))
+
+
+def _to_fp32(value):
+    if isinstance(value, Tensor) and value.is_floating_point():
+        return value.float()
+    if isinstance(value, (list, tuple)):
+        return value.__class__(_to_fp32(v) for v in value)
+    return value
+
+
 class initHook(type):
     def __call__(cls, *args, **kwargs):
         instance = super().__call__(*args, **kwargs)
@@ -51,6 +73,93 @@ class UpstreamBase(nn.Module, metaclass=initHook):
         self.hooks: List[Hook] = [Hook(*hook) for hook in hooks] if hooks else []
         self.hook_postprocess = hook_postprocess
         self._hook_hiddens: List[Tuple(str, Tensor)] = []
+        self._hook_layer_ids: List[int] = []
+        self._hook_buffer: Tensor = None
+        self._hook_min_seq_len: int = None
+        self._num_hook_calls = 0
+        self._max_layer: int = None
+        self._layer_selections: List[int] = None
+        self._hidden_states_buffer = False
+        self._precision = "fp32"
+
+    @property
+    def max_layer(self) -> int:
+        """
+        The largest index (0-based) of :code:`hidden_states` which will be consumed.
+        None means all the hidden states are needed.
+        """
+        return self._max_layer
+
+    def set_max_layer(self, max_layer: int = None):
+        """
+        Declare that only :code:`hidden_states[:max_layer + 1]` will be consumed.
+        The returned hidden states are truncated accordingly, and the upstreams
+        supporting early exit (see :obj:`_early_exit_layer`) skip the computation
+        of the unused transformer blocks.
+        """
+        assert max_layer is None or max_layer >= 0
+        self._max_layer = max_layer
+
+    @property
+    def layer_selections(self) -> List[int]:
+        """
+        The ids (0-based) of :code:`hidden_states` which will be consumed.
+        None means all the hidden states are needed.
+        """
+        return self._layer_selections
+
+    def set_layer_selections(self, layer_selections: List[int] = None):
+        """
+        Declare that only the given layers of :code:`hidden_states` will be consumed,
+        so the returned :code:`hidden_states` only contain these layers (in ascending
+        order). With the hook-based hidden states, the other layers are never retained.
+        """
+        if layer_selections is not None:
+            assert all(layer_id >= 0 for layer_id in layer_selections)
+            layer_selections = sorted(set(layer_selections))
+        self._layer_selections = layer_selections
+
+    @property
+    def hidden_states_buffer(self) -> bool:
+        return self._hidden_states_buffer
+
+    def set_hidden_states_buffer(self, enable: bool = True):
+        """
+        Let the hooks write the hidden states into a preallocated and contiguous
+        (num_layers, batch_size, seq_len, hidden_size) buffer, and the returned
+        :code:`hidden_states` are the views of it. Only effective when
+        :code:`hook_postprocess` is None or :obj:`unpad_hook_hiddens`, since the
+        shorter hidden states are written as the prefix of their slots
+        """
+        self._hidden_states_buffer = enable
+
+    @property
+    def precision(self) -> str:
+        return self._precision
+
+    def set_precision(self, precision: str = "fp32"):
+        """
+        Run the forward under :code:`torch.autocast` with the given precision, one of
+        :code:`PRECISIONS`. Autocast keeps the numerically sensitive ops (e.g. the
+        normalizations, softmax and reductions) in fp32, and the returned hidden states
+        are always cast back to fp32. bf16 is supported on both CPU and CUDA, while
+        fp16 is only supported on CUDA
+        """
+        assert precision in PRECISIONS, f"{precision} is not in {list(PRECISIONS)}"
+        self._precision = precision
+
+    def _early_exit_layer(self, num_encoder_layers: int):
+        """
+        For the fairseq-style experts whose hidden states are the inputs of all the
+        transformer blocks followed by the encoder output, return the 1-based
+        :code:`output_layer` to stop the encoder at, or None to forward all the blocks.
+        """
+        if self.max_layer is None or self.max_layer >= num_encoder_layers:
+            return None
+
+        # hidden state k is the output of block k - 1 (1-based k).
+        # Forward at least one block so that the encoder output is still produced
+        return max(self.max_layer, 1)
 
     def remove_all_hooks(self):
         for hook in self.hooks:
@@ -87,20 +196,91 @@ class UpstreamBase(nn.Module, metaclass=initHook):
             )
             hook.handler.remove()
 
-        def generate_hook_handler(hiddens: List, hook: Hook):
+        def generate_hook_handler(upstream: UpstreamBase, hook: Hook):
             def hook_handler(self, input, output):
-                hiddens.append((hook.unique_identifier, hook.transform(input, output)))
+                upstream._capture_hidden(
+                    hook.unique_identifier, hook.transform(input, output)
+                )
 
             return hook_handler
 
-        hook.handler = module.register_forward_hook(
-            generate_hook_handler(self._hook_hiddens, hook)
+        hook.handler = module.register_forward_hook(generate_hook_handler(self, hook))
+
+    def _select_in_hooks(self) -> bool:
+        # the hidden states can only be dropped (or written into the buffer) before
+        # the postprocess if the postprocess does not depend on all of them
+        return (
+            self.hook_postprocess is None or self.hook_postprocess is unpad_hook_hiddens
         )
 
+    def _capture_hidden(self, identifier: str, hidden: Tensor):
+        layer_id = self._num_hook_calls
+        self._num_hook_calls += 1
+        if isinstance(hidden, Tensor) and hidden.dim() == 3:
+            # the dropped hidden states still decide the unpadded length
+            seq_len = hidden.size(1)
+            if self._hook_min_seq_len is None or seq_len < self._hook_min_seq_len:
+                self._hook_min_seq_len = seq_len
+
+        if not self._select_in_hooks():
+            self._hook_hiddens.append((identifier, hidden))
+            self._hook_layer_ids.append(layer_id)
+            return
+
+        if self.max_layer is not None and layer_id > self.max_layer:
+            return
+        if self.layer_selections is not None and layer_id not in self.layer_selections:
+            return
+
+        if (
+            self.hidden_states_buffer
+            and isinstance(hidden, Tensor)
+            and hidden.dim() == 3
+        ):
+            if self._hook_buffer is None:
+                num_slots = len(self.hooks)
+                if self.layer_selections is not None:
+                    num_slots = len(self.layer_selections)
+                if self.max_layer is not None:
+                    num_slots = min(num_slots, self.max_layer + 1)
+                # the reduced-precision hidden states are cast when written
+                dtype = hidden.dtype if self.precision == "fp32" else torch.float32
+                self._hook_buffer = hidden.new_empty(
+                    num_slots, *hidden.shape, dtype=dtype
+                )
+
+            slot_id = len(self._hook_hiddens)
+            _, batch_size, max_seq_len, hidden_size = self._hook_buffer.shape
+            if (
+                slot_id < len(self._hook_buffer)
+                and hidden.is_floating_point()
+                and hidden.size(0) == batch_size
+                and hidden.size(1) <= max_seq_len
+                and hidden.size(2) == hidden_size
+            ):
+                slot = self._hook_buffer[slot_id, :, : hidden.size(1)]
+                slot.copy_(hidden)
+                hidden = slot
+
+        self._hook_hiddens.append((identifier, hidden))
+        self._hook_layer_ids.append(layer_id)
+
     def __call__(self, wavs: List[Tensor], *args, **kwargs):
         self._hook_hiddens.clear()
+        self._hook_layer_ids.clear()
+        self._hook_buffer = None
+        self._hook_min_seq_len = None
+        self._num_hook_calls = 0
+
+        autocast_dtype = PRECISIONS[self.precision]
+        if autocast_dtype is None:
+            # do not override the autocast set by the caller, e.g. the fp16 training
+            autocast = nullcontext()
+        else:
+            autocast = torch.autocast(wavs[0].device.type, dtype=autocast_dtype)
 
-        result = super().__call__(wavs, *args, **kwargs) or {}
+        with autocast:
+            result = super().__call__(wavs, *args, **kwargs) or {}
         assert isinstance(result, dict)
 
         if len(self._hook_hiddens) > 0:
@@ -117,19 +297,48 @@ class UpstreamBase(nn.Module, metaclass=initHook):
                 raise ValueError
 
             hook_hiddens = self._hook_hiddens.copy()
+            layer_ids = self._hook_layer_ids.copy()
             self._hook_hiddens.clear()
-
-            if callable(self.hook_postprocess):
+            self._hook_layer_ids.clear()
+            self._hook_buffer = None
+
+            if self.hook_postprocess is unpad_hook_hiddens:
+                hook_hiddens = [
+                    (name, hidden[:, : self._hook_min_seq_len, :])
+                    for name, hidden in hook_hiddens
+                ]
+            elif callable(self.hook_postprocess):
                 hook_hiddens = self.hook_postprocess(hook_hiddens)
 
+            if not self._select_in_hooks():
+                layer_ids = self._selected_layer_ids(len(hook_hiddens))
+                hook_hiddens = [hook_hiddens[layer_id] for layer_id in layer_ids]
+
             result["_hidden_states_info"], result["hidden_states"] = zip(*hook_hiddens)
             result["last_hidden_state"] = result["hidden_states"][-1]
 
-            for layer_id, hidden_state in enumerate(result["hidden_states"]):
+            for layer_id, hidden_state in zip(layer_ids, result["hidden_states"]):
                 result[f"hidden_state_{layer_id}"] = hidden_state
 
+        elif isinstance(result.get("hidden_states"), (list, tuple)):
+            hidden_states = result["hidden_states"]
+            layer_ids = self._selected_layer_ids(len(hidden_states))
+            if len(layer_ids) < len(hidden_states):
+                result["hidden_states"] = [hidden_states[idx] for idx in layer_ids]
+
+        if autocast_dtype is not None:
+            result = {key: _to_fp32(value) for key, value in result.items()}
+
         return result
 
+    def _selected_layer_ids(self, num_layers: int) -> List[int]:
+        if self.max_layer is not None:
+            num_layers = min(num_layers, self.max_layer + 1)
+        layer_ids = list(range(num_layers))
+        if self.layer_selections is not None:
+            layer_ids = [idx for idx in layer_ids if idx in self.layer_selections]
+        return layer_ids
+
 
 class Featurizer(nn.Module):
     def __init__(
@@ -139,12 +348,70 @@ class Featurizer(nn.Module):
         upstream_device: str = "cuda",
         layer_selection: int = None,
         normalize: bool = False,
+        metadata_key: str = None,
         **kwargs,
     ):
+        """
+        Args:
+            metadata_key: identifies the upstream (see :obj:`s3prl.util.upstream_metadata`).
+                If given, the selected feature's metadata is cached on disk with this key,
+                so the probing forward pass only runs once for each upstream
+        """
         super().__init__()
         self.name = "Featurizer"
+        self.layer_selection = layer_selection
+        self.normalize = normalize
 
+        # the same upstream mode whether the metadata is probed or cached
         upstream.eval()
+        metadata = None
+        if metadata_key is not None:
+            metadata_key = get_metadata_key(
+                upstream=metadata_key,
+                feature_selection=feature_selection,
+                layer_selection=layer_selection,
+                max_layer=getattr(upstream, "max_layer", None),
+            )
+            metadata = load_metadata(metadata_key)
+
+        if metadata is None:
+            metadata = self._probe_metadata(
+                upstream, feature_selection, upstream_device
+            )
+            if metadata_key is not None:
+                save_metadata(metadata_key, metadata)
+
+        feature_selection = metadata["feature_selection"]
+        self.feature_selection = feature_selection
+
+        if metadata["layer_num"] is not None:
+            self.layer_num = metadata["layer_num"]
+            show(
+                f"[{self.name}] - Take a list of {self.layer_num} features and weighted sum them.",
+                file=sys.stderr,
+            )
+            self.weights = nn.Parameter(torch.zeros(self.layer_num))
+
+        self.output_dim = metadata["output_dim"]
+        if hasattr(upstream, "get_downsample_rates"):
+            self.downsample_rate = upstream.get_downsample_rates(feature_selection)
+            show(
+                f"[{self.name}] - The selected feature {feature_selection}'s downsample rate is {self.downsample_rate}",
+                file=sys.stderr,
+            )
+        else:
+            self.downsample_rate = metadata["downsample_rate"]
+            show(
+                f"[{self.name}] - Warning: The provided upstream does not give statis downsample rate"
+                ' by the "get_downsample_rates" interface (see upstream/example/expert.py).'
+                " The downsample rate is calculated dynamically basing on the shape of the"
+                f" input waveforms v.s. the output features: {self.downsample_rate}",
+                file=sys.stderr,
+            )
+
+    def _probe_metadata(
+        self, upstream: UpstreamBase, feature_selection: str, upstream_device: str
+    ):
         paired_wavs = [torch.randn(SAMPLE_RATE).to(upstream_device)]
         with torch.no_grad():
             paired_features = upstream(paired_wavs)
@@ -166,39 +433,22 @@ class Featurizer(nn.Module):
                 )
                 raise ValueError
         self.feature_selection = feature_selection
-        self.layer_selection = layer_selection
-        self.normalize = normalize
 
         feature = self._select_feature(paired_features)
         if isinstance(feature, (list, tuple)):
-            self.layer_num = len(feature)
-            show(
-                f"[{self.name}] - Take a list of {self.layer_num} features and weighted sum them.",
-                file=sys.stderr,
-            )
-            self.weights = nn.Parameter(torch.zeros(self.layer_num))
-            feature = self._weighted_sum([f.cpu() for f in feature])
+            layer_num = len(feature)
+            feature = feature[0]
         else:
-            feature = feature.cpu()
+            layer_num = None
 
-        self.output_dim = feature.size(-1)
-        if hasattr(upstream, "get_downsample_rates"):
-            self.downsample_rate = upstream.get_downsample_rates(feature_selection)
-            show(
-                f"[{self.name}] - The selected feature {feature_selection}'s downsample rate is {self.downsample_rate}",
-                file=sys.stderr,
-            )
-        else:
-            self.downsample_rate = round(
+        return {
+            "feature_selection": feature_selection,
+            "layer_num": layer_num,
+            "output_dim": feature.size(-1),
+            "downsample_rate": round(
                 max(len(wav) for wav in paired_wavs) / feature.size(1)
-            )
-            show(
-                f"[{self.name}] - Warning: The provided upstream does not give statis downsample rate"
-                ' by the "get_downsample_rates" interface (see upstream/example/expert.py).'
-                " The downsample rate is calculated dynamically basing on the shape of the"
-                f" input waveforms v.s. the output features: {self.downsample_rate}",
-                file=sys.stderr,
-            )
+            ),
+        }
 
     def _select_feature(self, features):
         feature = features.get(self.feature_selection)
@@ -232,18 +482,8 @@ class Featurizer(nn.Module):
             " following options: --upstream_trainable --upstream_feature_selection last_hidden_state."
             " Or: -f -s last_hidden_state"
         )
-        stacked_feature = torch.stack(feature, dim=0)
-
-        if self.normalize:
-            stacked_feature = F.layer_norm(
-                stacked_feature, (stacked_feature.shape[-1],)
-            )
-
-        _, *origin_shape = stacked_feature.shape
-        stacked_feature = stacked_feature.view(self.layer_num, -1)
         norm_weights = F.softmax(self.weights, dim=-1)
-        weighted_feature = (norm_weights.unsqueeze(-1) * stacked_feature).sum(dim=0)
-        weighted_feature = weighted_feature.view(*origin_shape)
+        weighted_feature = weighted_sum(feature, norm_weights, self.normalize)
 
         return weighted_feature
 
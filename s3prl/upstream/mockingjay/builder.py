@@ -27,7 +27,7 @@ from torch.nn.utils.rnn import pad_sequence
 
 import s3prl.optimizers
 
-from ..baseline.extracter import get_extracter
+from ..baseline.extracter import batch_extract, get_extracter
 from ..baseline.preprocessor import get_preprocessor
 from .model import TransformerConfig, TransformerModel, TransformerSpecPredictionHead
 
@@ -382,8 +382,7 @@ class PretrainedTransformer(TransformerBuilder):
     def forward(self, x):
         if self.extracter is not None:
             if "kaldi" in self.config["audio"]:
-                x = [self.extracter(x_i) for x_i in x]
-                x = pad_sequence(x, batch_first=True)
+                x, _ = batch_extract(self.extracter, x)
             else:
                 x = [self._normalize_wav_decibel(x_i) for x_i in x]
                 x_lens = [len(x_) for x_ in x]
@@ -433,8 +432,7 @@ class PretrainedTransformerWithHead(PretrainedTransformer):
     def forward(self, x):
         if self.extracter is not None:
             if "kaldi" in self.config["audio"]:
-                x = [self.extracter(x_i) for x_i in x]
-                x = pad_sequence(x, batch_first=True)
+                x, _ = batch_extract(self.extracter, x)
             else:
                 x = [self._normalize_wav_decibel(x_i) for x_i in x]
                 x_lens = [len(x_) for x_ in x]
@@ -11,7 +11,12 @@ from s3prl.upstream.multires_hubert.hubert_model import (
     MultiresHubertModel,
     MultiresHubertPretrainingConfig,
 )
-from s3prl.upstream.utils import load_fairseq_ckpt, merge_with_parent
+from s3prl.upstream.utils import (
+    build_and_load_model,
+    load_converted_state,
+    load_fairseq_ckpt,
+    merge_with_parent,
+)
 from s3prl.util.download import _urls_to_filepaths
 # isort: on
 # fmt: on
@@ -38,7 +43,7 @@ def load_and_convert_fairseq_ckpt(fairseq_source: str, output_path: str = None):
 
 
 def load_converted_model(ckpt: str):
-    ckpt_state = torch.load(ckpt, map_location="cpu")
+    ckpt_state = load_converted_state(ckpt)
 
     for required_key in [
         "task_cfg",
@@ -55,9 +60,12 @@ def load_converted_model(ckpt: str):
         MultiresHubertPretrainingConfig, ckpt_state["task_cfg"]
     )
     model_cfg = merge_with_parent(MultiresHubertConfig, ckpt_state["model_cfg"])
-    model = MultiresHubertModel(model_cfg, task_cfg, ckpt_state["dictionaries_symbols"])
-
-    model.load_state_dict(ckpt_state["model_weight"])
+    model = build_and_load_model(
+        lambda: MultiresHubertModel(
+            model_cfg, task_cfg, ckpt_state["dictionaries_symbols"]
+        ),
+        ckpt_state["model_weight"],
+    )
     return model, task_cfg
 
 
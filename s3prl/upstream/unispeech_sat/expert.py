@@ -18,6 +18,7 @@ import torch.nn.functional as F
 from torch.nn.utils.rnn import pad_sequence
 
 from ..interfaces import UpstreamBase
+from ..utils import build_and_load_model, load_converted_state
 from ..wavlm.WavLM import WavLM, WavLMConfig
 
 ############
@@ -34,10 +35,9 @@ class UpstreamExpert(UpstreamBase):
     def __init__(self, ckpt, **kwargs):
         super().__init__(**kwargs)
 
-        checkpoint = torch.load(ckpt)
+        checkpoint = load_converted_state(ckpt)
         self.cfg = WavLMConfig(checkpoint["cfg"])
-        self.model = WavLM(self.cfg)
-        self.model.load_state_dict(checkpoint["model"])
+        self.model = build_and_load_model(lambda: WavLM(self.cfg), checkpoint["model"])
 
         self.model.feature_grad_mult = 0.0
         self.model.encoder.layerdrop = 0.0
@@ -1,9 +1,16 @@
 import argparse
+import importlib
+import inspect
 import logging
+from contextlib import contextmanager
 from copy import deepcopy
 from dataclasses import dataclass, is_dataclass
+from pathlib import Path
+from typing import Callable
 
 import torch
+import torch.nn as nn
+from torch.nn.utils.weight_norm import WeightNorm
 
 from s3prl.util.download import _urls_to_filepaths
 from s3prl.util.pseudo_data import get_pseudo_wavs
@@ -44,6 +51,154 @@ def merge_with_parent(dc: dataclass, cfg: dict):
     return dc(**cfg)
 
 
+def _fast_loading_supported():
+    return (
+        "mmap" in inspect.signature(torch.load).parameters
+        and "assign" in inspect.signature(nn.Module.load_state_dict).parameters
+    )
+
+
+def load_converted_state(ckpt: str) -> dict:
+    """
+    Load a converted checkpoint onto CPU. When supported (torch>=2.1 and the
+    checkpoint is in the zipfile format), the tensors are memory-mapped from
+    the file instead of being read into memory
+    """
+    if _fast_loading_supported():
+        try:
+            return torch.load(str(ckpt), map_location="cpu", mmap=True)
+        except RuntimeError:
+            logger.info(
+                f"{ckpt} can not be memory-mapped, run "
+                f"'python3 -m s3prl.upstream.utils {ckpt}' once to convert it"
+            )
+    return torch.load(ckpt, map_location="cpu")
+
+
+@contextmanager
+def _meta_device():
+    """
+    Create the tensors on the meta device. Weight norm (used by the positional
+    convolution of all the fairseq-style models) has no meta kernel before
+    torch 2.2, hence the equivalent decomposition
+    """
+    # the module, not the function with the same name
+    weight_norm = importlib.import_module("torch.nn.utils.weight_norm")
+
+    def _weight_norm(v, g, dim=0):
+        return v * (g / torch.norm_except_dim(v, 2, dim))
+
+    original = weight_norm._weight_norm
+    weight_norm._weight_norm = _weight_norm
+    try:
+        with torch.device("meta"):
+            yield
+    finally:
+        weight_norm._weight_norm = original
+
+
+def _meta_tensor_names(model: nn.Module):
+    names = []
+    for module_name, module in model.named_modules():
+        for hook in module._forward_pre_hooks.values():
+            # weight norm recomputes the weight in each forward, but the weight
+            # computed during __init__ is still on the meta device
+            if isinstance(hook, WeightNorm):
+                setattr(module, hook.name, hook.compute_weight(module))
+
+        tensors = list(module.named_parameters(recurse=False))
+        tensors += list(module.named_buffers(recurse=False))
+        tensors += [
+            (name, value)
+            for name, value in vars(module).items()
+            if isinstance(value, torch.Tensor)
+        ]
+        for name, tensor in tensors:
+            if tensor.is_meta:
+                names.append(f"{module_name}.{name}" if module_name else name)
+    return names
+
+
+def build_and_load_model(
+    build_model: Callable[[], nn.Module], state_dict: dict
+) -> nn.Module:
+    """
+    Build the model and load the state dict into it. When supported, the model
+    is built on the meta device so the random initialization is skipped, and the
+    (memory-mapped) tensors in the state dict are assigned to the model without
+    copying. Falls back to the regular loading if the model creates any tensor
+    which is not covered by the state dict
+
+    Args:
+        build_model (Callable): returns the model to be loaded
+        state_dict (dict): the model weights
+    """
+    if not _fast_loading_supported():
+        model = build_model()
+        model.load_state_dict(state_dict)
+        return model
+
+    try:
+        with _meta_device():
+            model = build_model()
+    except NotImplementedError as e:
+        logger.info(f"Fall back to the regular loading since: {e}")
+        model = build_model()
+        model.load_state_dict(state_dict)
+        return model
+
+    # assigning the tensors keeps their dtypes, so follow the ones of the model
+    # to get the same result as the copying load_state_dict
+    model_dtypes = {
+        name: tensor.dtype for name, tensor in model.state_dict(keep_vars=True).items()
+    }
+    state_dict = {
+        name: tensor.to(model_dtypes[name])
+        if name in model_dtypes and tensor.dtype != model_dtypes[name]
+        else tensor
+        for name, tensor in state_dict.items()
+    }
+
+    model.load_state_dict(state_dict, assign=True)
+    meta_tensors = _meta_tensor_names(model)
+    if len(meta_tensors) > 0:
+        logger.info(
+            f"Fall back to the regular loading since {meta_tensors} are not "
+            "materialized by the state dict"
+        )
+        model = build_model()
+        model.load_state_dict(state_dict)
+    return model
+
+
+def convert_to_mmap_ckpt(ckpt: str, output_path: str = None):
+    """
+    One-time conversion of an existing checkpoint into the format which can be
+    memory-mapped by :obj:`load_converted_state`. The tensors are made contiguous
+    and do not share storages, so each of them is mapped from its own record
+
+    Args:
+        ckpt (str): the checkpoint to convert
+        output_path (str): default to overwrite :code:`ckpt`
+    """
+
+    def detach(value):
+        if isinstance(value, torch.Tensor):
+            return value.detach().contiguous().clone()
+        if isinstance(value, dict):
+            return value.__class__((k, detach(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return value.__class__(detach(v) for v in value)
+        return value
+
+    state = detach(torch.load(ckpt, map_location="cpu"))
+    output_path = Path(output_path or ckpt)
+    output_path.parent.mkdir(exist_ok=True, parents=True)
+    tmp_path = output_path.parent / f"{output_path.name}.tmp"
+    torch.save(state, tmp_path, _use_new_zipfile_serialization=True)
+    tmp_path.replace(output_path)
+
+
 def extract_hidden_states(model):
     model.eval()
     with torch.no_grad():
@@ -61,3 +216,20 @@ def models_all_close(*models):
     assert len(models) > 1
     for model in models[1:]:
         are_same_models(models[0], model)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert checkpoints into the format which can be memory-mapped"
+    )
+    parser.add_argument("ckpts", nargs="+")
+    parser.add_argument(
+        "--output_dir", help="Default to overwrite the checkpoints in place"
+    )
+    args = parser.parse_args()
+
+    for ckpt in args.ckpts:
+        output_path = None
+        if args.output_dir is not None:
+            output_path = Path(args.output_dir) / Path(ckpt).name
+        convert_to_mmap_ckpt(ckpt, output_path)
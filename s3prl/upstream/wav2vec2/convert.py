@@ -3,7 +3,12 @@ from pathlib import Path
 import torch
 
 import s3prl
-from s3prl.upstream.utils import load_fairseq_ckpt, merge_with_parent
+from s3prl.upstream.utils import (
+    build_and_load_model,
+    load_converted_state,
+    load_fairseq_ckpt,
+    merge_with_parent,
+)
 from s3prl.upstream.wav2vec2.wav2vec2_model import (
     AudioPretrainingConfig,
     Wav2Vec2Config,
@@ -24,7 +29,7 @@ def load_and_convert_fairseq_ckpt(fairseq_source: str, output_path: str = None):
 
 
 def load_converted_model(ckpt: str):
-    ckpt_state = torch.load(ckpt, map_location="cpu")
+    ckpt_state = load_converted_state(ckpt)
 
     for required_key in ["task_cfg", "model_cfg", "model_weight"]:
         if required_key not in ckpt_state:
@@ -34,8 +39,10 @@ def load_converted_model(ckpt: str):
 
     task_cfg = merge_with_parent(AudioPretrainingConfig, ckpt_state["task_cfg"])
     model_cfg = merge_with_parent(Wav2Vec2Config, ckpt_state["model_cfg"])
-    model = Wav2Vec2Model(model_cfg)
-    model.load_state_dict(ckpt_state["model_weight"])
+    model = build_and_load_model(
+        lambda: Wav2Vec2Model(model_cfg),
+        ckpt_state["model_weight"],
+    )
     return model, task_cfg
 
 
@@ -6,12 +6,12 @@ from torch.nn.utils.rnn import pad_sequence
 
 from s3prl.utility.helper import zero_mean_unit_var_norm
 
-from ..interfaces import UpstreamBase
+from ..interfaces import UpstreamBase, unpad_hook_hiddens
 from .convert import load_converted_model
 
 logger = logging.getLogger(__name__)
 
-from ..interfaces import UpstreamBase
+from ..interfaces import UpstreamBase, unpad_hook_hiddens
 from .convert import load_converted_model
 
 logger = logging.getLogger(__name__)
@@ -47,13 +47,7 @@ class UpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
     def get_downsample_rates(self, key: str) -> int:
         return 320
@@ -74,8 +68,19 @@ class UpstreamExpert(UpstreamBase):
         )
         padded_wav = pad_sequence(wavs, batch_first=True)
 
+        num_encoder_layers = len(self.model.encoder.layers)
+        if self.feature_selection is None:
+            output_layer = self._early_exit_layer(num_encoder_layers)
+        elif self.max_layer is not None and self.max_layer < num_encoder_layers - 1:
+            # each hidden state is the output of the corresponding block
+            output_layer = self.max_layer + 1
+        else:
+            output_layer = None
+
         results = self.model.extract_features(
-            padded_wav, wav_padding_mask if self.apply_padding_mask else None
+            padded_wav,
+            wav_padding_mask if self.apply_padding_mask else None,
+            layer=None if output_layer is None else output_layer - 1,
         )
 
         if self.feature_selection is not None:
@@ -123,13 +128,7 @@ class LegacyUpstreamExpert(UpstreamBase):
                 )
             self.add_hook("self.model.encoder", lambda input, output: output[0])
 
-            def postprocess(xs):
-                names, hiddens = zip(*xs)
-                unpad_len = min([hidden.size(1) for hidden in hiddens])
-                hiddens = [hidden[:, :unpad_len, :] for hidden in hiddens]
-                return list(zip(names, hiddens))
-
-            self.hook_postprocess = postprocess
+            self.hook_postprocess = unpad_hook_hiddens
 
     @staticmethod
     def load_model(ckpt_path: str):
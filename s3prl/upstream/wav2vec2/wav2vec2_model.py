@@ -1015,6 +1015,12 @@ class MultiheadAttention(nn.Module):
         self.k_proj.out_features = self.embed_dim
         self.v_proj.out_features = self.embed_dim
 
+    def _has_float_projections(self):
+        return all(
+            isinstance(proj, nn.Linear)
+            for proj in (self.q_proj, self.k_proj, self.v_proj, self.out_proj)
+        )
+
     def _set_skip_embed_dim_check(self):
         self.skip_embed_dim_check = True
 
@@ -1134,6 +1140,8 @@ class MultiheadAttention(nn.Module):
             # Since pruning will break the dimension check and it is not easy to modify the pytorch API,
             # it is preferred to bypass the pytorch MHA when we need to skip embed_dim_check
             and not self.skip_embed_dim_check
+            # The dynamically quantized projections have no weight tensors
+            and self._has_float_projections()
         ):
             assert key is not None and value is not None
 
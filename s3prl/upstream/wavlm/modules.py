@@ -185,6 +185,9 @@ def init_bert_params(module):
     def normal_(data):
         # with FSDP, module params will be on CUDA, so we cast them back to CPU
         # so that the RNG is consistent with and without FSDP
+        if data.is_meta:
+            # nothing to initialize, the weights will be loaded
+            return
         data.copy_(data.cpu().normal_(mean=0.0, std=0.02).to(data.device))
 
     if isinstance(module, nn.Linear):
@@ -524,6 +527,11 @@ class MultiheadAttention(nn.Module):
             # treats bias in linear module as method.
             and not torch.jit.is_scripting()
             and self.q_head_dim == self.head_dim
+            # the dynamically quantized projections have no weight tensors
+            and all(
+                isinstance(proj, nn.Linear)
+                for proj in (self.q_proj, self.k_proj, self.v_proj, self.out_proj)
+            )
         ):
             assert key is not None and value is not None
             assert attn_mask is None
@@ -0,0 +1,202 @@
+"""
+Keep the decoded waveforms in the shared memory, so the recordings re-read many times
+per epoch (e.g. speaker verification and diarization) are decoded only once and
+shared by all the DataLoader workers
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import weakref
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = "index.db"
+_SHM_DIR = Path("/dev/shm")
+
+__all__ = [
+    "SharedAudioCache",
+]
+
+
+def _remove(root: str, owner_pid: int):
+    # the forked workers also hold the finalizer, but only the owner cleans up
+    if os.getpid() == owner_pid:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+class SharedAudioCache:
+    """
+    A size-bounded LRU cache of the decoded waveforms. The arrays are saved in a
+    directory on the shared memory (:code:`/dev/shm`, which is RAM-backed) and indexed
+    by a SQLite database in the same directory, so every process holding (a pickled
+    copy of) the cache sees the same entries. The least recently used entries are
+    evicted when the total size exceeds :code:`max_bytes`.
+
+    Create the cache in the main process and hand it to the dataset (e.g.
+    :obj:`s3prl.dataio.dataset.LoadAudio`) before building the DataLoader. The directory
+    is removed when the cache in the main process is garbage collected or closed
+
+    Args:
+        max_bytes (int): the maximum total size of the cached waveforms
+        root (str): where to create the cache directory. Default to :code:`/dev/shm`
+            when available, otherwise the system temporary directory
+    """
+
+    def __init__(self, max_bytes: int, root: str = None) -> None:
+        self.max_bytes = int(max_bytes)
+        if root is None:
+            root = _SHM_DIR if _SHM_DIR.is_dir() else tempfile.gettempdir()
+        self.root = Path(tempfile.mkdtemp(prefix="s3prl_audio_cache_", dir=root))
+        self._connection = None
+        self._connection_pid = None
+
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE entries (key TEXT PRIMARY KEY, file TEXT, "
+                "nbytes INTEGER, sample_rate INTEGER, last_used INTEGER)"
+            )
+            connection.execute("CREATE INDEX entries_lru ON entries (last_used)")
+            connection.execute(
+                "CREATE TABLE counters (name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            connection.executemany(
+                "INSERT INTO counters VALUES (?, 0)", [("hits",), ("misses",)]
+            )
+        self._finalizer = weakref.finalize(self, _remove, str(self.root), os.getpid())
+
+    def __getstate__(self):
+        # each process opens its own connection
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_connection_pid"] = None
+        state["_finalizer"] = None
+        return state
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(str(self.root / DB_FILE), timeout=600)
+            self._connection.execute("PRAGMA synchronous = OFF")
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _file(self, key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest() + ".npy"
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Returns:
+            tuple
+
+            1. data (np.ndarray): the cached waveform, memory-mapped read-only, so
+               only the accessed part is read. Copy the needed part with
+               :code:`np.array(data[start:end])`
+            2. sample_rate (int)
+
+            or None if the key is not cached
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT file, sample_rate FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    (time.time_ns(), key),
+                )
+            counter = "misses" if row is None else "hits"
+            connection.execute(
+                "UPDATE counters SET value = value + 1 WHERE name = ?", (counter,)
+            )
+
+        if row is None:
+            return None
+
+        file, sample_rate = row
+        try:
+            data = np.load(self.root / file, mmap_mode="r")
+        except (OSError, ValueError):
+            # evicted by another process after the lookup
+            with self._connect() as connection:
+                connection.execute(
+                    "UPDATE counters SET value = value + "
+                    "(CASE name WHEN 'misses' THEN 1 ELSE -1 END)"
+                )
+            return None
+        return data, sample_rate
+
+    def put(self, key: str, data: np.ndarray, sample_rate: int):
+        """
+        Cache the waveform, and evict the least recently used entries if the cache
+        exceeds :code:`max_bytes`. The waveform larger than :code:`max_bytes` is not
+        cached
+        """
+        data = np.ascontiguousarray(data)
+        if data.nbytes > self.max_bytes:
+            return
+
+        file = self._file(key)
+        with tempfile.NamedTemporaryFile(
+            dir=self.root, suffix=".tmp", delete=False
+        ) as f:
+            np.save(f, data)
+        os.replace(f.name, self.root / file)
+
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, file, data.nbytes, sample_rate, time.time_ns()),
+            )
+            total = connection.execute("SELECT SUM(nbytes) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            evicted = []
+            for evicted_key, evicted_file, nbytes in connection.execute(
+                "SELECT key, file, nbytes FROM entries WHERE key != ? "
+                "ORDER BY last_used",
+                (key,),
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                evicted.append((evicted_key,))
+                total -= nbytes
+                try:
+                    os.remove(self.root / evicted_file)
+                except FileNotFoundError:
+                    pass
+            connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict
+
+            The :code:`hits` and :code:`misses` counted across all the processes,
+            and the current number of :code:`entries` and their total :code:`bytes`
+        """
+        connection = self._connect()
+        stats = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+        entries, nbytes = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries"
+        ).fetchone()
+        stats.update(entries=entries, bytes=nbytes)
+        return stats
+
+    def close(self):
+        """
+        Remove the cache directory. Only takes effect in the process creating the cache
+        """
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._finalizer is not None:
+            self._finalizer()
@@ -1,18 +1,29 @@
-import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
+import numpy as np
 import torchaudio
 from joblib import Parallel, delayed
 from tqdm import tqdm
 
+logger = logging.getLogger(__name__)
+
 _default_cache_dir = Path.home() / ".cache" / "s3prl" / "audio_info"
 
+DB_FILE = "audio_info.db"
+INFO_KEYS = ["sample_rate", "num_frames", "num_channels", "bits_per_sample", "encoding"]
+_QUERY_SIZE = 900  # below the default SQLITE_MAX_VARIABLE_NUMBER
+
 
 __all__ = [
     "get_cache_dir",
     "set_cache_dir",
     "get_audio_info",
+    "get_audio_lengths",
 ]
 
 
@@ -26,40 +37,131 @@ def set_cache_dir(cache_dir: str):
     _default_cache_dir = Path(cache_dir)
 
 
+def _connect(cache_dir: str = None) -> sqlite3.Connection:
+    cache_dir = Path(cache_dir or get_cache_dir())
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    # the timeout lets the concurrent processes (e.g. DDP ranks) wait for the lock
+    connection = sqlite3.connect(str(cache_dir / DB_FILE), timeout=600)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS audio_info ("
+        "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+        "sample_rate INTEGER, num_frames INTEGER, num_channels INTEGER, "
+        "bits_per_sample INTEGER, encoding TEXT)"
+    )
+    return connection
+
+
+def _stat(audio_path: str) -> Tuple[int, int]:
+    stat = os.stat(audio_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _lookup(connection: sqlite3.Connection, stats: dict) -> dict:
+    """
+    Returns:
+        dict
+
+        path -> info, for the paths cached with the same mtime and size
+    """
+    paths = list(stats.keys())
+    cached = {}
+    for start in range(0, len(paths), _QUERY_SIZE):
+        batch = paths[start : start + _QUERY_SIZE]
+        rows = connection.execute(
+            f"SELECT path, mtime_ns, size, {', '.join(INFO_KEYS)} FROM audio_info "
+            f"WHERE path IN ({', '.join('?' * len(batch))})",
+            batch,
+        )
+        for path, mtime_ns, size, *values in rows:
+            if stats[path] == (mtime_ns, size):
+                cached[path] = dict(zip(INFO_KEYS, values))
+    return cached
+
+
+def _write(connection: sqlite3.Connection, stats: dict, infos: dict):
+    with connection:
+        connection.executemany(
+            f"INSERT OR REPLACE INTO audio_info VALUES ({', '.join('?' * 8)})",
+            [
+                (path, *stats[path], *[info[key] for key in INFO_KEYS])
+                for path, info in infos.items()
+            ],
+        )
+
+
+def _get_info(audio_path: str) -> dict:
+    torchaudio.set_audio_backend("sox_io")
+    torchaudio_info = torchaudio.info(audio_path)
+    return {
+        "sample_rate": torchaudio_info.sample_rate,
+        "num_frames": torchaudio_info.num_frames,
+        "num_channels": torchaudio_info.num_channels,
+        "bits_per_sample": torchaudio_info.bits_per_sample,
+        "encoding": torchaudio_info.encoding,
+    }
+
+
 def get_audio_info(
     audio_paths: List[str],
-    audio_ids: List[str],
+    audio_ids: List[str] = None,
     cache_dir: str = None,
     num_workers: int = 6,
 ) -> List[dict]:
     """
     Use :code:`torchaudio.info` to retrieve the metadata from audio paths.
-    The retrieved metadata is cached in :code:`cache_dir`
+    The retrieved metadata is cached in a single SQLite database in :code:`cache_dir`,
+    keyed by the absolute path and invalidated when the file's mtime or size changes.
+    Only the uncached files are inspected, and they are written back in one transaction
+
+    Args:
+        audio_paths (List[str]): the audio files
+        audio_ids (List[str]): not used. The cache is keyed by the path
+        cache_dir (str): default to :obj:`get_cache_dir`
+        num_workers (int): the parallel jobs to inspect the uncached files
+
+    Returns:
+        List[dict]
+
+        The metadata of each audio, with the keys in :code:`INFO_KEYS`
     """
+    paths = [os.path.abspath(audio_path) for audio_path in audio_paths]
+    stats = {path: _stat(path) for path in paths}
 
-    cache_dir = cache_dir or get_cache_dir()
-    cache_dir: Path = Path(cache_dir)
-
-    def _get_info(audio_path: str, audio_id: str):
-        cache_file = cache_dir / f"{audio_id}.json"
-        if cache_file.is_file():
-            with cache_file.open() as f:
-                info = json.load(f)
-                return info
-
-        torchaudio.set_audio_backend("sox_io")
-        torchaudio_info = torchaudio.info(audio_path)
-        info = {
-            "sample_rate": torchaudio_info.sample_rate,
-            "num_frames": torchaudio_info.num_frames,
-            "num_channels": torchaudio_info.num_channels,
-            "bits_per_sample": torchaudio_info.bits_per_sample,
-            "encoding": torchaudio_info.encoding,
-        }
-        return info
-
-    infos = Parallel(n_jobs=num_workers)(
-        delayed(_get_info)(path, idx)
-        for path, idx in tqdm(zip(audio_paths, audio_ids), desc="Get audio metadata")
-    )
-    return infos
+    with closing(_connect(cache_dir)) as connection:
+        infos = _lookup(connection, stats)
+        missing = [path for path in stats if path not in infos]
+        if len(missing) > 0:
+            logger.info(
+                f"Get audio metadata for {len(missing)} uncached files "
+                f"({len(stats) - len(missing)} cached)"
+            )
+            new_infos = Parallel(n_jobs=num_workers)(
+                delayed(_get_info)(path)
+                for path in tqdm(missing, desc="Get audio metadata")
+            )
+            new_infos = dict(zip(missing, new_infos))
+            _write(connection, stats, new_infos)
+            infos.update(new_infos)
+
+    return [dict(infos[path]) for path in paths]
+
+
+def get_audio_lengths(
+    audio_paths: List[str],
+    cache_dir: str = None,
+    num_workers: int = 6,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The bulk version of :obj:`get_audio_info` for the samplers, which only need the
+    lengths of all the utterances
+
+    Returns:
+        tuple
+
+        1. num_frames (np.ndarray): (num_audios, )
+        2. sample_rate (np.ndarray): (num_audios, )
+    """
+    infos = get_audio_info(audio_paths, cache_dir=cache_dir, num_workers=num_workers)
+    num_frames = np.array([info["num_frames"] for info in infos], dtype=np.int64)
+    sample_rate = np.array([info["sample_rate"] for info in infos], dtype=np.int64)
+    return num_frames, sample_rate
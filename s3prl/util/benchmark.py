@@ -1,15 +1,17 @@
 """
-Benchmark the timing a block of code
+Benchmark the timing a block of code, and break down the time of the training steps
 
 Authors
   * Leo 2022
 """
 
+import json
 import logging
 from collections import defaultdict
-from contextlib import ContextDecorator
+from contextlib import ContextDecorator, contextmanager
+from pathlib import Path
 from time import time
-from typing import Any
+from typing import Any, Callable, Iterable
 
 import numpy as np
 import torch
@@ -17,7 +19,13 @@ import torch
 logger = logging.getLogger(__name__)
 _history = defaultdict(list)
 
-__all__ = ["benchmark"]
+__all__ = ["benchmark", "StepTimer"]
+
+
+def _synchronize():
+    # do not initialize CUDA only for timing, and work on the CPU-only hosts
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
 
 
 class benchmark(ContextDecorator):
@@ -27,11 +35,11 @@ class benchmark(ContextDecorator):
         self.freq = freq
 
     def __enter__(self):
-        torch.cuda.synchronize()
+        _synchronize()
         self.start = time()
 
     def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
-        torch.cuda.synchronize()
+        _synchronize()
         seconds = time() - self.start
 
         global _history
@@ -40,3 +48,186 @@ class benchmark(ContextDecorator):
             logger.warning(
                 f"{self.name}: {seconds} secs, avg {np.array(_history[self.name]).mean()} secs"
             )
+
+
+class StepTimer:
+    """
+    Break down the wall time of the training steps into the named phases, e.g. the
+    data waiting, the host-to-device copy, the forward, the backward and the optimizer
+    step, and count the processed utterances and audio seconds. The time of a nested
+    phase is excluded from its outer phase, and the time not covered by any phase is
+    reported as "other"
+
+    The CUDA kernels are asynchronous, so by default the GPU time is attributed to the
+    phase waiting for it, e.g. the one calling :code:`loss.item()`. Set :code:`sync` to
+    synchronize CUDA at the phase boundaries, which attributes the GPU time correctly
+    but stops the copies and the computation from overlapping
+
+    Args:
+        sync (bool): synchronize CUDA at the phase boundaries
+    """
+
+    def __init__(self, sync: bool = False) -> None:
+        self.sync = sync
+        self._stack = []
+        self._window = self._new_stats()
+        self._total = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return dict(
+            start=time(),
+            steps=0,
+            utterances=0,
+            audio_seconds=0.0,
+            phases=defaultdict(float),
+        )
+
+    def start(self, name: str):
+        if self.sync:
+            _synchronize()
+        self._stack.append([name, time(), 0.0])
+
+    def stop(self, name: str):
+        """
+        Stop the phase :code:`name`. The inner phases left open, e.g. by an exception,
+        are discarded. Stopping a phase which is not started does nothing
+        """
+        if name not in [entry[0] for entry in self._stack]:
+            return
+        if self.sync:
+            _synchronize()
+        while True:
+            entry_name, start, inner_seconds = self._stack.pop()
+            if entry_name == name:
+                break
+
+        seconds = time() - start
+        for stats in [self._window, self._total]:
+            stats["phases"][name] += seconds - inner_seconds
+        if len(self._stack) > 0:
+            self._stack[-1][2] += seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def wrap(self, fn: Callable, name: str) -> Callable:
+        """
+        Return :code:`fn` timed as the phase :code:`name`
+        """
+
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+
+        return timed
+
+    def iterate(self, iterable: Iterable, name: str = "data"):
+        """
+        Iterate :code:`iterable` and time the waiting for each item as the phase
+        :code:`name`
+        """
+        iterator = iter(iterable)
+        while True:
+            self.start(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stop(name)
+            yield item
+
+    def hook(self, module: torch.nn.Module, name: str, parent: str):
+        """
+        Time the forward of :code:`module` as the phase :code:`name`, but only when it
+        is called inside the phase :code:`parent`, so the same module called elsewhere
+        (e.g. in the evaluation) is not counted
+
+        Return:
+            the hook handles to remove
+        """
+
+        def pre_hook(*args):
+            if parent in [entry[0] for entry in self._stack]:
+                self.start(name)
+
+        def hook(*args):
+            self.stop(name)
+
+        return [
+            module.register_forward_pre_hook(pre_hook),
+            module.register_forward_hook(hook),
+        ]
+
+    def count(self, utterances: int, audio_seconds: float = 0.0):
+        for stats in [self._window, self._total]:
+            stats["utterances"] += utterances
+            stats["audio_seconds"] += audio_seconds
+
+    def step(self):
+        for stats in [self._window, self._total]:
+            stats["steps"] += 1
+
+    @staticmethod
+    def _summarize(stats: dict) -> dict:
+        wall_seconds = time() - stats["start"]
+        phases = dict(stats["phases"])
+        phases["other"] = max(wall_seconds - sum(phases.values()), 0.0)
+        steps = max(stats["steps"], 1)
+        return dict(
+            steps=stats["steps"],
+            wall_seconds=wall_seconds,
+            seconds_per_step=wall_seconds / steps,
+            phase_seconds=phases,
+            phase_seconds_per_step={
+                name: seconds / steps for name, seconds in phases.items()
+            },
+            utterances_per_sec=stats["utterances"] / wall_seconds,
+            audio_secs_per_sec=stats["audio_seconds"] / wall_seconds,
+        )
+
+    def log(self, tensorboard, global_step: int) -> dict:
+        """
+        Write the per-step phase seconds and the throughput since the last call to
+        the TensorBoard :code:`SummaryWriter`, and start a new window
+
+        Return:
+            dict, the summary of the window
+        """
+        summary = self._summarize(self._window)
+        self._window = self._new_stats()
+        if summary["steps"] == 0:
+            return summary
+
+        tensorboard.add_scalar(
+            "timing/step", summary["seconds_per_step"], global_step=global_step
+        )
+        for name, seconds in summary["phase_seconds_per_step"].items():
+            tensorboard.add_scalar(f"timing/{name}", seconds, global_step=global_step)
+        for key in ["utterances_per_sec", "audio_secs_per_sec"]:
+            tensorboard.add_scalar(
+                f"throughput/{key}", summary[key], global_step=global_step
+            )
+        return summary
+
+    def summary(self) -> dict:
+        """
+        Return:
+            dict, the summary since the timer is created
+        """
+        return self._summarize(self._total)
+
+    def dump(self, path: str) -> dict:
+        """
+        Write :obj:`summary` into a JSON file
+        """
+        summary = self.summary()
+        with Path(path).open("w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
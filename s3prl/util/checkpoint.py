@@ -0,0 +1,200 @@
+"""
+Write the checkpoints in a background thread, so the training loop only pays for
+copying the states to CPU
+"""
+
+import os
+import shutil
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import copy, deepcopy
+from pathlib import Path
+from typing import Any, Callable, List
+
+import torch
+
+__all__ = [
+    "snapshot",
+    "AsyncCheckpointWriter",
+]
+
+
+def snapshot(obj: Any) -> Any:
+    """
+    Copy all the tensors in the (nested) dict, list or tuple to CPU, and deep copy the
+    other values, so the returned object is not affected by the following training steps
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        # the shallow copy keeps the dict subclass and its attributes, e.g. the
+        # _metadata of the state_dict
+        copied = copy(obj)
+        for key, value in obj.items():
+            copied[key] = snapshot(value)
+        return copied
+    if isinstance(obj, (list, tuple)) and not hasattr(obj, "_fields"):
+        return obj.__class__(snapshot(value) for value in obj)
+    return deepcopy(obj)
+
+
+def _link_or_copy(src: Path, dst: Path):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _publish(src: Path, dst: Path):
+    """
+    Replace :code:`dst` with :code:`src` by renames, so :code:`dst` is never partially written
+    """
+    trash = None
+    if dst.exists():
+        trash = dst.parent / f".{dst.name}.old-{uuid.uuid4().hex}"
+        os.replace(dst, trash)
+    os.replace(src, dst)
+    if trash is not None:
+        if trash.is_dir():
+            shutil.rmtree(trash, ignore_errors=True)
+        else:
+            trash.unlink()
+
+
+def _publish_copies(src: Path, dsts: List[Path]):
+    """
+    Publish the same checkpoint to all the destinations, but only write it once. The
+    other destinations hard-link the written files when possible
+    """
+    for dst in dsts[1:]:
+        tmp = dst.parent / f".{dst.name}.tmp-{uuid.uuid4().hex}"
+        if src.is_dir():
+            shutil.copytree(src, tmp, copy_function=_link_or_copy)
+        else:
+            _link_or_copy(src, tmp)
+        _publish(tmp, dst)
+    _publish(src, dsts[0])
+
+
+class AsyncCheckpointWriter:
+    """
+    Serialize the checkpoints in a background thread. The states are snapshotted to CPU
+    when they are given, so the training can continue right away. The jobs run in the
+    submitted order, and each checkpoint is first written to a temporary path and then
+    renamed, so a crash never leaves a partially written checkpoint.
+
+    The exception in the background is re-raised by the next call of the writer
+
+    Args:
+        max_pending (int): the maximum number of the unfinished checkpoints. Saving
+            more checkpoints waits for the oldest one, which bounds the memory used by
+            the snapshots
+    """
+
+    def __init__(self, max_pending: int = 2) -> None:
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures: List[Future] = []
+        self._saves = None
+
+    def _check(self, max_unfinished: int = None):
+        futures = []
+        for future in self._futures:
+            if future.done():
+                future.result()
+            else:
+                futures.append(future)
+        self._futures = futures
+
+        while max_unfinished is not None and len(self._futures) > max_unfinished:
+            self._futures.pop(0).result()
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """
+        Run :code:`fn` in the background after all the previously submitted jobs, e.g.
+        removing the outdated checkpoints
+        """
+        self._check()
+        self._futures.append(self._executor.submit(fn, *args, **kwargs))
+
+    def save(self, obj: Any, path: str):
+        """
+        The drop-in replacement of :code:`torch.save`. Inside :obj:`checkpoint`, the
+        writing is deferred until the context exits. Otherwise, the object is written
+        to a temporary file in the background and then renamed to :code:`path`
+        """
+        obj = snapshot(obj)
+        if self._saves is not None:
+            self._saves.append((obj, path))
+        else:
+            self._write_copies(obj, [path])
+
+    def save_copies(self, obj: Any, paths: List[str]):
+        """
+        Save the object to all the paths, but serialize it only once
+        """
+        self._write_copies(snapshot(obj), paths)
+
+    def _write_copies(self, obj: Any, paths: List[str]):
+        paths = [Path(path) for path in paths]
+        tmp = paths[0].parent / f".{paths[0].name}.tmp-{uuid.uuid4().hex}"
+
+        def _write():
+            torch.save(obj, tmp)
+            _publish_copies(tmp, paths)
+
+        self._check(self.max_pending - 1)
+        self.submit(_write)
+
+    @contextmanager
+    def checkpoint(self, ckpt_dirs: List[str]):
+        """
+        Yield a temporary directory to write a checkpoint into, with :obj:`save` in place
+        of :code:`torch.save`. The small files can be written directly. After the
+        context exits, the deferred saves are serialized in the background, and then
+        the directory is renamed to the first of :code:`ckpt_dirs`. The other
+        directories get the same checkpoint without serializing again
+
+        Args:
+            ckpt_dirs (List[str]): the directories of the same checkpoint,
+                e.g. :code:`valid_best` and :code:`step_N` of the same step
+        """
+        assert self._saves is None, "The checkpoints can not be nested"
+        ckpt_dirs = [Path(ckpt_dir) for ckpt_dir in ckpt_dirs]
+        ckpt_dirs[0].parent.mkdir(exist_ok=True, parents=True)
+        tmp = ckpt_dirs[0].parent / f".{ckpt_dirs[0].name}.tmp-{uuid.uuid4().hex}"
+        tmp.mkdir()
+
+        self._saves = []
+        try:
+            yield tmp
+            saves = self._saves
+        except:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        finally:
+            self._saves = None
+
+        def _write():
+            for obj, path in saves:
+                torch.save(obj, path)
+            _publish_copies(tmp, ckpt_dirs)
+
+        self._check(self.max_pending - 1)
+        self.submit(_write)
+
+    def wait(self):
+        """
+        Wait for all the submitted jobs
+        """
+        self._check(0)
+
+    def close(self):
+        """
+        Wait for all the submitted jobs and stop the background thread
+        """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
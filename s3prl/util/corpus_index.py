@@ -0,0 +1,82 @@
+"""
+Persist the parsed corpus index on disk, so preparing the same corpus again does not
+walk the (possibly network-mounted) directories again
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_default_cache_dir = Path.home() / ".cache" / "s3prl" / "corpus_index"
+
+__all__ = [
+    "get_cache_dir",
+    "set_cache_dir",
+    "cached_index",
+]
+
+
+def get_cache_dir():
+    _default_cache_dir.mkdir(exist_ok=True, parents=True)
+    return _default_cache_dir
+
+
+def set_cache_dir(cache_dir: str):
+    global _default_cache_dir
+    _default_cache_dir = Path(cache_dir)
+
+
+def _signature(root: Path) -> List[Tuple[str, int]]:
+    # the mtime of a directory changes when its entries are added or removed
+    signature = [(".", root.stat().st_mtime_ns)]
+    with os.scandir(root) as entries:
+        for entry in entries:
+            signature.append((entry.name, entry.stat().st_mtime_ns))
+    return sorted(signature)
+
+
+def cached_index(
+    name: str, root: str, build: Callable[[], Any], cache_dir: str = None
+) -> Any:
+    """
+    Return the cached index of the corpus directory, or call :code:`build` and cache
+    its (picklable) result. The cache is keyed by :code:`name`, the absolute path of
+    :code:`root`, and the mtimes of :code:`root` and its direct children. Hence adding
+    or removing a file deep inside the tree is not detected, which is fine for the
+    released corpora
+
+    Args:
+        name (str): identifies the index format, e.g. the corpus name
+        root (str): the directory indexed by :code:`build`
+        build (Callable): builds the index, usually by walking :code:`root` once
+        cache_dir (str): default to :obj:`get_cache_dir`
+    """
+    root = Path(root).resolve()
+    key = hashlib.sha1(repr((name, str(root), _signature(root))).encode()).hexdigest()
+    cache_dir = Path(cache_dir or get_cache_dir())
+    cache_dir.mkdir(exist_ok=True, parents=True)
+    cache_file = cache_dir / f"{name}_{key}.pkl"
+
+    if cache_file.is_file():
+        try:
+            with cache_file.open("rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Fail to load the corpus index {cache_file}: {e}")
+
+    index = build()
+    try:
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            pickle.dump(index, f)
+        os.replace(f.name, cache_file)
+    except OSError as e:
+        logger.warning(f"Fail to cache the corpus index of {root}: {e}")
+    return index
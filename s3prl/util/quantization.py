@@ -0,0 +1,192 @@
+"""
+Quantize the upstreams for the CPU inference, and persist the quantized weights
+on disk so the repeated loads do not need to quantize again
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import torch
+import torch.nn as nn
+
+logger = logging.getLogger(__name__)
+
+_default_cache_dir = Path.home() / ".cache" / "s3prl" / "quantized"
+
+QUANTIZATIONS = ["dynamic_int8"]
+
+__all__ = [
+    "QUANTIZATIONS",
+    "get_cache_dir",
+    "set_cache_dir",
+    "quantize_upstream",
+    "layerwise_cosine_similarity",
+]
+
+
+def get_cache_dir():
+    _default_cache_dir.mkdir(exist_ok=True, parents=True)
+    return _default_cache_dir
+
+
+def set_cache_dir(cache_dir: str):
+    global _default_cache_dir
+    _default_cache_dir = Path(cache_dir)
+
+
+def _quantize_dynamic(*args, **kwargs):
+    if hasattr(torch, "ao"):
+        from torch.ao.quantization import quantize_dynamic
+    else:
+        from torch.quantization import quantize_dynamic
+    return quantize_dynamic(*args, **kwargs)
+
+
+def _dynamic_linear_cls():
+    if hasattr(torch, "ao"):
+        import torch.ao.nn.quantized.dynamic as nnqd
+    else:
+        import torch.nn.quantized.dynamic as nnqd
+    return nnqd.Linear
+
+
+def _quantization_targets(upstream: nn.Module) -> List[nn.Module]:
+    """
+    The transformer stacks of the fairseq-style upstreams (wav2vec2, HuBERT, WavLM...)
+    are at :code:`upstream.model.encoder`. Fall back to the whole upstream otherwise
+    """
+    encoder = getattr(getattr(upstream, "model", None), "encoder", None)
+    if isinstance(encoder, nn.Module):
+        return [encoder]
+    logger.info(
+        f"{type(upstream).__name__} has no model.encoder, quantize the whole upstream"
+    )
+    return [upstream]
+
+
+def _swap_linears(module: nn.Module) -> List[Tuple[nn.Module, str, nn.Linear]]:
+    """
+    Replace the :code:`nn.Linear` (but not its subclasses, following quantize_dynamic)
+    with the empty dynamic quantized Linear, whose packed weights are then loaded
+    from the state dict without quantizing again
+
+    Returns:
+        the (parent module, name, original Linear) of the replaced ones
+    """
+    linear_cls = _dynamic_linear_cls()
+    swapped = []
+    for name, child in module.named_children():
+        if type(child) is nn.Linear:
+            setattr(
+                module,
+                name,
+                linear_cls(
+                    child.in_features,
+                    child.out_features,
+                    bias_=child.bias is not None,
+                    dtype=torch.qint8,
+                ),
+            )
+            swapped.append((module, name, child))
+        else:
+            swapped += _swap_linears(child)
+    return swapped
+
+
+def _load_quantized(targets: List[nn.Module], cache_file: Path) -> bool:
+    """
+    Load the cached quantized weights into the targets. On failure, the targets are
+    restored to the float modules, so they can be quantized again
+    """
+    swapped, float_states = [], []
+    try:
+        states = torch.load(cache_file, map_location="cpu")
+        assert len(states) == len(targets)
+        for target, state in zip(targets, states):
+            # load_state_dict copies the matched weights before raising the errors
+            float_states.append(
+                (target, {k: v.clone() for k, v in target.state_dict().items()})
+            )
+            swapped += _swap_linears(target)
+            target.load_state_dict(state)
+    except Exception as e:
+        logger.warning(f"Fail to load the quantized upstream cache {cache_file}: {e}")
+        for module, name, linear in swapped:
+            setattr(module, name, linear)
+        for target, float_state in float_states:
+            target.load_state_dict(float_state)
+        return False
+    return True
+
+
+def _save_quantized(targets: List[nn.Module], cache_file: Path):
+    try:
+        with tempfile.NamedTemporaryFile(
+            dir=cache_file.parent, suffix=".tmp", delete=False
+        ) as f:
+            torch.save([target.state_dict() for target in targets], f)
+        os.replace(f.name, cache_file)
+    except OSError as e:
+        logger.warning(f"Fail to cache the quantized upstream: {e}")
+
+
+def quantize_upstream(
+    upstream: nn.Module,
+    quantize: str = "dynamic_int8",
+    cache_key: str = None,
+    cache_dir: str = None,
+):
+    """
+    Quantize the Linear layers in the upstream's transformer stack in-place. The
+    quantized modules only run on CPU and are not trainable
+
+    Args:
+        upstream (nn.Module): usually the UpstreamExpert
+        quantize (str): one of :code:`QUANTIZATIONS`
+        cache_key (str): identifies the upstream, e.g. by
+            :obj:`s3prl.util.upstream_metadata.get_metadata_key`. If given, the quantized
+            weights are saved with this key, and are directly loaded in the next time
+        cache_dir (str): default to :obj:`get_cache_dir`
+    """
+    assert quantize in QUANTIZATIONS, f"{quantize} is not in {QUANTIZATIONS}"
+    targets = _quantization_targets(upstream)
+
+    cache_file = None
+    if cache_key is not None:
+        cache_dir = Path(cache_dir or get_cache_dir())
+        cache_dir.mkdir(exist_ok=True, parents=True)
+        cache_file = cache_dir / f"{cache_key}.pt"
+        if cache_file.is_file() and _load_quantized(targets, cache_file):
+            return upstream
+
+    for target in targets:
+        _quantize_dynamic(target, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    if cache_file is not None:
+        _save_quantized(targets, cache_file)
+    return upstream
+
+
+def layerwise_cosine_similarity(
+    hs1: List[torch.Tensor], hs2: List[torch.Tensor], hs_len: List[torch.Tensor]
+) -> List[float]:
+    """
+    Args:
+        hs1 (List[torch.FloatTensor]): List[ (batch_size, seq_len, hidden_size) ]
+        hs2 (List[torch.FloatTensor]): List[ (batch_size, seq_len, hidden_size) ]
+        hs_len (List[torch.LongTensor]): List[ (batch_size, ) ]
+
+    Returns:
+        List[float]
+
+        The mean frame-level cosine similarity of each layer over the valid frames
+    """
+    results = []
+    for h1, h2, h_len in zip(hs1, hs2, hs_len):
+        mask = torch.arange(h1.size(1), device=h1.device) < h_len.unsqueeze(-1)
+        similarity = torch.cosine_similarity(h1[mask].float(), h2[mask].float(), dim=-1)
+        results.append(similarity.mean().item())
+    return results
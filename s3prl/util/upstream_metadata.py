@@ -0,0 +1,101 @@
+"""
+Cache the static upstream metadata (number of layers, hidden sizes...) on disk,
+so constructing an upstream wrapper does not need a probing forward pass
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_default_cache_dir = Path.home() / ".cache" / "s3prl" / "upstream_metadata"
+
+__all__ = [
+    "get_cache_dir",
+    "set_cache_dir",
+    "get_metadata_key",
+    "load_metadata",
+    "save_metadata",
+]
+
+
+def get_cache_dir():
+    _default_cache_dir.mkdir(exist_ok=True, parents=True)
+    return _default_cache_dir
+
+
+def set_cache_dir(cache_dir: str):
+    global _default_cache_dir
+    _default_cache_dir = Path(cache_dir)
+
+
+def _fingerprint(value):
+    """
+    Local checkpoint files are identified by their size and modified time, so
+    an overwritten checkpoint gets a new key without hashing the whole file
+    """
+    if isinstance(value, (str, Path)) and os.path.isfile(value):
+        stat = os.stat(value)
+        return [str(Path(value).resolve()), stat.st_size, stat.st_mtime_ns]
+    return value
+
+
+def get_metadata_key(**identity) -> str:
+    """
+    Args:
+        **identity: everything determining the upstream's metadata.
+            e.g. the upstream name, the checkpoint path or URL, the extra config
+
+    Returns:
+        str
+
+        The cache key. The s3prl version is always included, so upgrading s3prl
+        invalidates all the cached metadata
+    """
+    from s3prl import __version__
+
+    identity = {key: _fingerprint(value) for key, value in identity.items()}
+    identity["s3prl_version"] = __version__
+    serialized = json.dumps(identity, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def load_metadata(key: str, cache_dir: str = None) -> dict:
+    """
+    Returns:
+        dict
+
+        The cached metadata, or None if not cached yet (or the cache is corrupted)
+    """
+    cache_file = Path(cache_dir or get_cache_dir()) / f"{key}.json"
+    if not cache_file.is_file():
+        return None
+
+    try:
+        with cache_file.open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.warning(f"Ignore the corrupted upstream metadata cache: {cache_file}")
+        return None
+
+
+def save_metadata(key: str, metadata: dict, cache_dir: str = None):
+    """
+    Atomically write the metadata, so the concurrent processes (e.g. DDP)
+    never read a partially written file
+    """
+    cache_dir = Path(cache_dir or get_cache_dir())
+    cache_dir.mkdir(exist_ok=True, parents=True)
+
+    try:
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(metadata, f)
+        os.replace(f.name, cache_dir / f"{key}.json")
+    except OSError as e:
+        logger.warning(f"Fail to cache the upstream metadata: {e}")
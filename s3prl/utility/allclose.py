@@ -1,8 +1,148 @@
-import sys
+"""
+Compare two saved tensors (or lists of tensors, e.g. the hidden states), or the
+hidden states of an upstream in a reduced precision or quantized against fp32
+
+Usage:
+    python3 -m s3prl.utility.allclose a.pth b.pth
+    python3 -m s3prl.utility.allclose --upstream hubert --precision bf16
+    python3 -m s3prl.utility.allclose --upstream hubert --quantize dynamic_int8
+"""
+
+import argparse
+
 import torch
 
-pth1 = torch.load(sys.argv[1])
-pth2 = torch.load(sys.argv[2])
 
-print((pth1 - pth2).abs().max().item())
+def deviations(hs1, hs2):
+    """
+    Returns:
+        List[Tuple[float, float]]
+
+        The max and the mean absolute deviation of each layer
+    """
+    if isinstance(hs1, torch.Tensor):
+        hs1, hs2 = [hs1], [hs2]
+
+    assert len(hs1) == len(hs2), f"{len(hs1)} != {len(hs2)}"
+    results = []
+    for h1, h2 in zip(hs1, hs2):
+        diff = (h1.float() - h2.float()).abs()
+        results.append((diff.max().item(), diff.mean().item()))
+    return results
+
+
+def _random_wavs(seconds: float, batch_size: int, seed: int, device: str):
+    generator = torch.Generator().manual_seed(seed)
+    max_len = int(seconds * 16000)
+    wavs = torch.randn(batch_size, max_len, generator=generator)
+    wavs_len = torch.linspace(max_len // 2, max_len, batch_size).long()
+    return wavs.to(device), wavs_len.to(device)
+
+
+def upstream_precision_deviations(
+    name: str,
+    precision: str,
+    path_or_url: str = None,
+    device: str = "cpu",
+    seconds: float = 10.0,
+    batch_size: int = 2,
+    seed: int = 0,
+):
+    """
+    Forward the same random waveforms through the upstream in fp32 and in the given
+    precision, and compare their valid frames layer by layer
+    """
+    from s3prl.nn import S3PRLUpstream
+
+    model = S3PRLUpstream(name, path_or_url=path_or_url).to(device)
+    model.eval()
+
+    wavs, wavs_len = _random_wavs(seconds, batch_size, seed, device)
+    with torch.no_grad():
+        hs1, hs_len = model(wavs, wavs_len)
+        model.set_precision(precision)
+        hs2, _ = model(wavs, wavs_len)
+
+    valid_hs1, valid_hs2 = [], []
+    for h1, h2, h_len in zip(hs1, hs2, hs_len):
+        mask = torch.arange(h1.size(1), device=h1.device) < h_len.unsqueeze(-1)
+        valid_hs1.append(h1[mask])
+        valid_hs2.append(h2[mask])
+    return deviations(valid_hs1, valid_hs2)
+
+
+def upstream_quantization_similarity(
+    name: str,
+    quantize: str = "dynamic_int8",
+    path_or_url: str = None,
+    seconds: float = 10.0,
+    batch_size: int = 2,
+    seed: int = 0,
+):
+    """
+    Forward the same random waveforms through the fp32 upstream and its quantized
+    variant on CPU, and return the cosine similarity of each layer's valid frames
+    """
+    from s3prl.nn import S3PRLUpstream
+    from s3prl.util.quantization import layerwise_cosine_similarity
+
+    wavs, wavs_len = _random_wavs(seconds, batch_size, seed, "cpu")
+    with torch.no_grad():
+        model = S3PRLUpstream(name, path_or_url=path_or_url)
+        model.eval()
+        hs1, hs_len = model(wavs, wavs_len)
+        del model
+
+        model = S3PRLUpstream(name, path_or_url=path_or_url, quantize=quantize)
+        model.eval()
+        hs2, _ = model(wavs, wavs_len)
+    return layerwise_cosine_similarity(hs1, hs2, hs_len)
+
+
+def report(results):
+    print(f"{'layer':>5} {'max':>12} {'mean':>12}")
+    for layer_id, (max_dev, mean_dev) in enumerate(results):
+        print(f"{layer_id:>5} {max_dev:>12.6f} {mean_dev:>12.6f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pths", nargs="*", help="Two saved tensors to compare")
+    parser.add_argument("--upstream", help="The upstream name to compare with fp32")
+    parser.add_argument("--upstream_ckpt")
+    parser.add_argument("--precision", default="bf16", choices=["bf16", "fp16"])
+    parser.add_argument(
+        "--quantize",
+        choices=["dynamic_int8"],
+        help="Report the cosine similarity of the quantized upstream instead",
+    )
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
 
+    if args.upstream is not None and args.quantize is not None:
+        similarities = upstream_quantization_similarity(
+            args.upstream, args.quantize, args.upstream_ckpt, args.seconds
+        )
+        print(f"{'layer':>5} {'cosine':>12}")
+        for layer_id, similarity in enumerate(similarities):
+            print(f"{layer_id:>5} {similarity:>12.6f}")
+    elif args.upstream is not None:
+        report(
+            upstream_precision_deviations(
+                args.upstream,
+                args.precision,
+                args.upstream_ckpt,
+                args.device,
+                args.seconds,
+            )
+        )
+    else:
+        assert len(args.pths) == 2, "Please give two saved tensors to compare"
+        pth1 = torch.load(args.pths[0])
+        pth2 = torch.load(args.pths[1])
+        results = deviations(pth1, pth2)
+        if isinstance(pth1, torch.Tensor):
+            print(results[0][0])
+        else:
+            report(results)
@@ -1,6 +1,8 @@
 import logging
+from dataclasses import asdict
 
 import pytest
+import torch
 
 logger = logging.getLogger(__name__)
 
@@ -91,3 +93,68 @@ class Helper:
 @pytest.fixture
 def helpers():
     return Helper
+
+
+def _save_tiny_wav2vec2(ckpt, **overrides):
+    from s3prl.upstream.wav2vec2.wav2vec2_model import (
+        AudioPretrainingConfig,
+        Wav2Vec2Config,
+        Wav2Vec2Model,
+    )
+
+    model_cfg = dict(
+        encoder_layers=3,
+        encoder_embed_dim=32,
+        encoder_ffn_embed_dim=64,
+        encoder_attention_heads=2,
+        conv_feature_layers="[(32, 10, 5)] + [(32, 3, 2)] * 4 + [(32, 2, 2)] * 2",
+        conv_pos=16,
+        conv_pos_groups=4,
+        final_dim=16,
+        latent_vars=8,
+        latent_groups=2,
+        **overrides,
+    )
+    torch.manual_seed(0)
+    model = Wav2Vec2Model(Wav2Vec2Config(**model_cfg))
+    torch.save(
+        {
+            "task_cfg": asdict(AudioPretrainingConfig()),
+            "model_cfg": model_cfg,
+            "model_weight": model.state_dict(),
+        },
+        ckpt,
+    )
+    return str(ckpt)
+
+
+@pytest.fixture
+def tiny_wav2vec2_ckpt(tmp_path):
+    """
+    A randomly initialized wav2vec2 checkpoint in the converted format, small enough
+    to test the upstream interfaces without downloading any pre-trained model
+    """
+    return _save_tiny_wav2vec2(tmp_path / "tiny_wav2vec2.pt")
+
+
+@pytest.fixture
+def tiny_wav2vec2_layer_norm_ckpt(tmp_path):
+    """
+    The same as :code:`tiny_wav2vec2_ckpt`, but the feature extractor normalizes each
+    frame instead of the whole utterance, so its features do not depend on the context
+    """
+    return _save_tiny_wav2vec2(
+        tmp_path / "tiny_wav2vec2_layer_norm.pt", extractor_mode="layer_norm"
+    )
+
+
+@pytest.fixture(autouse=True)
+def upstream_metadata_cache_dir(tmp_path, monkeypatch):
+    """
+    Keep the upstream metadata cached by the tests out of the user's cache directory
+    """
+    from s3prl.util import upstream_metadata
+
+    cache_dir = tmp_path / "upstream_metadata"
+    monkeypatch.setattr(upstream_metadata, "_default_cache_dir", cache_dir)
+    return cache_dir
@@ -0,0 +1,55 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from s3prl.dataio.dataset.load_audio import LoadAudio
+from s3prl.util.audio_cache import SharedAudioCache
+from s3prl.util.pseudo_data import pseudo_audio
+
+
+def test_shared_audio_cache(tmp_path):
+    cache = SharedAudioCache(max_bytes=3 * 4000, root=tmp_path)
+    assert cache.get("a") is None
+
+    wavs = {key: np.random.randn(1000).astype(np.float32) for key in "abcd"}
+    for key in "abc":
+        cache.put(key, wavs[key], 16000)
+    data, sample_rate = cache.get("a")
+    assert np.array_equal(data, wavs["a"]) and sample_rate == 16000
+    # memory-mapped, so a hit does not read the whole recording
+    assert isinstance(data, np.memmap) and not data.flags.writeable
+
+    # "b" is the least recently used
+    cache.put("d", wavs["d"], 16000)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats() == dict(hits=4, misses=2, entries=3, bytes=3 * 4000)
+
+    cache.put("e", np.zeros(4000, dtype=np.float32), 16000)
+    assert cache.get("e") is None
+
+    root = cache.root
+    cache.close()
+    assert not root.exists()
+
+
+def _load(loader):
+    return [item["wav"][0] for item in loader]
+
+
+def test_load_audio_cache(tmp_path):
+    with pseudo_audio([3.0, 4.0, 5.2]) as (paths, num_samples):
+        start_secs, end_secs = [None, 1.0, 3.1], [None, 3.2, None]
+        expected = LoadAudio(paths, start_secs, end_secs)
+
+        cache = SharedAudioCache(max_bytes=2**30, root=tmp_path)
+        dataset = LoadAudio(paths, start_secs, end_secs, cache=cache)
+        loader = DataLoader(dataset, num_workers=2)
+        for epoch in range(2):
+            for wav, item in zip(_load(loader), expected):
+                assert torch.allclose(wav, item["wav"])
+
+        # decoded once by the workers, and then read from the cache
+        assert cache.stats()["misses"] == 3
+        assert cache.stats()["hits"] == 3
+        cache.close()
@@ -1,11 +1,29 @@
 from pathlib import Path
+from unittest import mock
 
-from s3prl.util.audio_info import get_audio_info
+import torch
+import torchaudio
+
+from s3prl.util import audio_info
+from s3prl.util.audio_info import get_audio_info, get_audio_lengths
 from s3prl.util.pseudo_data import pseudo_audio
 
 
-def test_audio_info():
+def test_audio_info(tmp_path):
     with pseudo_audio([3.0, 4.1, 1.1]) as (paths, num_samples):
-        infos = get_audio_info(paths, [Path(path).stem for path in paths])
+        infos = get_audio_info(
+            paths, [Path(path).stem for path in paths], cache_dir=tmp_path
+        )
+        assert infos[0]["num_frames"] == 3 * 16000
+        assert len(list(tmp_path.iterdir())) == 1
+
+        with mock.patch.object(audio_info, "_get_info") as get_info:
+            num_frames, sample_rate = get_audio_lengths(paths, cache_dir=tmp_path)
+            get_info.assert_not_called()
+        assert num_frames.tolist() == num_samples
+        assert sample_rate.tolist() == [16000] * 3
 
-    assert infos[0]["num_frames"] == 3 * 16000
+        torchaudio.save(paths[1], torch.randn(1, 8000), sample_rate=8000)
+        num_frames, sample_rate = get_audio_lengths(paths, cache_dir=tmp_path)
+        assert num_frames.tolist() == [num_samples[0], 8000, num_samples[2]]
+        assert sample_rate.tolist() == [16000, 8000, 16000]
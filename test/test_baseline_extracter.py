@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import pytest
+import torch
+import yaml
+from torch.nn.utils.rnn import pad_sequence
+
+from s3prl.upstream.baseline import extracter as baseline_extracter
+from s3prl.upstream.baseline.extracter import batch_extract, get_extracter
+
+CONFIG_DIR = Path(baseline_extracter.__file__).parent
+
+
+@pytest.mark.parametrize(
+    "config",
+    [
+        "fbank.yaml",
+        "fbank_no_cmvn.yaml",
+        "mfcc.yaml",
+        "spectrogram.yaml",
+        {
+            "kaldi": {
+                "feat_type": "mfcc",
+                "mfcc": {"use_energy": True, "htk_compat": True, "subtract_mean": True},
+            },
+            "delta": {"order": 1, "win_length": 9},
+            "cmvn": {"use_cmvn": False},
+        },
+    ],
+)
+@pytest.mark.parametrize("group_samples", [None, 16000])
+def test_batch_extract(config, group_samples):
+    if isinstance(config, str):
+        with (CONFIG_DIR / config).open() as f:
+            config = yaml.safe_load(f)
+    extracter, output_dim, _ = get_extracter(config)
+
+    torch.manual_seed(0)
+    wavs = [torch.randn(length) * 0.1 for length in [16000, 23456, 800, 8000]]
+    expected = [extracter(wav) for wav in wavs]
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        if group_samples is not None:
+            monkeypatch.setattr(baseline_extracter, "CPU_GROUP_SAMPLES", group_samples)
+        feats, feat_lens = batch_extract(extracter, wavs)
+
+    assert feat_lens.tolist() == [len(feat) for feat in expected]
+    assert feats.size(-1) == output_dim
+    assert torch.allclose(feats, pad_sequence(expected, batch_first=True), atol=1e-4)
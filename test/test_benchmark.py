@@ -0,0 +1,47 @@
+import torch
+import torch.nn as nn
+
+from s3prl.util.benchmark import StepTimer, benchmark
+
+
+class _TensorBoard:
+    def __init__(self):
+        self.scalars = {}
+
+    def add_scalar(self, tag, value, global_step):
+        self.scalars[tag] = value
+
+
+def test_benchmark_without_cuda():
+    with benchmark("noop"):
+        pass
+
+
+def test_step_timer(tmp_path):
+    timer = StepTimer()
+    model = nn.Sequential(nn.Linear(2, 2), nn.Linear(2, 2))
+    handles = timer.hook(model[0], "upstream", parent="forward")
+
+    for x in timer.iterate([torch.zeros(1, 2)] * 3):
+        with timer.phase("forward"):
+            model(x)
+        timer.count(1, 0.5)
+        timer.step()
+    # not counted outside of the forward phase
+    model(torch.zeros(1, 2))
+    for handle in handles:
+        handle.remove()
+
+    tensorboard = _TensorBoard()
+    window = timer.log(tensorboard, 3)
+    assert window["steps"] == 3
+    assert set(window["phase_seconds"]) == {"data", "forward", "upstream", "other"}
+    assert abs(sum(window["phase_seconds"].values()) - window["wall_seconds"]) < 1e-3
+    assert "timing/upstream" in tensorboard.scalars
+    assert "throughput/audio_secs_per_sec" in tensorboard.scalars
+
+    timer.step()
+    assert timer.log(tensorboard, 4)["steps"] == 1
+    summary = timer.dump(tmp_path / "timing.json")
+    assert summary["steps"] == 4
+    assert (tmp_path / "timing.json").is_file()
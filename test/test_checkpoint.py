@@ -0,0 +1,48 @@
+import os
+
+import pytest
+import torch
+
+from s3prl.util.checkpoint import AsyncCheckpointWriter, snapshot
+
+
+def test_snapshot():
+    model = torch.nn.Linear(3, 2)
+    state = {"model": model.state_dict(), "step": [1, (2, 3)]}
+    copied = snapshot(state)
+
+    with torch.no_grad():
+        model.weight.add_(1.0)
+    assert not torch.equal(copied["model"]["weight"], model.weight)
+    assert copied["step"] == [1, (2, 3)]
+    assert hasattr(copied["model"], "_metadata")
+
+
+def test_async_checkpoint_writer(tmp_path):
+    writer = AsyncCheckpointWriter()
+    model = torch.nn.Linear(3, 2)
+    ckpt_dirs = [tmp_path / "valid_best", tmp_path / "step_1"]
+    with writer.checkpoint(ckpt_dirs) as tmp_dir:
+        writer.save(model.state_dict(), tmp_dir / "state_dict.pt")
+        (tmp_dir / "stats.txt").write_text("1")
+    with torch.no_grad():
+        model.weight.add_(1.0)
+    writer.save_copies({"step": 1}, [tmp_path / "a.ckpt", tmp_path / "b.ckpt"])
+    writer.close()
+
+    state_files = [ckpt_dir / "state_dict.pt" for ckpt_dir in ckpt_dirs]
+    assert os.path.samefile(*state_files)
+    assert not torch.equal(torch.load(state_files[0])["weight"], model.weight)
+    assert (ckpt_dirs[1] / "stats.txt").read_text() == "1"
+    assert torch.load(tmp_path / "b.ckpt") == {"step": 1}
+    assert sorted(os.listdir(tmp_path)) == ["a.ckpt", "b.ckpt", "step_1", "valid_best"]
+
+
+def test_async_checkpoint_writer_error(tmp_path):
+    def fail():
+        raise RuntimeError("disk full")
+
+    writer = AsyncCheckpointWriter()
+    writer.submit(fail)
+    with pytest.raises(RuntimeError):
+        writer.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+from s3prl.dataio.collate_fn import default_collate_fn, padded_collate_fn
+
+
+def _samples():
+    return [
+        dict(
+            x=torch.randn(length, 2),
+            x_len=length,
+            feat=np.random.randn(length * 2).astype(np.float64),
+            label=f"label_{length}",
+        )
+        for length in [3, 7, 5]
+    ]
+
+
+def test_default_collate_fn():
+    samples = _samples()
+    batch = default_collate_fn(samples, padding_value=-1)
+
+    expected = pad_sequence(
+        [sample["x"] for sample in samples], batch_first=True, padding_value=-1
+    )
+    assert torch.equal(batch["x"], expected)
+    assert batch["feat"].dtype == torch.float
+    assert torch.equal(
+        batch["feat"],
+        pad_sequence(
+            [torch.from_numpy(sample["feat"]).float() for sample in samples],
+            batch_first=True,
+            padding_value=-1,
+        ),
+    )
+    assert batch["x_len"].tolist() == [3, 7, 5]
+    assert batch["label"].tolist() == ["label_3", "label_7", "label_5"]
+    assert set(batch.keys()) == {"x", "x_len", "feat", "label"}
+
+
+def test_padded_collate_fn():
+    samples = _samples()
+    batch = padded_collate_fn(
+        samples, pin_memory=True, half_keys=["x"], return_lens=True
+    )
+    assert batch["x"].dtype == torch.half
+    assert batch["feat"].dtype == torch.float
+    assert batch["feat_len"].tolist() == [6, 14, 10]
+    assert batch["x_len"].tolist() == [3, 7, 5]
+    assert (batch["x"][0, 3:] == 0).all()
+    assert batch["x"].is_pinned() == torch.cuda.is_available()
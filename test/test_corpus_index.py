@@ -0,0 +1,39 @@
+from unittest import mock
+
+from s3prl.dataio.corpus import librispeech
+from s3prl.dataio.corpus.librispeech import index_flac_dir, read_text
+from s3prl.util import corpus_index
+
+
+def _fake_librispeech(split_dir):
+    for speaker, chapter in [(19, 198), (19, 227), (26, 495)]:
+        chapter_dir = split_dir / str(speaker) / str(chapter)
+        chapter_dir.mkdir(parents=True)
+        with (chapter_dir / f"{speaker}-{chapter}.trans.txt").open("w") as f:
+            for utt in range(3):
+                name = f"{speaker}-{chapter}-{utt:04d}"
+                (chapter_dir / f"{name}.flac").touch()
+                f.write(f"{name} TEXT OF {name}\n")
+
+
+def test_index_flac_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_index, "_default_cache_dir", tmp_path / "corpus_index")
+    split_dir = tmp_path / "train-clean-100"
+    _fake_librispeech(split_dir)
+
+    index = index_flac_dir(split_dir)
+    assert [name for name, _, _ in index] == sorted(
+        flac.stem for flac in split_dir.rglob("*.flac")
+    )
+    for name, wav, text in index:
+        assert wav.stem == name
+        assert text == read_text(wav)
+
+    with mock.patch.object(librispeech, "_index_flac_dir") as build:
+        assert index_flac_dir(split_dir) == index
+        build.assert_not_called()
+
+    (split_dir / "27").mkdir()
+    assert len(list((tmp_path / "corpus_index").iterdir())) == 1
+    assert index_flac_dir(split_dir) == index
+    assert len(list((tmp_path / "corpus_index").iterdir())) == 2
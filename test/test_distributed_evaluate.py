@@ -0,0 +1,76 @@
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+
+from s3prl.dataio.sampler import FixedBatchSizeBatchSampler
+from s3prl.problem.base import Problem
+
+NUM_ITEMS = 11
+WORLD_SIZE = 2
+
+
+class _Dataset:
+    def __len__(self):
+        return NUM_ITEMS
+
+    def __getitem__(self, index):
+        return {"x": torch.FloatTensor([index])}
+
+
+class _Task(nn.Module):
+    def forward(self, mode, x, _dump_dir=None):
+        return None, {"x": x.view(-1)}
+
+    def reduction(self, mode, batch_results, _dump_dir=None):
+        return {"x": torch.cat([result["x"] for result in batch_results]).tolist()}
+
+
+def _evaluate(rank, init_file, batch_size, eval_batch, queue):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=WORLD_SIZE
+    )
+    logs = Problem().evaluate(
+        {},
+        "valid",
+        _Task(),
+        _Dataset(),
+        FixedBatchSizeBatchSampler(list(range(NUM_ITEMS)), batch_size=batch_size),
+        None,
+        eval_batch,
+        None,
+        "cpu",
+        0,
+        world_size=WORLD_SIZE,
+        rank=rank,
+    )
+    queue.put((rank, logs))
+
+
+def test_distributed_evaluate(tmp_path):
+    ctx = mp.get_context("spawn")
+    # size-1 batches with an odd number of batches can not be evenly distributed
+    for batch_size, eval_batch, expected in [
+        (3, -1, list(range(NUM_ITEMS))),
+        (3, 2, list(range(6))),
+        (1, -1, list(range(NUM_ITEMS))),
+        (1, 3, list(range(3))),
+    ]:
+        queue = ctx.Queue()
+        init_file = tmp_path / f"init_{batch_size}_{eval_batch}"
+        processes = [
+            ctx.Process(
+                target=_evaluate,
+                args=(rank, init_file, batch_size, eval_batch, queue),
+            )
+            for rank in range(WORLD_SIZE)
+        ]
+        for process in processes:
+            process.start()
+        results = dict(queue.get(timeout=120) for _ in range(WORLD_SIZE))
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        assert results[1] is None
+        assert [int(x) for x in results[0]["x"]] == expected
@@ -0,0 +1,43 @@
+import importlib
+import inspect
+import subprocess
+import sys
+
+from s3prl import hub
+
+
+def test_hub_is_lazy():
+    script = (
+        "import sys; from s3prl import hub; hub.options(); "
+        "assert not any(name.endswith('hubconf') for name in sys.modules)"
+    )
+    subprocess.check_call([sys.executable, "-c", script])
+
+
+def test_hub_registry_is_complete():
+    modules = list(hub._HUBCONF_ENTRIES.keys())
+    for module_id, module_name in enumerate(modules):
+        if not module_name.startswith("s3prl.upstream."):
+            continue
+
+        module = importlib.import_module(module_name)
+        registered = set()
+        for later_module in modules[module_id:]:
+            registered.update(hub._HUBCONF_ENTRIES[later_module])
+
+        for name, value in vars(module).items():
+            if name.startswith("_") or not inspect.isfunction(value):
+                continue
+            if not value.__module__.endswith("hubconf"):
+                continue
+            assert name in registered, f"{name} in {module_name} is not registered"
+
+        for name in hub._HUBCONF_ENTRIES[module_name]:
+            assert callable(getattr(module, name))
+
+
+def test_hub_getattr():
+    assert "wav2vec2" in hub.options()
+    assert "wav2vec2_local" not in hub.options(only_registered_ckpt=True)
+    assert callable(hub.customized_upstream)
+    assert "customized_upstream" in dir(hub)
@@ -0,0 +1,49 @@
+import logging
+import subprocess
+from unittest import mock
+
+import numpy as np
+import soundfile as sf
+
+from s3prl.dataio.dataset.diarization import KaldiData
+
+
+def _make_data_dir(data_dir, command="cat {} |"):
+    wav = np.random.uniform(-0.5, 0.5, 16000).astype(np.float32)
+    sf.write(data_dir / "rec1.wav", wav, 16000, subtype="FLOAT")
+    with (data_dir / "wav.scp").open("w") as f:
+        f.write(f"rec1 {command.format(data_dir / 'rec1.wav')}\n")
+    for filename in ["utt2spk", "spk2utt", "reco2dur"]:
+        (data_dir / filename).touch()
+    return wav
+
+
+def test_kaldi_data_piped_wav(tmp_path):
+    wav = _make_data_dir(tmp_path)
+    data = KaldiData(str(tmp_path))
+    with mock.patch.object(subprocess, "Popen", side_effect=subprocess.Popen) as popen:
+        for start in range(0, 16000, 4000):
+            chunk, rate = data.load_wav("rec1", start, start + 4000)
+            assert rate == 16000
+            assert np.array_equal(chunk, wav[start : start + 4000])
+        assert popen.call_count == 1
+    assert len(list((tmp_path / ".piped_wav").iterdir())) == 1
+
+
+def test_kaldi_data_failed_piped_command(tmp_path):
+    wav = _make_data_dir(tmp_path, "sh -c 'cat {}; exit 1' |")
+    data = KaldiData(str(tmp_path))
+    chunk, _ = data.load_wav("rec1", 0, 4000)
+    assert np.array_equal(chunk, wav[:4000])
+    assert not (tmp_path / ".piped_wav").exists()
+
+
+def test_kaldi_data_unwritable_piped_wav_dir(tmp_path, caplog):
+    wav = _make_data_dir(tmp_path)
+    (tmp_path / "not_a_dir").touch()
+    data = KaldiData(str(tmp_path), piped_wav_dir=str(tmp_path / "not_a_dir" / "wav"))
+    with caplog.at_level(logging.WARNING):
+        for start in range(0, 16000, 4000):
+            chunk, _ = data.load_wav("rec1", start, start + 4000)
+            assert np.array_equal(chunk, wav[start : start + 4000])
+    assert len(caplog.records) == 1
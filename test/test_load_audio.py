@@ -1,6 +1,9 @@
+from unittest import mock
+
 import torch
+import torchaudio
 
-from s3prl.dataio.dataset.load_audio import LoadAudio
+from s3prl.dataio.dataset.load_audio import LoadAudio, PartialLoadAudio
 from s3prl.util.pseudo_data import pseudo_audio
 
 
@@ -10,3 +13,35 @@ def test_load_audio():
 
         for item in dataset:
             assert isinstance(item["wav"], torch.Tensor)
+
+
+def test_partial_load_audio():
+    with pseudo_audio([3.0, 4.0, 5.2]) as (paths, num_samples):
+        start_secs, end_secs = [None, 1.0, 3.1], [None, 3.2, None]
+        expected = LoadAudio(paths, start_secs, end_secs)
+        dataset = PartialLoadAudio(paths, start_secs, end_secs)
+        for item, partial_item in zip(expected, dataset):
+            assert torch.allclose(item["wav"], partial_item["wav"], atol=1e-6)
+
+        dataset = PartialLoadAudio(
+            paths, max_secs=2.0, num_frames=num_samples, source_sample_rates=[16000] * 3
+        )
+        with mock.patch.object(torchaudio, "load", side_effect=torchaudio.load) as load:
+            for index, item in enumerate(dataset):
+                assert item["wav_len"] == 32000
+                assert load.call_args.kwargs["num_frames"] == 32000
+                offset = load.call_args.kwargs["frame_offset"]
+                full_wav = LoadAudio(paths)[index]["wav"]
+                assert torch.allclose(
+                    item["wav"], full_wav[offset : offset + 32000], atol=1e-6
+                )
+
+
+def test_partial_load_audio_resample():
+    with pseudo_audio([3.0], sample_rate=8000) as (paths, num_samples):
+        dataset = PartialLoadAudio(paths, max_secs=1.0)
+        assert dataset.source_sample_rates == [8000]
+        assert dataset[0]["wav_len"] == 16000
+
+        dataset = PartialLoadAudio(paths)
+        assert dataset[0]["wav_len"] == 48000
@@ -0,0 +1,41 @@
+import pandas as pd
+import torch
+
+from s3prl.dataio.dataset import LoadAudio, LoadPackedAudio, pack_audio
+from s3prl.util.pseudo_data import pseudo_audio
+
+
+def test_packed_audio(tmp_path):
+    with pseudo_audio([3.0, 4.0, 5.2]) as (paths, num_samples):
+        corpus = pd.DataFrame(
+            dict(
+                id=["a", "b", "c"],
+                wav_path=paths,
+                start_sec=[None, 1.0, None],
+                end_sec=[None, 3.5, None],
+            )
+        )
+        pack_audio(corpus, tmp_path, dtype="float32", max_shard_bytes=1)
+        assert len(list(tmp_path.glob("shard_*.pcm"))) == 3
+
+        audio_loader = LoadAudio(paths, [None, 1.0, None], [None, 3.5, None])
+        packed_loader = LoadPackedAudio(tmp_path)
+        for item, packed_item in zip(audio_loader, packed_loader):
+            assert item["wav_path"] == packed_item["wav_path"]
+            assert torch.equal(item["wav"], packed_item["wav"])
+
+        segments = LoadPackedAudio(tmp_path, ["c", "a"], [0.5, None], [2.0, None])
+        assert torch.equal(segments[0]["wav"], audio_loader[2]["wav"][8000:32000])
+        assert segments.getinfo(1)["wav_len"] == num_samples[0]
+
+        cropped = LoadPackedAudio(tmp_path, max_secs=2.0)
+        for idx, item in enumerate(cropped):
+            assert item["wav_len"] == 32000 == cropped.getinfo(idx)["wav_len"]
+
+
+def test_packed_audio_int16(tmp_path):
+    with pseudo_audio([1.0]) as (paths, num_samples):
+        pack_audio(pd.DataFrame(dict(id=["a"], wav_path=paths)), tmp_path)
+        wav = LoadAudio(paths)[0]["wav"].clamp(-1, 32767 / 32768)
+        packed_wav = LoadPackedAudio(tmp_path)[0]["wav"]
+        assert torch.allclose(wav, packed_wav, atol=1 / 32768)
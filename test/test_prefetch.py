@@ -0,0 +1,47 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from s3prl.dataio.prefetch import DevicePrefetcher, to_device
+
+
+def _collate_fn(samples):
+    return {"x": torch.stack(samples), "ids": list(range(len(samples)))}
+
+
+@pytest.mark.parametrize(
+    "device",
+    [
+        "cpu",
+        pytest.param(
+            "cuda",
+            marks=pytest.mark.skipif(
+                not torch.cuda.is_available(), reason="CUDA is not available"
+            ),
+        ),
+    ],
+)
+def test_device_prefetcher(device):
+    data = [torch.randn(3) for _ in range(10)]
+    loader = DataLoader(
+        data, batch_size=4, collate_fn=_collate_fn, pin_memory=device == "cuda"
+    )
+    prefetcher = DevicePrefetcher(loader, device)
+    assert len(prefetcher) == 3
+
+    batches = list(prefetcher)
+    assert len(batches) == 3
+    for batch in batches:
+        assert batch["x"].device.type == device
+        assert batch["ids"] == list(range(len(batch["x"])))
+    assert torch.equal(
+        torch.cat([batch["x"].cpu() for batch in batches]), torch.stack(data)
+    )
+
+
+def test_to_device():
+    data = ([torch.zeros(1)], {"y": torch.ones(1), "name": "utt"})
+    moved = to_device(data, "cpu", non_blocking=False)
+    assert isinstance(moved, tuple)
+    assert moved[1]["name"] == "utt"
+    assert torch.equal(moved[1]["y"], torch.ones(1))
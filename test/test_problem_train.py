@@ -0,0 +1,115 @@
+import json
+import os
+
+import pytest
+import torch
+import torch.nn as nn
+import yaml
+
+from s3prl.dataio.sampler import FixedBatchSizeBatchSampler
+from s3prl.problem.base import Problem
+from s3prl.task import Task
+
+
+class _Dataset:
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, index):
+        return {"x": torch.FloatTensor([index])}
+
+
+class _Task(Task):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, mode, x, _dump_dir=None):
+        loss = self.model(x).float().pow(2).mean()
+        return loss, {"loss": loss.item()}
+
+    def reduction(self, mode, batch_results, _dump_dir=None):
+        return {"loss": sum(r["loss"] for r in batch_results) / len(batch_results)}
+
+    def get_state(self):
+        return {}
+
+
+class _Problem(Problem):
+    def build_model(self, **kwargs):
+        return nn.Linear(1, 1)
+
+    def build_task(self, model, **kwargs):
+        return _Task(model)
+
+
+def _train(train_dir, total_steps, precision):
+    sampler = FixedBatchSizeBatchSampler(list(range(8)), batch_size=2)
+    _Problem().train(
+        dict(
+            total_steps=total_steps,
+            log_step=100,
+            eval_step=4,
+            save_step=2,
+            gradient_clipping=1.0,
+            gradient_accumulate=2,
+            valid_metric="loss",
+            valid_higher_better=False,
+            keep_num_ckpts=2,
+            precision=precision,
+        ),
+        train_dir,
+        {},
+        {},
+        {},
+        {},
+        dict(name="Adam", conf=dict(lr=1.0e-3)),
+        {},
+        {},
+        _Dataset(),
+        sampler,
+        None,
+        _Dataset(),
+        sampler,
+        None,
+        0,
+        1,
+        0,
+        -1,
+        "cpu",
+        {},
+    )
+
+
+@pytest.mark.parametrize("precision", ["fp32", "bf16"])
+def test_problem_train(tmp_path, precision):
+    _train(tmp_path, 6, precision)
+    assert sorted(os.listdir(tmp_path)) == [
+        "step_4",
+        "step_6",
+        "tb",
+        "timing.json",
+        "valid_best",
+    ]
+
+    _train(tmp_path, 8, precision)
+    assert sorted(os.listdir(tmp_path)) == [
+        "step_6",
+        "step_8",
+        "tb",
+        "timing.json",
+        "valid_best",
+    ]
+    with (tmp_path / "step_8" / "training_stats.yaml").open() as f:
+        assert yaml.safe_load(f)["global_step"] == 8
+
+    with (tmp_path / "timing.json").open() as f:
+        timing = json.load(f)
+    assert timing["steps"] == 2
+    for name in ["data", "h2d", "forward", "backward", "optimizer", "checkpoint"]:
+        assert name in timing["phase_seconds_per_step"]
+
+
+def test_problem_train_fp16_on_cpu(tmp_path):
+    with pytest.raises(AssertionError):
+        _train(tmp_path, 2, "fp16")
@@ -3,6 +3,7 @@ import logging
 import pytest
 
 from s3prl.dataio.sampler import (
+    BucketedMaxTimestampBatchSampler,
     DistributedBatchSamplerWrapper,
     FixedBatchSizeBatchSampler,
     MaxTimestampBatchSampler,
@@ -28,6 +29,17 @@ def test_distributed_sampler(world_size):
     assert sorted(ddp_indices) == sorted(_merge_batch_indices(sampler))
 
 
+def test_distributed_sampler_uneven_unhalvable():
+    sampler = [[0], [1], [2], [3], [4]]
+    ddp_indices = []
+    for rank in range(2):
+        ddp_sampler = DistributedBatchSamplerWrapper(
+            sampler, 2, rank, allow_uneven=True
+        )
+        ddp_indices += _merge_batch_indices(ddp_sampler)
+    assert sorted(ddp_indices) == [0, 1, 2, 3, 4]
+
+
 timestamps = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 data = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 
@@ -40,3 +52,49 @@ def test_FixedBatchSizeBatchSampler(batch_size):
     indices1 = sorted(_merge_batch_indices(iter1))
     indices2 = sorted(_merge_batch_indices(iter2))
     assert indices1 == indices2 == list(range(len(timestamps)))
+
+
+def _naive_max_timestamp_batches(lengths, max_length, reduce_func):
+    batches, batch = [], []
+    for indice in range(len(lengths)):
+        if reduce_func([lengths[i] for i in batch + [indice]]) <= max_length:
+            batch = batch + [indice]
+        else:
+            batches.append(batch)
+            batch = [indice]
+    return batches + [batch]
+
+
+@pytest.mark.parametrize("reduce_func", [None, sum])
+def test_MaxTimestampBatchSampler(reduce_func):
+    lengths = [3, 9, 1, 4, 8, 8, 2, 7, 5, 6] * 3
+    sampler = MaxTimestampBatchSampler(lengths, 20, reduce_func=reduce_func)
+    expected = _naive_max_timestamp_batches(
+        lengths, 20, reduce_func or MaxTimestampBatchSampler._default_reduce_func
+    )
+    assert list(iter(sampler)) == expected
+    assert len(sampler) == len(expected)
+
+    with pytest.raises(ValueError):
+        list(MaxTimestampBatchSampler(lengths, 5))
+
+
+def test_BucketedMaxTimestampBatchSampler():
+    lengths = [3, 9, 1, 4, 8, 8, 2, 7, 5, 6] * 30
+    sampler = BucketedMaxTimestampBatchSampler(
+        lengths, 24, shuffle=True, bucket_size=100
+    )
+    batches = list(iter(sampler))
+    assert len(sampler) == len(batches)
+    assert sorted(_merge_batch_indices(batches)) == list(range(len(lengths)))
+    for batch in batches:
+        assert max(lengths[i] for i in batch) * len(batch) <= 24
+
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    unsorted = MaxTimestampBatchSampler(lengths, 24, shuffle=True)
+    assert padded < sum(
+        max(lengths[i] for i in batch) * len(batch) for batch in unsorted
+    )
+
+    sampler.set_epoch(1)
+    assert list(iter(sampler)) != batches
@@ -2,7 +2,11 @@ import logging
 import random
 from collections import OrderedDict
 
-from s3prl.dataio.sampler import SortedBucketingSampler, SortedSliceSampler
+from s3prl.dataio.sampler import (
+    DistributedBatchSamplerWrapper,
+    SortedBucketingSampler,
+    SortedSliceSampler,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -65,3 +69,18 @@ def test_sorted_bucketing_sampler():
         ]
         assert len(other_batch_sizes) <= 1
         assert len(lengths) / 16 < len(sampler) < len(lengths) / 8
+
+
+def test_sorted_sampler_plan_cache():
+    lengths = [random.randint(16000 * 3, 16000 * 8) for index in range(100)]
+    sampler = SortedBucketingSampler(lengths, batch_size=8, shuffle=True)
+    wrapper = DistributedBatchSamplerWrapper(sampler, num_replicas=2, rank=0)
+
+    batches = list(iter(wrapper))
+    assert wrapper._cached_plan is sampler.plan()
+    assert len(wrapper) == len(batches)
+    assert list(iter(wrapper)) == batches
+
+    wrapper.set_epoch(1)
+    assert list(iter(wrapper)) != batches
+    assert sorted(sum(sampler.plan(), [])) == list(range(len(lengths)))
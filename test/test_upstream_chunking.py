@@ -0,0 +1,146 @@
+import pytest
+import torch
+
+from s3prl.nn import S3PRLUpstream
+
+
+def _padded_wavs(wavs_len):
+    wavs = torch.zeros(len(wavs_len), max(wavs_len))
+    for idx, wav_len in enumerate(wavs_len):
+        wavs[idx, :wav_len] = torch.randn(wav_len)
+    return wavs, torch.LongTensor(wavs_len)
+
+
+def test_chunk_windows(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream(
+        "wav2vec2_local",
+        path_or_url=tiny_wav2vec2_ckpt,
+        chunk_sec=1.0,
+        chunk_overlap_sec=0.1,
+    )
+    windows = model._chunk_windows([16000, 40000], unit=320)
+
+    assert windows[0] == (0, 0, 16000, 0, 16000)
+    kept = [(start, end) for utt_id, _, _, start, end in windows if utt_id == 1]
+    assert kept[0][0] == 0 and kept[-1][1] == 40000
+    for (_, end), (start, _) in zip(kept[:-1], kept[1:]):
+        assert end == start
+
+    for utt_id, window_start, window_end, start, end in windows[1:]:
+        assert window_end - window_start <= 16000
+        assert window_start <= start and end <= window_end
+        assert window_start % 320 == 0 and start % 320 == 0
+
+
+def test_chunked_forward_short_input(tiny_wav2vec2_ckpt):
+    torch.manual_seed(0)
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+
+    wavs, wavs_len = _padded_wavs([8000, 16000])
+    with torch.no_grad():
+        all_hs, all_lens = model(wavs, wavs_len)
+        model.chunk_sec = 1.0
+        chunked_hs, chunked_lens = model(wavs, wavs_len)
+
+    for h, chunked_h in zip(all_hs, chunked_hs):
+        assert torch.equal(h, chunked_h)
+
+
+def test_chunked_forward_stitching(tiny_wav2vec2_ckpt):
+    torch.manual_seed(0)
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+
+    wavs, wavs_len = _padded_wavs([8000, 6000])
+    with torch.no_grad():
+        all_hs, all_lens = model(wavs, wavs_len)
+
+        # every window is widened to the whole utterance by the overlap and forwarded
+        # alone, so the stitched frames should match the utterance-level forward
+        model.chunk_sec = 0.1
+        model.chunk_overlap_sec = 1.0
+        model.max_batch_samples = 1
+        chunked_hs, chunked_lens = model(wavs, wavs_len)
+
+        for idx, wav_len in enumerate(wavs_len):
+            single_hs, _ = model._forward_batch(
+                wavs[idx : idx + 1, :wav_len], wavs_len[idx : idx + 1]
+            )
+            for layer_id, single_h in enumerate(single_hs):
+                valid_len = int(chunked_lens[layer_id][idx])
+                assert torch.allclose(
+                    chunked_hs[layer_id][idx, :valid_len],
+                    single_h[0, :valid_len],
+                    atol=1e-5,
+                )
+
+    for h, chunked_h, h_len, chunked_len in zip(
+        all_hs, chunked_hs, all_lens, chunked_lens
+    ):
+        assert h.shape == chunked_h.shape
+        assert torch.equal(h_len, chunked_len)
+
+
+def test_chunk_sec_should_cover_overlap(tiny_wav2vec2_ckpt):
+    with pytest.raises(ValueError):
+        S3PRLUpstream(
+            "wav2vec2_local",
+            path_or_url=tiny_wav2vec2_ckpt,
+            chunk_sec=2.0,
+            chunk_overlap_sec=1.0,
+        )
+
+
+def test_chunked_forward_long_input(tiny_wav2vec2_layer_norm_ckpt):
+    torch.manual_seed(0)
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_layer_norm_ckpt)
+    model.eval()
+
+    # both utterances are longer than 2 * chunk_sec, so they are really split
+    wavs, wavs_len = _padded_wavs([56000, 40000])
+    with torch.no_grad():
+        all_hs, all_lens = model(wavs, wavs_len)
+        model.chunk_sec = 1.5
+        model.chunk_overlap_sec = 0.5
+        chunked_hs, chunked_lens = model(wavs, wavs_len)
+
+    for layer_id, (h, chunked_h) in enumerate(zip(all_hs, chunked_hs)):
+        assert h.shape == chunked_h.shape
+        assert torch.equal(all_lens[layer_id], chunked_lens[layer_id])
+        for idx in range(len(wavs)):
+            # the last frame only covers a part of the receptive field
+            valid_len = int(all_lens[layer_id][idx]) - 1
+            h_i, chunked_h_i = h[idx, :valid_len], chunked_h[idx, :valid_len]
+            if layer_id == 0:
+                # the convolutional features only depend on the overlapped context
+                assert torch.allclose(h_i, chunked_h_i, atol=1e-4)
+            else:
+                # the attention sees less context in a window
+                diff = (h_i - chunked_h_i).abs().mean() / h_i.abs().mean()
+                assert diff < 0.2
+
+
+def test_chunked_forward_bounded_batches(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream(
+        "wav2vec2_local",
+        path_or_url=tiny_wav2vec2_ckpt,
+        chunk_sec=1.0,
+        chunk_overlap_sec=0.2,
+    )
+    model.eval()
+
+    forward_batch = model._forward_batch
+    batch_samples = []
+
+    def _forward_batch(wavs, wavs_len):
+        batch_samples.append(wavs.numel())
+        return forward_batch(wavs, wavs_len)
+
+    model._forward_batch = _forward_batch
+    wavs, wavs_len = _padded_wavs([160000, 80000])
+    with torch.no_grad():
+        model(wavs, wavs_len)
+
+    assert len(batch_samples) > 1
+    assert max(batch_samples) <= len(wavs) * 16000
@@ -0,0 +1,50 @@
+from unittest import mock
+
+import pytest
+import torch
+
+from s3prl.upstream import utils
+from s3prl.upstream.wav2vec2.convert import load_converted_model
+
+requires_fast_loading = pytest.mark.skipif(
+    not utils._fast_loading_supported(), reason="Requires torch>=2.1"
+)
+
+
+def _regular_load(ckpt):
+    with mock.patch.object(utils, "_fast_loading_supported", return_value=False):
+        return load_converted_model(ckpt)[0]
+
+
+@requires_fast_loading
+def test_fast_loading(tiny_wav2vec2_ckpt):
+    fast_model, _ = load_converted_model(tiny_wav2vec2_ckpt)
+    regular_model = _regular_load(tiny_wav2vec2_ckpt)
+    assert len(utils._meta_tensor_names(fast_model)) == 0
+
+    fast_state = fast_model.state_dict(keep_vars=True)
+    for name, value in regular_model.state_dict(keep_vars=True).items():
+        assert torch.equal(fast_state[name], value)
+        assert fast_state[name].requires_grad == value.requires_grad
+
+    fast_model.eval()
+    regular_model.eval()
+    wav = torch.randn(2, 16000)
+    with torch.no_grad():
+        fast_hs = fast_model.extract_features(wav, None)["x"]
+        regular_hs = regular_model.extract_features(wav, None)["x"]
+    assert torch.allclose(fast_hs, regular_hs)
+
+
+@requires_fast_loading
+def test_convert_to_mmap_ckpt(tiny_wav2vec2_ckpt, tmp_path):
+    legacy_ckpt = tmp_path / "legacy.pt"
+    state = torch.load(tiny_wav2vec2_ckpt)
+    torch.save(state, legacy_ckpt, _use_new_zipfile_serialization=False)
+    with pytest.raises(RuntimeError):
+        torch.load(str(legacy_ckpt), mmap=True)
+
+    utils.convert_to_mmap_ckpt(legacy_ckpt)
+    converted_state = torch.load(str(legacy_ckpt), mmap=True)
+    for name, value in state["model_weight"].items():
+        assert torch.equal(converted_state["model_weight"][name], value)
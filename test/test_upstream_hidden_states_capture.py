@@ -0,0 +1,66 @@
+import pytest
+import torch
+
+from s3prl.nn import Featurizer, S3PRLUpstream
+from s3prl.nn.upstream import UpstreamDownstreamModel
+from s3prl.util.pseudo_data import get_pseudo_wavs
+
+
+class _Identity(torch.nn.Module):
+    def forward(self, h, h_len):
+        return h, h_len
+
+
+@pytest.mark.parametrize("buffer", [False, True])
+@pytest.mark.parametrize("layer_selections", [None, [1, 3], [0, 2]])
+def test_hidden_states_capture(tiny_wav2vec2_ckpt, buffer, layer_selections):
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+
+    wavs, wavs_len = get_pseudo_wavs(padded=True)
+    with torch.no_grad():
+        all_hs, all_lens = model(wavs, wavs_len)
+
+        model.set_hidden_states_buffer(buffer)
+        model.set_layer_selections(layer_selections)
+        hs, lens = model(wavs, wavs_len)
+
+    layer_ids = layer_selections or list(range(model.num_layers))
+    assert len(hs) == len(lens) == len(layer_ids)
+    for layer_id, h, h_len in zip(layer_ids, hs, lens):
+        assert torch.allclose(h, all_hs[layer_id], atol=1e-6)
+        assert torch.equal(h_len, all_lens[layer_id])
+
+
+def test_hidden_states_buffer_layout(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+    model.set_hidden_states_buffer(True)
+
+    wavs = [torch.randn(16000), torch.randn(12000)]
+    with torch.no_grad():
+        hs = model.upstream(wavs)["hidden_states"]
+
+    assert len(set(h.untyped_storage().data_ptr() for h in hs)) == 1
+    for h in hs[:-1]:
+        # the transformer layers' inputs are no longer the transposed views
+        assert h.stride(-1) == 1
+        assert h.stride(1) == h.size(2)
+
+
+def test_upstream_downstream_layer_selections(tiny_wav2vec2_ckpt):
+    upstream = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    featurizer = Featurizer(upstream, layer_selections=[0, 2])
+    wavs, wavs_len = get_pseudo_wavs(padded=True)
+
+    upstream.eval()
+    with torch.no_grad():
+        expected, expected_len = featurizer(*upstream(wavs, wavs_len))
+
+    model = UpstreamDownstreamModel(upstream, featurizer, _Identity())
+    assert upstream.layer_selections == [0, 2]
+    with torch.no_grad():
+        h, h_len = model(wavs, wavs_len)
+
+    assert torch.allclose(h, expected, atol=1e-6)
+    assert torch.equal(h_len, expected_len)
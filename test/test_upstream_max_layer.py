@@ -0,0 +1,46 @@
+import pytest
+import torch
+
+from s3prl.nn import Featurizer, S3PRLUpstream
+from s3prl.nn.upstream import UpstreamDownstreamModel
+from s3prl.util.pseudo_data import get_pseudo_wavs
+
+
+class _Identity(torch.nn.Module):
+    def forward(self, h, h_len):
+        return h, h_len
+
+
+@pytest.mark.parametrize("max_layer", [0, 1, 2])
+def test_upstream_max_layer(tiny_wav2vec2_ckpt, max_layer):
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+    assert model.num_layers == 4
+
+    wavs, wavs_len = get_pseudo_wavs(padded=True)
+    with torch.no_grad():
+        all_hs, all_lens = model(wavs, wavs_len)
+
+        model.set_max_layer(max_layer)
+        partial_hs, partial_lens = model(wavs, wavs_len)
+
+    assert len(partial_hs) == len(partial_lens) == max_layer + 1
+    for h1, h2 in zip(all_hs, partial_hs):
+        assert torch.allclose(h1, h2, atol=1e-6)
+
+
+def test_featurizer_max_layer(tiny_wav2vec2_ckpt):
+    upstream = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    featurizer = Featurizer(upstream, layer_selections=[0, 1])
+    assert featurizer.max_layer == 1
+
+    model = UpstreamDownstreamModel(upstream, featurizer, _Identity())
+    assert upstream.max_layer == 1
+
+    wavs, wavs_len = get_pseudo_wavs(padded=True)
+    h, h_len = model(wavs, wavs_len)
+    assert h.size(-1) == featurizer.output_size
+
+    featurizer = Featurizer(upstream)
+    UpstreamDownstreamModel(upstream, featurizer, _Identity())
+    assert upstream.max_layer is None
@@ -0,0 +1,67 @@
+from unittest import mock
+
+import torch
+
+from s3prl.nn import S3PRLUpstream
+from s3prl.upstream.interfaces import Featurizer
+from s3prl.upstream.wav2vec2.hubconf import wav2vec2_custom
+from s3prl.util.upstream_metadata import get_metadata_key, load_metadata, save_metadata
+
+
+def test_metadata_cache(tmp_path):
+    key = get_metadata_key(name="hubert", path_or_url=None, extra_conf=None)
+    assert key == get_metadata_key(name="hubert", path_or_url=None, extra_conf=None)
+    assert key != get_metadata_key(name="wavlm", path_or_url=None, extra_conf=None)
+
+    assert load_metadata(key, cache_dir=tmp_path) is None
+    save_metadata(key, {"num_layers": 13}, cache_dir=tmp_path)
+    assert load_metadata(key, cache_dir=tmp_path) == {"num_layers": 13}
+
+    (tmp_path / f"{key}.json").write_text("{corrupted")
+    assert load_metadata(key, cache_dir=tmp_path) is None
+
+
+def test_metadata_key_tracks_checkpoint(tmp_path):
+    ckpt = tmp_path / "model.ckpt"
+    ckpt.write_bytes(b"0")
+    key = get_metadata_key(path_or_url=str(ckpt))
+    ckpt.write_bytes(b"00")
+    assert key != get_metadata_key(path_or_url=str(ckpt))
+
+
+def test_upstream_without_probing(tiny_wav2vec2_ckpt, upstream_metadata_cache_dir):
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    assert len(list(upstream_metadata_cache_dir.iterdir())) == 1
+
+    with mock.patch.object(
+        S3PRLUpstream, "_probe_metadata", side_effect=AssertionError
+    ):
+        cached = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+
+    assert cached.num_layers == model.num_layers
+    assert cached.hidden_sizes == model.hidden_sizes
+    assert cached.downsample_rates == model.downsample_rates
+
+
+def test_featurizer_without_probing(tiny_wav2vec2_ckpt):
+    upstream = wav2vec2_custom(tiny_wav2vec2_ckpt)
+    featurizer = Featurizer(
+        upstream, upstream_device="cpu", metadata_key=tiny_wav2vec2_ckpt
+    )
+    assert not upstream.training
+
+    upstream.train()
+    with mock.patch.object(Featurizer, "_probe_metadata", side_effect=AssertionError):
+        cached = Featurizer(
+            upstream, upstream_device="cpu", metadata_key=tiny_wav2vec2_ckpt
+        )
+    # the same mode as when the metadata is probed
+    assert not upstream.training
+
+    assert cached.layer_num == featurizer.layer_num
+    assert cached.output_dim == featurizer.output_dim
+    assert cached.downsample_rate == featurizer.downsample_rate
+
+    wavs = [torch.randn(16000), torch.randn(8000)]
+    features = cached(wavs, upstream(wavs))
+    assert len(features) == 2
@@ -0,0 +1,53 @@
+import torch
+
+from s3prl.nn import S3PRLUpstream
+
+
+def _padded_wavs(wavs_len):
+    wavs = torch.zeros(len(wavs_len), max(wavs_len))
+    for idx, wav_len in enumerate(wavs_len):
+        wavs[idx, :wav_len] = torch.randn(wav_len)
+    return wavs, torch.LongTensor(wavs_len)
+
+
+def test_micro_batches(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream(
+        "wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt, max_batch_samples=40000
+    )
+    assert model._micro_batches([8000, 32000, 16000, 12000, 15000]) == [
+        [1],
+        [2, 4],
+        [3, 0],
+    ]
+
+
+def test_micro_batch_forward(tiny_wav2vec2_ckpt):
+    torch.manual_seed(0)
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    model.eval()
+
+    wavs, wavs_len = _padded_wavs([8000, 32000, 16000, 12000])
+    with torch.no_grad():
+        batch_hs, batch_lens = model(wavs, wavs_len)
+
+        # each utterance forms its own micro-batch
+        model.max_batch_samples = 1
+        micro_hs, micro_lens = model(wavs, wavs_len)
+
+        for idx, wav_len in enumerate(wavs_len):
+            single_hs, single_lens = model(
+                wavs[idx : idx + 1, :wav_len], wavs_len[idx : idx + 1]
+            )
+            for layer_id, (h, h_len) in enumerate(zip(single_hs, single_lens)):
+                valid_len = int(h_len)
+                assert torch.equal(micro_lens[layer_id][idx], h_len[0])
+                assert torch.allclose(
+                    micro_hs[layer_id][idx, :valid_len], h[0, :valid_len], atol=1e-6
+                )
+                assert (micro_hs[layer_id][idx, valid_len:] == 0).all()
+
+    for batch_h, micro_h, batch_len, micro_len in zip(
+        batch_hs, micro_hs, batch_lens, micro_lens
+    ):
+        assert batch_h.shape == micro_h.shape
+        assert torch.equal(batch_len, micro_len)
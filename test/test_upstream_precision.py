@@ -0,0 +1,43 @@
+import pytest
+import torch
+
+from s3prl.nn import S3PRLUpstream
+from s3prl.utility.allclose import deviations, upstream_precision_deviations
+
+
+def test_bf16_upstream(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream(
+        "wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt, precision="bf16"
+    )
+    model.eval()
+    assert model.upstream.precision == "bf16"
+
+    wavs = torch.randn(2, 16000)
+    wavs_len = torch.LongTensor([16000, 12000])
+    with torch.no_grad():
+        bf16_hs, bf16_lens = model(wavs, wavs_len)
+        model.set_precision("fp32")
+        fp32_hs, fp32_lens = model(wavs, wavs_len)
+
+    for bf16_h, fp32_h in zip(bf16_hs, fp32_hs):
+        assert bf16_h.dtype == torch.float32
+        assert bf16_h.shape == fp32_h.shape
+        assert not torch.equal(bf16_h, fp32_h)
+
+
+def test_precision_deviations(tiny_wav2vec2_ckpt):
+    results = upstream_precision_deviations(
+        "wav2vec2_local", "bf16", tiny_wav2vec2_ckpt, seconds=1.0
+    )
+    assert len(results) == 4
+    for max_dev, mean_dev in results:
+        assert 0 < mean_dev <= max_dev < 1.0
+
+    hs = [torch.ones(2, 3), torch.zeros(2, 3)]
+    assert deviations(hs, [h + 0.5 for h in hs]) == [(0.5, 0.5), (0.5, 0.5)]
+
+
+def test_invalid_precision(tiny_wav2vec2_ckpt):
+    model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+    with pytest.raises(AssertionError):
+        model.set_precision("int8")
@@ -0,0 +1,80 @@
+from unittest import mock
+
+import torch
+
+from s3prl.nn import S3PRLUpstream
+from s3prl.util import quantization
+from s3prl.util.quantization import layerwise_cosine_similarity
+
+
+def test_dynamic_int8_upstream(tiny_wav2vec2_ckpt, tmp_path):
+    torch.manual_seed(0)
+    wavs = torch.randn(2, 16000)
+    wavs_len = torch.LongTensor([16000, 12000])
+
+    cache_dir = tmp_path / "quantized"
+    with mock.patch.object(quantization, "_default_cache_dir", cache_dir):
+        model = S3PRLUpstream("wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt)
+        model.eval()
+        quantized = S3PRLUpstream(
+            "wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt, quantize="dynamic_int8"
+        )
+        quantized.eval()
+        assert len(list(cache_dir.glob("*.pt"))) == 1
+
+        with mock.patch.object(quantization, "_quantize_dynamic") as quantize_dynamic:
+            cached = S3PRLUpstream(
+                "wav2vec2_local",
+                path_or_url=tiny_wav2vec2_ckpt,
+                quantize="dynamic_int8",
+            )
+            cached.eval()
+            quantize_dynamic.assert_not_called()
+
+    with torch.no_grad():
+        hs, hs_len = model(wavs, wavs_len)
+        quantized_hs, quantized_len = quantized(wavs, wavs_len)
+        cached_hs, _ = cached(wavs, wavs_len)
+
+    for h_len, q_len in zip(hs_len, quantized_len):
+        assert torch.equal(h_len, q_len)
+    for quantized_h, cached_h in zip(quantized_hs, cached_hs):
+        assert torch.equal(quantized_h, cached_h)
+
+    similarities = layerwise_cosine_similarity(hs, quantized_hs, hs_len)
+    assert len(similarities) == 4
+    assert all(similarity > 0.9 for similarity in similarities)
+
+
+def test_corrupted_quantized_cache(tiny_wav2vec2_ckpt, tmp_path):
+    torch.manual_seed(0)
+    wavs = torch.randn(2, 16000)
+    wavs_len = torch.LongTensor([16000, 12000])
+
+    cache_dir = tmp_path / "quantized"
+    with mock.patch.object(quantization, "_default_cache_dir", cache_dir):
+        quantized = S3PRLUpstream(
+            "wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt, quantize="dynamic_int8"
+        )
+        quantized.eval()
+
+        # the float weights are loaded before the missing key fails the loading
+        cache_file = next(cache_dir.glob("*.pt"))
+        states = torch.load(cache_file)
+        packed_key = next(key for key in states[0] if "_packed_params" in key)
+        del states[0][packed_key]
+        for key, value in states[0].items():
+            if key.endswith("layer_norm.weight"):
+                value.zero_()
+        torch.save(states, cache_file)
+
+        fallback = S3PRLUpstream(
+            "wav2vec2_local", path_or_url=tiny_wav2vec2_ckpt, quantize="dynamic_int8"
+        )
+        fallback.eval()
+
+    with torch.no_grad():
+        quantized_hs, _ = quantized(wavs, wavs_len)
+        fallback_hs, _ = fallback(wavs, wavs_len)
+    for quantized_h, fallback_h in zip(quantized_hs, fallback_hs):
+        assert torch.equal(quantized_h, fallback_h)
@@ -0,0 +1,40 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+from s3prl.nn.upstream import weighted_sum
+
+
+def _stacked_weighted_sum(hs, weights, normalize):
+    stacked_hs = torch.stack(hs, dim=0)
+    if normalize:
+        stacked_hs = F.layer_norm(stacked_hs, (stacked_hs.shape[-1],))
+    return (weights.view(-1, 1, 1, 1) * stacked_hs).sum(dim=0)
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_weighted_sum(normalize):
+    torch.manual_seed(0)
+    hs = [torch.randn(2, 7, 5, dtype=torch.double) for _ in range(4)]
+    logits = torch.randn(4, dtype=torch.double, requires_grad=True)
+
+    weighted_hs = weighted_sum(hs, F.softmax(logits, dim=-1), normalize)
+    expected = _stacked_weighted_sum(hs, F.softmax(logits, dim=-1), normalize)
+    assert torch.allclose(weighted_hs, expected)
+
+    (grad,) = torch.autograd.grad(weighted_hs.sum(), logits)
+    (expected_grad,) = torch.autograd.grad(expected.sum(), logits)
+    assert torch.allclose(grad, expected_grad)
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_weighted_sum_gradcheck(normalize):
+    torch.manual_seed(0)
+    hs = [
+        torch.randn(2, 3, 4, dtype=torch.double, requires_grad=True) for _ in range(3)
+    ]
+    weights = torch.rand(3, dtype=torch.double, requires_grad=True)
+    assert torch.autograd.gradcheck(
+        lambda weights, *hs: weighted_sum(list(hs), weights, normalize),
+        (weights, *hs),
+    )